@@ -6,9 +6,11 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from werkzeug.middleware.proxy_fix import ProxyFix
 from sqlalchemy.orm import DeclarativeBase
+from sqlite_tuning import RoutingSession, production_mode_enabled, writer_engine_options
+from log_config import configure_logging
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging (JSON lines written by a background thread; see log_config.py)
+configure_logging()
 
 class Base(DeclarativeBase):
     pass
@@ -25,9 +27,12 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_recycle": 300,
     "pool_pre_ping": True,
 }
+if production_mode_enabled(app.config["SQLALCHEMY_DATABASE_URI"]):
+    # One serialized writer connection per process; reads use a separate pool
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"].update(writer_engine_options())
 
 # Initialize extensions
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
 db.init_app(app)
 
 # Initialize Flask-Login
@@ -38,8 +43,8 @@ login_manager.login_message = 'Please log in to access this page.'
 
 @login_manager.user_loader
 def load_user(user_id):
-    from models import User
-    return User.query.get(int(user_id))
+    from user_cache import load_user as load_cached_user
+    return load_cached_user(db.session, int(user_id))
 
 # Add template filters
 @app.template_filter('from_json')
@@ -51,8 +56,29 @@ def from_json_filter(s):
 
 # Create tables
 with app.app_context():
+    from sqlite_tuning import init_app as init_sqlite
+    init_sqlite(app, db)
     import models  # noqa: F401
-    db.create_all()
-    logging.info("Database tables created")
+    # AUTO_MIGRATE=0 leaves the schema alone (python schema_upgrades.py upgrades it explicitly)
+    if os.environ.get("AUTO_MIGRATE", "1") != "0":
+        db.create_all()
+        from schema_upgrades import upgrade_schema
+        upgrade_schema()
+        logging.info("Database tables created")
+    from user_cache import init_app as init_user_cache
+    init_user_cache(db)
+    from email_outbox import init_app as init_email_outbox
+    init_email_outbox(app)
+    from static_assets import init_app as init_static_assets
+    init_static_assets(app)
+    from compression import init_app as init_compression
+    init_compression(app)
+    from log_config import init_app as init_logging
+    init_logging(app)
+    from sqlite_tuning import database_engines
+    from metrics import init_app as init_metrics
+    init_metrics(app, database_engines(db))
+    from sql_profiler import init_app as init_sql_profiler
+    init_sql_profiler(app, database_engines(db))
     
 
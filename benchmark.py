@@ -0,0 +1,211 @@
+"""
+Micro-benchmarks for the core hot paths, repeated at several data sizes.
+
+The app runs in-process against a scratch SQLite database and working
+directory (see loadtest.setup_in_process). For each size the database is
+grown to that many synthetic students (with quiz attempts over the real
+question bank) and a training CSV of the same size is written; then every
+benchmark is timed `--repeat` times and its median/min/p95 recorded.
+
+Results can be saved as JSON and later runs compared against them; the run
+exits with status 1 when any median regresses beyond --tolerance (and by more
+than --min-delta-ms, to ignore timer noise on very fast paths).
+
+Usage:
+    python benchmark.py --sizes 100,1000,10000 --output bench_baseline.json
+    python benchmark.py --sizes 100,1000,10000 --compare bench_baseline.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import warnings
+import numpy as np
+
+DEFAULT_SIZES = [100, 1000, 5000]
+
+def bench_prepare_features(ctx):
+    from ml_models import model_manager
+    users = ctx['users'][:20]
+    return lambda: model_manager.prepare_features(users)
+
+def bench_predict_score(ctx):
+    from ml_models import model_manager
+    # Time the trained models, never the fallback estimates, whatever ran before
+    model_manager.train_from_csv(ctx['csv_path'])
+    assert model_manager.models_ready, 'predict_score needs trained models'
+    users = iter(ctx['cycle'])
+    return lambda: model_manager.predict_score(next(users))
+
+def bench_train_from_csv(ctx):
+    from ml_models import model_manager
+    return lambda: model_manager.train_from_csv(ctx['csv_path'])
+
+def bench_generate_adaptive_quiz(ctx):
+    from quiz_generator import quiz_generator
+    users = iter(ctx['cycle'])
+    return lambda: quiz_generator.generate_adaptive_quiz(next(users), {}, ctx['subject'])
+
+def bench_evaluate_quiz(ctx):
+    from quiz_generator import quiz_generator
+    quiz_data = quiz_generator.generate_adaptive_quiz(ctx['users'][0], {}, ctx['subject'])
+    answers = [random.choice('ABCD') for _ in quiz_data['questions']]
+    users = iter(ctx['cycle'])
+    return lambda: quiz_generator.evaluate_quiz(next(users), quiz_data, answers, 120)
+
+def bench_get_quiz_statistics(ctx):
+    from quiz_generator import quiz_generator
+    users = iter(ctx['cycle'])
+    return lambda: quiz_generator.get_quiz_statistics(next(users))
+
+def bench_get_recommended_content(ctx):
+    from content_manager import get_content_manager
+    content_manager = get_content_manager()
+    predictions = {'random_forest': 65.0, 'xgboost': 70.0, 'neural_network': 68.0}
+    users = iter(ctx['cycle'])
+    return lambda: content_manager.get_recommended_content(next(users), predictions)
+
+def bench_generate_certificate(ctx):
+    from certificate_generator import CertificateGenerator
+    generator = CertificateGenerator()
+    return lambda: generator.generate_certificate('Benchmark Student', ctx['subject'], 88, '01 Jan 2025')
+
+# name -> (fixture returning the timed callable, repeat cap)
+BENCHMARKS = {
+    'prepare_features': (bench_prepare_features, None),
+    'predict_score': (bench_predict_score, None),
+    'train_from_csv': (bench_train_from_csv, 3),
+    'generate_adaptive_quiz': (bench_generate_adaptive_quiz, None),
+    'evaluate_quiz': (bench_evaluate_quiz, None),
+    'get_quiz_statistics': (bench_get_quiz_statistics, None),
+    'get_recommended_content': (bench_get_recommended_content, None),
+    'generate_certificate': (bench_generate_certificate, None),
+}
+
+class Cycle:
+    """Endless round-robin over a list, so repeated calls spread across users"""
+
+    def __init__(self, items):
+        self.items = items
+
+    def __iter__(self):
+        while True:
+            yield from self.items
+
+def grow_database(target_students, question_ids, seed):
+    """Add synthetic students until the database holds target_students of them"""
+    from sqlalchemy import func
+    from app import db
+    from models import User
+    from generate_student_data import write_database
+    existing = db.session.query(func.count(User.id)).filter(User.username.like('sim_%')).scalar()
+    if target_students > existing:
+        write_database(target_students - existing, seed=seed + existing, question_ids=question_ids)
+
+def make_context(size, workdir, seed):
+    from app import db
+    from models import QuizQuestion, User
+    from generate_student_data import write_csv
+    question_ids = [question_id for (question_id,) in db.session.query(QuizQuestion.id)]
+    grow_database(size, question_ids, seed)
+    csv_path = os.path.join(workdir, f'bench_students_{size}.csv')
+    if not os.path.exists(csv_path):
+        write_csv(csv_path, size, seed=seed)
+    rng = random.Random(seed)
+    user_ids = [user_id for (user_id,) in db.session.query(User.id).filter(User.username.like('sim_%'))]
+    users = User.query.filter(User.id.in_(rng.sample(user_ids, min(50, len(user_ids))))).all()
+    subject = db.session.query(QuizQuestion.subject).first()[0]
+    return {'users': users, 'cycle': Cycle(users), 'csv_path': csv_path, 'subject': subject}
+
+def time_benchmark(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings = np.array(timings)
+    return {
+        'repeat': repeat,
+        'median_ms': float(np.median(timings)),
+        'min_ms': float(timings.min()),
+        'p95_ms': float(np.percentile(timings, 95)),
+    }
+
+def run_benchmarks(sizes, repeat=20, names=None, seed=42, workdir=None):
+    from app import app, db
+    results = {}
+    with app.app_context():
+        for size in sorted(sizes):
+            ctx = make_context(size, workdir or os.getcwd(), seed)
+            results[str(size)] = {}
+            for name, (fixture, repeat_cap) in BENCHMARKS.items():
+                if names and name not in names:
+                    continue
+                fn = fixture(ctx)
+                stats = time_benchmark(fn, min(repeat, repeat_cap or repeat))
+                db.session.rollback()
+                results[str(size)][name] = stats
+                print(f"  size={size:<8} {name:<26} median {stats['median_ms']:9.2f} ms   "
+                      f"p95 {stats['p95_ms']:9.2f} ms")
+    return results
+
+def compare_results(baseline, results, tolerance=0.25, min_delta_ms=1.0):
+    """Benchmarks whose median got slower than the baseline by more than the threshold"""
+    regressions = []
+    for size, benchmarks in results.items():
+        for name, stats in benchmarks.items():
+            before = baseline.get('results', {}).get(size, {}).get(name)
+            if not before:
+                continue
+            delta = stats['median_ms'] - before['median_ms']
+            if delta > min_delta_ms and stats['median_ms'] > before['median_ms'] * (1 + tolerance):
+                regressions.append(f"size={size} {name}: {before['median_ms']:.2f} -> "
+                                   f"{stats['median_ms']:.2f} ms (+{delta / before['median_ms']:.0%})")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark core hot paths across data sizes')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='comma-separated numbers of students (default %(default)s)')
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per benchmark')
+    parser.add_argument('--only', help='comma-separated benchmark names to run')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workdir', help='scratch working directory (default: temp dir)')
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown (default 0.25)')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='ignore slowdowns smaller than this')
+    args = parser.parse_args()
+    args.output = args.output and os.path.abspath(args.output)
+    args.compare = args.compare and os.path.abspath(args.compare)
+
+    # sklearn warns on every predict about feature names; it only drowns the output here
+    warnings.filterwarnings('ignore', category=UserWarning)
+    from loadtest import setup_in_process
+    setup_in_process(workdir=args.workdir)
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    names = set(args.only.split(',')) if args.only else None
+    unknown = (names or set()) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = run_benchmarks(sizes, args.repeat, names, args.seed)
+    report = {'sizes': sizes, 'repeat': args.repeat, 'seed': args.seed, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(json.load(f), results, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print('Regressions against', args.compare)
+            for line in regressions:
+                print('  ' + line)
+            sys.exit(1)
+        print(f'No regressions against {args.compare}')
@@ -0,0 +1,171 @@
+"""
+Bulk certificate issuance for cohort graduations.
+
+Reads (username, subject, score) rows, allocates all series IDs and inserts the
+certificate records in one transaction, renders the PDFs across a process pool
+and streams them into a ZIP archive as they finish.
+
+Usage:
+    python bulk_certificates.py cohort.csv --output cohort_certificates.zip --workers 4
+"""
+
+import argparse
+import csv
+import os
+import re
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from app import app, db
+from models import Certificate
+from certificate_generator import CertificateGenerator, certificate_template, series_id_allocator
+from certificate_verifier import get_certificate_verifier
+
+MIN_CERTIFICATE_SCORE = 70
+INSERT_ATTEMPTS = 3
+
+def _warm_worker():
+    # Decode the background frame once per worker process, not once per certificate
+    certificate_template.new_document()
+
+def _render_job(job):
+    """Render one certificate in a worker process; returns (series_id, filename, pdf_bytes, seconds)"""
+    started = time.perf_counter()
+    pdf = CertificateGenerator().render_certificate(
+        job['series_id'], job['user_name'], job['subject'],
+        job['issue_date'], job['expiry_date'], job['score']
+    )
+    pdf_bytes = pdf.output(dest='S').encode('latin1')
+    safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', f"{job['user_name']}_{job['subject']}")
+    filename = f"certificate_{job['series_id']}_{safe_name}.pdf"
+    return job['series_id'], filename, pdf_bytes, time.perf_counter() - started
+
+def _taken_series_ids(series_ids, chunk_size=500):
+    """The subset of series_ids already present in the certificate table"""
+    taken = set()
+    for start in range(0, len(series_ids), chunk_size):
+        chunk = series_ids[start:start + chunk_size]
+        taken.update(db.session.execute(
+            select(Certificate.series_id).where(Certificate.series_id.in_(chunk))).scalars())
+    return taken
+
+def insert_jobs(jobs, attempts=INSERT_ATTEMPTS):
+    """Insert the certificate records of all jobs in one transaction.
+
+    Allocated IDs can only collide with legacy randomly generated ones; the jobs
+    holding such an ID get a fresh one and the insert is retried.
+    """
+    for attempt in range(attempts):
+        try:
+            db.session.execute(insert(Certificate.__table__), jobs)
+            db.session.commit()
+            return
+        except IntegrityError:
+            db.session.rollback()
+            if attempt == attempts - 1:
+                raise
+            taken = _taken_series_ids([job['series_id'] for job in jobs])
+            conflicting = [job for job in jobs if job['series_id'] in taken]
+            if not conflicting:
+                raise
+            for job, series_id in zip(conflicting, series_id_allocator.allocate(len(conflicting))):
+                job['series_id'] = series_id
+
+def read_rows(csv_path):
+    """Yield (user_name, subject, score) from a CSV with username/subject/score columns"""
+    with open(csv_path, newline='', encoding='utf-8') as csvfile:
+        for row in csv.DictReader(csvfile):
+            user_name = (row.get('username') or row.get('user_name') or '').strip()
+            yield user_name, (row.get('subject') or '').strip(), row.get('score')
+
+def issue_certificates(rows, output, workers=None, window_per_worker=4):
+    """Issue and render certificates for all eligible rows into a ZIP written to `output`.
+
+    `output` is a path or a writable binary file object (it need not be seekable).
+    Only a bounded window of rendered PDFs is held in memory at any time.
+    Returns a report with counts, per-stage timings and certificates/sec.
+    """
+    timings = {}
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+
+    # Stage 1: validate
+    eligible, skipped = [], []
+    for user_name, subject, score in rows:
+        try:
+            score = int(float(score))
+        except (TypeError, ValueError):
+            skipped.append((user_name, subject, score))
+            continue
+        if not user_name or not subject or score < MIN_CERTIFICATE_SCORE:
+            skipped.append((user_name, subject, score))
+            continue
+        eligible.append((user_name, subject, score))
+    timings['validate'] = time.perf_counter() - started
+
+    # Stage 2: allocate series IDs and insert every record in one transaction
+    stage = time.perf_counter()
+    issue_date, expiry_date = CertificateGenerator().get_validity_dates()
+    series_ids = series_id_allocator.allocate(len(eligible)) if eligible else []
+    jobs = [
+        {'series_id': series_id, 'user_name': user_name, 'subject': subject,
+         'issue_date': issue_date, 'expiry_date': expiry_date, 'score': score}
+        for series_id, (user_name, subject, score) in zip(series_ids, eligible)
+    ]
+    if jobs:
+        insert_jobs(jobs)
+        verifier = get_certificate_verifier()
+        for job in jobs:
+            verifier.add(job['series_id'])
+    timings['allocate'] = time.perf_counter() - stage
+
+    # Stage 3: render in a process pool and stream into the archive as results arrive
+    stage = time.perf_counter()
+    render_seconds = 0.0
+    bytes_written = 0
+    _warm_worker()  # forked workers inherit the decoded frame from the parent
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as archive, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_warm_worker) as pool:
+        pending = deque()
+        job_iter = iter(jobs)
+        for job in job_iter:
+            pending.append(pool.submit(_render_job, job))
+            if len(pending) >= workers * window_per_worker:
+                break
+        while pending:
+            series_id, filename, pdf_bytes, seconds = pending.popleft().result()
+            archive.writestr(filename, pdf_bytes)  # PDFs are already deflated
+            render_seconds += seconds
+            bytes_written += len(pdf_bytes)
+            next_job = next(job_iter, None)
+            if next_job is not None:
+                pending.append(pool.submit(_render_job, next_job))
+    timings['render_and_write'] = time.perf_counter() - stage
+    timings['render_cpu'] = render_seconds
+    timings['total'] = time.perf_counter() - started
+
+    return {
+        'issued': len(jobs),
+        'skipped': len(skipped),
+        'workers': workers,
+        'pdf_bytes': bytes_written,
+        'certificates_per_sec': len(jobs) / timings['total'] if timings['total'] else 0.0,
+        'timings': timings
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Issue certificates for a cohort into a ZIP archive")
+    parser.add_argument('csv_path', help="CSV with username, subject and score columns")
+    parser.add_argument('--output', default='certificates.zip')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    with app.app_context():
+        report = issue_certificates(read_rows(args.csv_path), args.output, workers=args.workers)
+    print(f"✅ Issued {report['issued']} certificates ({report['skipped']} skipped) to {args.output}")
+    print(f"   {report['certificates_per_sec']:.1f} certificates/sec with {report['workers']} workers")
+    for stage, seconds in report['timings'].items():
+        print(f"   {stage}: {seconds:.3f}s")
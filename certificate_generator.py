@@ -2,9 +2,185 @@ from fpdf import FPDF
 from datetime import datetime
 import os
 import uuid
-import random
+import secrets
 import csv
-import sqlite3
+import hashlib
+import hmac
+import logging
+import threading
+from collections import OrderedDict
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import Certificate
+from version_stamps import get_or_create_setting, reserve_sequence
+from metrics import metrics
+
+PAGE_WIDTH = 297
+PAGE_HEIGHT = 210
+
+class CertificateTemplate:
+    """Certificate page with the background frame decoded once per process.
+
+    FPDF parses (and recompresses) a PNG every time image() sees a new file, which
+    dominates certificate rendering. The parsed image is kept here and handed to
+    each new document, so per-certificate work is only the text overlay.
+    """
+
+    def __init__(self, frame_path=os.path.join('static', 'images', 'cc2222.png')):
+        self.frame_path = frame_path
+        self._frame_info = None
+        self._lock = threading.Lock()
+
+    def _get_frame_info(self):
+        if self._frame_info is None:
+            with self._lock:
+                if self._frame_info is None:
+                    if not os.path.exists(self.frame_path):
+                        logging.warning(f"Certificate template not found at {self.frame_path}")
+                        return None
+                    self._frame_info = FPDF()._parsepng(self.frame_path)
+        return self._frame_info
+
+    def new_document(self):
+        """Return a one-page PDF with the frame and all static text already laid out"""
+        pdf = FPDF('L', 'mm', 'A4')
+        pdf.add_page()
+        pdf.set_auto_page_break(auto=True, margin=15)
+
+        # Draw white background
+        pdf.set_fill_color(255, 255, 255)
+        pdf.rect(0, 0, PAGE_WIDTH, PAGE_HEIGHT, 'F')
+
+        frame_info = self._get_frame_info()
+        if frame_info is not None:
+            # FPDF deletes the image data after writing it, so each document gets its own dict
+            pdf.images[self.frame_path] = dict(frame_info, i=1)
+            pdf.image(self.frame_path, x=0, y=0, w=PAGE_WIDTH, h=PAGE_HEIGHT)
+
+        safe_margin_x = 35
+        safe_margin_top = 40
+        content_width = PAGE_WIDTH - 2 * safe_margin_x
+
+        # Certificate title
+        pdf.set_font('Arial', 'B', 16)
+        pdf.set_text_color(0, 0, 0)
+        pdf.set_xy(safe_margin_x, safe_margin_top + 35)
+        pdf.cell(content_width, 10, "OF ACHIEVEMENT", ln=True, align='C')
+
+        # Achievement text
+        pdf.set_font('Arial', '', 14)
+        pdf.set_text_color(0, 0, 0)
+        pdf.set_xy(safe_margin_x, safe_margin_top + 75)
+        pdf.cell(content_width, 8, "Has Successfully Completed All The Requirements To Be Recognized As a", ln=True, align='C')
+        return pdf
+
+class CertificateByteCache:
+    """Small LRU of rendered certificate PDFs keyed by series ID"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, series_id):
+        with self._lock:
+            pdf_bytes = self._entries.get(series_id)
+            if pdf_bytes is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(series_id)
+            self.hits += 1
+            return pdf_bytes
+
+    def put(self, series_id, pdf_bytes):
+        with self._lock:
+            self._entries[series_id] = pdf_bytes
+            self._entries.move_to_end(series_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class CertificateNotSaved(Exception):
+    """No series ID could be stored for a new certificate"""
+
+class SeriesIdAllocator:
+    """Collision-free 10-digit series IDs without probing the database.
+
+    A shared counter (reserved in blocks) is passed through a keyed Feistel
+    permutation of [0, 9 * 10**9), so consecutive certificates get unrelated-looking
+    IDs that can never repeat for the same key.
+
+    The key is random, stored in the database (app_setting 'certificate_id_key')
+    the first time it is needed and never changes afterwards, so issued numbers
+    do not depend on any configured secret.
+    """
+
+    DOMAIN = 9 * 10**9
+    HALF_BITS = 17  # 2**34 covers DOMAIN; values outside it are cycle-walked
+    ROUNDS = 4
+
+    def __init__(self, key=None, block_size=50, sequence_name='certificate_sequence'):
+        self.key = key.encode('utf-8') if isinstance(key, str) else key  # None: the stored key
+        self.block_size = block_size
+        self.sequence_name = sequence_name
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def _load_key(self):
+        if self.key is not None:
+            return self.key
+        key = get_or_create_setting('certificate_id_key', lambda: secrets.token_hex(32))
+        if db.session.info.get('uses_writer'):
+            # Stored inside the session's transaction, which may still roll back
+            return key.encode('utf-8')
+        self.key = key.encode('utf-8')
+        return self.key
+
+    def _round(self, round_index, value, key):
+        digest = hmac.new(key, f'{round_index}:{value}'.encode('ascii'), hashlib.sha256).digest()
+        return int.from_bytes(digest[:4], 'big') & ((1 << self.HALF_BITS) - 1)
+
+    def permute(self, number, key=None):
+        key = key or self._load_key()
+        mask = (1 << self.HALF_BITS) - 1
+        value = number
+        while True:
+            left, right = value >> self.HALF_BITS, value & mask
+            for round_index in range(self.ROUNDS):
+                left, right = right, left ^ self._round(round_index, right, key)
+            value = (left << self.HALF_BITS) | right
+            if value < self.DOMAIN:
+                return value
+
+    def allocate(self, count=1):
+        """Return `count` fresh series IDs, reserving counter blocks as needed"""
+        key = self._load_key()
+        if db.session.info.get('uses_writer'):
+            # The reservation joins the session's open transaction and would be undone
+            # by its rollback, so nothing from it may be cached for other callers
+            first = reserve_sequence(self.sequence_name, count)
+            return [str(10**9 + self.permute(n, key)) for n in range(first, first + count)]
+        ids = []
+        with self._lock:
+            while len(ids) < count:
+                if self._next >= self._end:
+                    size = max(self.block_size, count - len(ids))
+                    self._next = reserve_sequence(self.sequence_name, size)
+                    self._end = self._next + size
+                take = min(count - len(ids), self._end - self._next)
+                ids.extend(str(10**9 + self.permute(n, key)) for n in range(self._next, self._next + take))
+                self._next += take
+        return ids
+
+certificate_template = CertificateTemplate()
+series_id_allocator = SeriesIdAllocator()
+certificate_cache = CertificateByteCache()
+metrics.register_collector(lambda: [
+    ('cache_requests_total', {'cache': 'certificate_pdf', 'result': 'hit'}, certificate_cache.hits),
+    ('cache_requests_total', {'cache': 'certificate_pdf', 'result': 'miss'}, certificate_cache.misses),
+])
 
 class CertificateGenerator:
     def __init__(self):
@@ -15,79 +191,54 @@ class CertificateGenerator:
         self.issuer_name = "MOHAMMAD SOAEB RATHOD"
         self.issuer_title = "FOUNDER"
         self.cert_csv = 'certificates.csv'
-        self.db_path = 'instance/adaptive_learning.db'
+        self.last_series_id = None
 
     def generate_unique_series_id(self):
         """Generate a unique 10-digit series ID"""
-        while True:
-            series_id = str(random.randint(10**9, 10**10 - 1))
-            if not self.series_id_exists(series_id):
-                return series_id
+        return series_id_allocator.allocate(1)[0]
 
     def series_id_exists(self, series_id):
         """Check if series ID already exists in database"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM certificates WHERE series_id = ?", (series_id,))
-            count = cursor.fetchone()[0]
-            conn.close()
-            return count > 0
-        except:
-            return False
+        return db.session.query(
+            Certificate.query.filter_by(series_id=series_id).exists()
+        ).scalar()
 
     def save_certificate_to_db(self, series_id, user_name, subject, issue_date, expiry_date, score):
         """Save certificate details to database"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-         
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS certificates (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    series_id TEXT UNIQUE NOT NULL,
-                    user_name TEXT NOT NULL,
-                    subject TEXT NOT NULL,
-                    issue_date TEXT NOT NULL,
-                    expiry_date TEXT NOT NULL,
-                    score INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-         
-            cursor.execute('''
-                INSERT INTO certificates (series_id, user_name, subject, issue_date, expiry_date, score)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (series_id, user_name, subject, issue_date, expiry_date, score))
-            
-            conn.commit()
-            conn.close()
+            db.session.add(Certificate(
+                series_id=series_id,
+                user_name=user_name,
+                subject=subject,
+                issue_date=issue_date,
+                expiry_date=expiry_date,
+                score=score
+            ))
+            db.session.commit()
+            from certificate_verifier import get_certificate_verifier
+            get_certificate_verifier().add(series_id)
             return True
+        except IntegrityError:
+            # Only possible against legacy randomly generated IDs
+            db.session.rollback()
+            return False
         except Exception as e:
-            print(f"Error saving certificate: {e}")
+            db.session.rollback()
+            logging.error(f"Error saving certificate: {e}")
             return False
 
     def verify_certificate(self, series_id):
         """Verify certificate by series ID"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT series_id, user_name, subject, issue_date, expiry_date, score
-                FROM certificates WHERE series_id = ?
-            ''', (series_id,))
-            result = cursor.fetchone()
-            conn.close()
-            
-            if result:
+            cert = Certificate.query.filter_by(series_id=series_id).first()
+            if cert:
                 return {
-                    'series_id': result[0],
-                    'user_name': result[1],
-                    'subject': result[2],
-                    'issue_date': result[3],
-                    'expiry_date': result[4],
-                    'score': result[5],
+                    'series_id': cert.series_id,
+                    'user_name': cert.user_name,
+                    'subject': cert.subject,
+                    'issue_date': cert.issue_date,
+                    'expiry_date': cert.expiry_date,
+                    'score': cert.score,
                     'valid': True
                 }
             else:
@@ -95,76 +246,73 @@ class CertificateGenerator:
         except Exception as e:
             return {'valid': False, 'message': f'Error: {e}'}
 
+    def get_validity_dates(self):
+        """Issue and expiry dates (two years) for a certificate issued now"""
+        now = datetime.now()
+        return now.strftime('%d %b %Y'), now.replace(year=now.year + 2).strftime('%d %b %Y')
+
     def generate_certificate(self, user_name, subject, score, date=None, output_path=None):
         if date is None:
             date = datetime.now().strftime('%d %b %Y')
-        issue_date = datetime.now().strftime('%d %b %Y')
-        expiry_date = (datetime.now().replace(year=datetime.now().year + 2)).strftime('%d %b %Y')
+        issue_date, expiry_date = self.get_validity_dates()
         
-        # Generate unique series ID
-        series_id = self.generate_unique_series_id()
-
-        # Create PDF
-        pdf = FPDF('L', 'mm', 'A4')
-        pdf.add_page()
-        pdf.set_auto_page_break(auto=True, margin=15)
-
-        page_width = 297
-        page_height = 210
-
-        # Draw white background
-        pdf.set_fill_color(255, 255, 255)
-        pdf.rect(0, 0, page_width, page_height, 'F')
-
-        # Add certificate template image
-        certificate_frame_path = os.path.join('static', 'images', 'cc2222.png')
-        if os.path.exists(certificate_frame_path):
-            pdf.image(certificate_frame_path, x=0, y=0, w=page_width, h=page_height)
+        # Issue under a fresh series ID (retry only guards against legacy random IDs)
+        for _ in range(3):
+            series_id = self.generate_unique_series_id()
+            if self.save_certificate_to_db(series_id, user_name, subject, issue_date, expiry_date, score):
+                break
         else:
-            print(f"Warning: Certificate template not found at {certificate_frame_path}")
-
-        # Add certificate details
-        self.add_certificate_details(pdf, series_id, user_name, subject, issue_date, expiry_date, score)
+            # Never hand out (or cache) a certificate whose ID cannot be verified
+            raise CertificateNotSaved(f"Could not store a certificate for {user_name} ({subject})")
 
-        # Save to database
-        self.save_certificate_to_db(series_id, user_name, subject, issue_date, expiry_date, score)
+        pdf = self.render_certificate(series_id, user_name, subject, issue_date, expiry_date, score)
 
         # Output
         if output_path:
             pdf.output(output_path)
             return output_path
         else:
-            return pdf.output(dest='S').encode('latin1')
+            pdf_bytes = pdf.output(dest='S').encode('latin1')
+            certificate_cache.put(series_id, pdf_bytes)
+            self.last_series_id = series_id
+            return pdf_bytes
+
+    def render_certificate(self, series_id, user_name, subject, issue_date, expiry_date, score):
+        """Overlay the certificate fields on the cached template page"""
+        pdf = certificate_template.new_document()
+        self.add_certificate_details(pdf, series_id, user_name, subject, issue_date, expiry_date, score)
+        return pdf
+
+    def get_certificate_pdf(self, series_id):
+        """Bytes of an already issued certificate, rendered at most once per process"""
+        pdf_bytes = certificate_cache.get(series_id)
+        if pdf_bytes is not None:
+            return pdf_bytes
+        cert = self.verify_certificate(series_id)
+        if not cert.get('valid'):
+            return None
+        pdf = self.render_certificate(cert['series_id'], cert['user_name'], cert['subject'],
+                                      cert['issue_date'], cert['expiry_date'], cert['score'])
+        pdf_bytes = pdf.output(dest='S').encode('latin1')
+        certificate_cache.put(series_id, pdf_bytes)
+        return pdf_bytes
 
     def add_certificate_details(self, pdf, series_id, user_name, subject, issue_date, expiry_date, score):
-        """Add certificate details to the PDF"""
-        page_width = 297
-        page_height = 210
+        """Add the per-certificate fields to a template page"""
+        page_width = PAGE_WIDTH
+        page_height = PAGE_HEIGHT
         
         # Safe margins for text placement
         safe_margin_x = 35
         safe_margin_top = 40
-        safe_margin_bottom = 40
         content_width = page_width - 2 * safe_margin_x
 
-        # Certificate title
-        pdf.set_font('Arial', 'B', 16)
-        pdf.set_text_color(0, 0, 0)
-        pdf.set_xy(safe_margin_x, safe_margin_top + 35)
-        pdf.cell(content_width, 10, "OF ACHIEVEMENT", ln=True, align='C')
-
         # Recipient name
         pdf.set_font('Times', 'B', 30)
         pdf.set_text_color(0, 0, 0)
         pdf.set_xy(safe_margin_x, safe_margin_top + 55)
         pdf.cell(content_width, 20, user_name.upper(), ln=True, align='C')
 
-        # Achievement text
-        pdf.set_font('Arial', '', 14)
-        pdf.set_text_color(0, 0, 0)
-        pdf.set_xy(safe_margin_x, safe_margin_top + 75)
-        pdf.cell(content_width, 8, "Has Successfully Completed All The Requirements To Be Recognized As a", ln=True, align='C')
-
         # Subject/Certification area
         pdf.set_font('Times', 'B', 20)
         pdf.set_text_color(0, 0, 0)
@@ -186,4 +334,3 @@ class CertificateGenerator:
         pdf.cell(100, 4, f'Expiration Date: {expiry_date}', ln=1, align='L')
         pdf.set_x(details_x)
         pdf.cell(100, 4, f'Certified As: {user_name}', ln=1, align='L')
-        
\ No newline at end of file
@@ -0,0 +1,152 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from models import Certificate
+from app import db
+from certificate_generator import CertificateGenerator
+from metrics import metrics
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (no false negatives)"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class CertificateVerifier:
+    """Verification front for the public /vb endpoint.
+
+    Recent positive lookups are answered from an LRU, and IDs the Bloom filter
+    has never seen are rejected without looking them up. The filter is rebuilt
+    from the certificates table and then kept current by in-process issuance plus
+    an incremental sync (new rows by id) every `sync_interval` seconds. A miss
+    runs that sync first if it did not just happen, so a certificate issued by
+    another worker is never rejected.
+    """
+
+    def __init__(self, lru_size=1024, sync_interval=5.0, error_rate=0.001):
+        self.lru_size = lru_size
+        self.sync_interval = sync_interval
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._recent = OrderedDict()
+        self._bloom = None
+        self._high_water_id = 0
+        self._last_sync = 0.0
+        self.stats = {'lru_hits': 0, 'bloom_rejections': 0, 'db_hits': 0, 'false_positives': 0}
+
+    def rebuild(self):
+        """Load every issued series ID into a fresh filter sized with headroom"""
+        total = db.session.query(db.func.count(Certificate.id)).scalar() or 0
+        bloom = BloomFilter(max(1024, total * 2), self.error_rate)
+        high_water_id = 0
+        query = db.session.query(Certificate.id, Certificate.series_id).order_by(Certificate.id)
+        for cert_id, series_id in query.yield_per(10000):
+            bloom.add(series_id)
+            high_water_id = cert_id
+        with self._lock:
+            self._bloom = bloom
+            self._high_water_id = high_water_id
+            self._last_sync = time.monotonic()
+
+    def sync(self):
+        """Add certificates inserted since the last sync (e.g. by other workers)"""
+        rows = db.session.query(Certificate.id, Certificate.series_id).filter(
+            Certificate.id > self._high_water_id
+        ).order_by(Certificate.id).all()
+        with self._lock:
+            for cert_id, series_id in rows:
+                self._bloom.add(series_id)
+                self._high_water_id = max(self._high_water_id, cert_id)
+            self._last_sync = time.monotonic()
+            needs_rebuild = self._bloom.count > self._bloom.capacity
+        if needs_rebuild:
+            self.rebuild()
+
+    def add(self, series_id):
+        """Record a newly issued series ID in this process immediately"""
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(series_id)
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def verify(self, series_id):
+        synced = True
+        if self._bloom is None:
+            self.rebuild()
+        elif time.monotonic() - self._last_sync > self.sync_interval:
+            self.sync()
+        else:
+            synced = False
+
+        with self._lock:
+            cached = self._recent.get(series_id)
+            if cached is not None:
+                self._recent.move_to_end(series_id)
+                self.stats['lru_hits'] += 1
+                return cached
+            known = series_id in self._bloom
+        if not known and not synced:
+            # Possibly issued by another worker since the last sync
+            self.sync()
+            known = series_id in self._bloom
+        if not known:
+            self._count('bloom_rejections')
+            return {'valid': False, 'message': 'Certificate not found'}
+
+        result = CertificateGenerator().verify_certificate(series_id)
+        if result.get('valid'):
+            self._count('db_hits')
+            with self._lock:
+                self._recent[series_id] = result
+                while len(self._recent) > self.lru_size:
+                    self._recent.popitem(last=False)
+        elif result.get('message') == 'Certificate not found':
+            self._count('false_positives')
+        return result
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['filter_entries'] = self._bloom.count if self._bloom else 0
+        return stats
+
+certificate_verifier = None
+def get_certificate_verifier():
+    global certificate_verifier
+    if certificate_verifier is None:
+        certificate_verifier = CertificateVerifier()
+    return certificate_verifier
+
+def _verifier_metrics():
+    if certificate_verifier is None:
+        return []
+    stats = certificate_verifier.get_stats()
+    return [('cache_requests_total', {'cache': 'certificate_verify', 'result': result}, stats[stat])
+            for result, stat in [('hit', 'lru_hits'), ('miss', 'db_hits'),
+                                 ('bloom_rejected', 'bloom_rejections'), ('false_positive', 'false_positives')]]
+
+metrics.register_collector(_verifier_metrics)
@@ -0,0 +1,241 @@
+"""
+Response compression and streamed template rendering.
+
+init_app() compresses dynamic responses in an after_request hook. A response
+qualifies when its mimetype is in COMPRESS_MIMETYPES, it is at least
+COMPRESS_MIN_SIZE bytes (default 500), and the client accepts gzip, or br
+when the optional brotli package is installed. Responses are left alone when
+they already carry a Content-Encoding (fingerprinted static assets are
+precompressed), are file passthroughs, or ask for no-transform. Compressed
+responses get Vary: Accept-Encoding, and strong ETags get an encoding
+suffix.
+
+stream_page() renders a template as a stream, coalesced into
+STREAM_CHUNK_SIZE pieces, so the head of a large page leaves before its body
+has been rendered. Streamed responses are compressed per chunk with a sync
+flush, so each piece still reaches the client as soon as it is rendered.
+The template runs after the view has returned and after the SQL profiler
+has stopped counting. Pass it fully loaded data and no lazy relationships.
+Pending flash messages are taken from the session before streaming starts.
+A template error mid-stream truncates the page instead of returning a 500.
+
+Usage (bytes on the wire and TTFB per route over real HTTP, scratch database):
+    python compression.py --repeat 5
+"""
+
+import argparse
+import gzip
+import os
+import time
+import zlib
+from flask import current_app, get_flashed_messages, request, stream_template
+from metrics import metrics
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESS_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/xml', 'text/javascript',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+}
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 5))
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 8192))
+
+def choose_encoding(accept_encodings):
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def _compressor(encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.flush, compressor.finish
+    # wbits 31: gzip container
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=COMPRESS_LEVEL, mtime=0)
+
+def _coalesce(chunks, size):
+    """Join small template chunks into pieces of at least `size` bytes"""
+    buffer, buffered = [], 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            buffer.append(chunk)
+            buffered += len(chunk)
+            if buffered >= size:
+                yield b''.join(buffer)
+                buffer, buffered = [], 0
+        if buffer:
+            yield b''.join(buffer)
+    finally:
+        # Closing the stream_with_context generator releases the request context
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+def _compress_stream(chunks, encoding, endpoint):
+    process, flush, finish = _compressor(encoding)
+    raw = wire = 0
+    try:
+        for chunk in chunks:
+            raw += len(chunk)
+            data = process(chunk) + flush()
+            wire += len(data)
+            if data:
+                yield data
+        data = finish()
+        wire += len(data)
+        yield data
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        _record_bytes(endpoint, encoding, raw, wire)
+
+def _record_bytes(endpoint, encoding, raw, wire):
+    metrics.inc('http_response_bytes_total', raw, endpoint=endpoint, stage='uncompressed')
+    metrics.inc('http_response_bytes_total', wire, endpoint=endpoint, stage=encoding)
+
+def stream_page(template_name, **context):
+    """render_template() as a streamed response, in STREAM_CHUNK_SIZE pieces"""
+    # Pop the flashes now: the session cookie is saved before the template
+    # runs, and get_flashed_messages() in base.html then reads this cached copy
+    get_flashed_messages()
+    chunks = _coalesce(stream_template(template_name, **context), STREAM_CHUNK_SIZE)
+    return current_app.response_class(chunks, mimetype='text/html')
+
+def _compressible(response):
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return False
+    if response.mimetype not in COMPRESS_MIMETYPES or response.cache_control.no_transform:
+        return False
+    return response.is_streamed or (response.content_length or 0) >= COMPRESS_MIN_SIZE
+
+def init_app(app):
+    """Compress eligible responses for clients that accept gzip (or br)"""
+    @app.after_request
+    def compress_response(response):
+        if request.method == 'HEAD' or not _compressible(response):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        if response.is_streamed:
+            response.response = _compress_stream(response.response, encoding, endpoint)
+            response.headers.pop('Content-Length', None)
+        else:
+            raw = response.get_data()
+            response.set_data(compress(raw, encoding))
+            _record_bytes(endpoint, encoding, len(raw), response.content_length)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(f'{etag}-{encoding}')
+        return response
+
+class _BenchClient:
+    """One keep-alive HTTP connection that keeps the session cookie up to date"""
+
+    def __init__(self, port):
+        import http.client
+        self.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=300)
+        self.cookie = ''
+
+    def request(self, method, path, accept_encoding='identity', form=None):
+        """(response, time to first byte, total time, body bytes as sent)"""
+        from urllib.parse import urlencode
+        headers = {'Accept-Encoding': accept_encoding, 'Cookie': self.cookie}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        started = time.perf_counter()
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        first = response.read(1)
+        ttfb = time.perf_counter() - started
+        data = first + response.read()
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie:
+            self.cookie = set_cookie.split(';')[0]
+        response.body = data
+        return response, ttfb, time.perf_counter() - started, len(data)
+
+def run_benchmark(repeat=3, encodings=('identity', 'gzip', 'br')):
+    """Serve the app over HTTP on a scratch database and measure each route per Accept-Encoding"""
+    import re
+    import threading
+    from urllib.parse import urlencode
+    from werkzeug.serving import make_server
+    from loadtest import setup_in_process
+
+    app, _ = setup_in_process()
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = _BenchClient(server.server_port)
+
+    name = f'bench_{int(time.time())}'
+    client.request('POST', '/register', form={
+        'username': name, 'email': f'{name}@example.com', 'password': 'bench123', 'phone': '0000000000',
+        'college': 'Bench', 'age': '21', 'learning_style': 'visual', 'skill_level': 'beginner'})
+    client.request('POST', '/login', form={'username': name, 'password': 'bench123'})
+    page = client.request('GET', '/start_quiz')[0].body.decode('utf-8', 'replace')
+    subject = re.findall(r'<option value="([^"]+)">', page)[0]
+
+    routes = ['/start_quiz', '/dashboard', '/dashboard/panel/recommendations', '/dashboard/panel/stats',
+              '/content?limit=100', '/api/quiz_stats', '/api/model_predictions', '/submit_quiz']
+    encodings = [e for e in encodings if e != 'br' or brotli is not None]
+    rows = []
+    for route in routes:
+        for encoding in encodings:
+            samples = []
+            for _ in range(repeat):
+                if route == '/submit_quiz':
+                    # Each submission needs its own quiz; only the POST (the results page) is measured
+                    client.request('GET', '/quiz?' + urlencode({'subject': subject}))
+                    answers = {f'question_{i}': 'A' for i in range(15)}
+                    samples.append(client.request('POST', route, encoding, form=answers))
+                else:
+                    samples.append(client.request('GET', route, encoding))
+            response, _, _, size = samples[-1]
+            rows.append({
+                'route': route, 'accept_encoding': encoding, 'status': response.status,
+                'content_encoding': response.getheader('Content-Encoding', '-'),
+                'streamed': response.getheader('Transfer-Encoding') == 'chunked',
+                'bytes': size,
+                'ttfb_ms': sorted(s[1] for s in samples)[len(samples) // 2] * 1000,
+                'total_ms': sorted(s[2] for s in samples)[len(samples) // 2] * 1000,
+            })
+    server.shutdown()
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure bytes on the wire and TTFB per route')
+    parser.add_argument('--repeat', type=int, default=3, help='requests per route and encoding (median is reported)')
+    parser.add_argument('--output', help='also write the rows as JSON here')
+    args = parser.parse_args()
+
+    rows = run_benchmark(repeat=args.repeat)
+    print(f"\n{'route':<36} {'accept':<9} {'status':>6} {'encoding':<9} {'stream':<6} "
+          f"{'bytes':>9} {'ttfb ms':>9} {'total ms':>9}")
+    for row in rows:
+        print(f"{row['route']:<36} {row['accept_encoding']:<9} {row['status']:>6} {row['content_encoding']:<9} "
+              f"{'yes' if row['streamed'] else 'no':<6} {row['bytes']:>9} {row['ttfb_ms']:>9.1f} {row['total_ms']:>9.1f}")
+    if args.output:
+        import json
+        with open(args.output, 'w') as f:
+            json.dump(rows, f, indent=2)
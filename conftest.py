@@ -0,0 +1,57 @@
+"""
+Shared test setup: the scratch database and the app, user and client fixtures.
+
+DATABASE_URL defaults to a SQLite file in a temporary directory. It is set
+here, before any test module imports the app. If the app still ends up on
+another database (it was imported first), every test is skipped rather than
+run against it. Tests never send email or train models on their own.
+"""
+
+import os
+import tempfile
+import uuid
+import pytest
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'tests.db'))
+os.environ['EMAIL_OUTBOX_WORKER'] = '0'  # the outbox tests drive the sender themselves
+os.environ.setdefault('MODEL_BACKGROUND_TRAINING', '0')  # importing main would start training
+
+import main  # noqa: E402,F401  (registers the routes)
+from app import app as flask_app, db  # noqa: E402
+from models import User  # noqa: E402
+
+PASSWORD = 'secret1'
+
+def pytest_collection_modifyitems(config, items):
+    if flask_app.config['SQLALCHEMY_DATABASE_URI'] != os.environ['DATABASE_URL']:
+        skip = pytest.mark.skip(reason='needs a scratch DATABASE_URL')
+        for item in items:
+            item.add_marker(skip)
+
+@pytest.fixture(scope='session')
+def app():
+    return flask_app
+
+@pytest.fixture
+def user(app):
+    """A new user with password PASSWORD, used inside an app context; their rows are removed afterwards"""
+    with app.app_context():
+        name = f'user_{uuid.uuid4().hex[:12]}'
+        user = User(username=name, email=f'{name}@example.com')
+        user.set_password(PASSWORD)
+        db.session.add(user)
+        db.session.commit()
+        yield user
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            if 'user_id' in table.c:
+                db.session.execute(table.delete().where(table.c.user_id == user.id))
+        db.session.execute(User.__table__.delete().where(User.__table__.c.id == user.id))
+        db.session.commit()
+
+@pytest.fixture
+def client(app, user):
+    """A test client logged in as `user`"""
+    test_client = app.test_client()
+    test_client.post('/login', data={'username': user.username, 'password': PASSWORD})
+    return test_client
@@ -1,30 +1,79 @@
 import json
+import threading
+from bisect import bisect_right
+from collections import namedtuple
 from models import Content, QuizQuestion
 from app import db
+from version_stamps import CONTENT_CATALOG, get_version
+from metrics import metrics
+
+# Immutable snapshot of a Content row, safe to share across requests
+CatalogItem = namedtuple('CatalogItem', [
+    'id', 'title', 'description', 'content_type', 'difficulty_level',
+    'subject', 'tags', 'content_url', 'created_at'
+])
 
 class ContentManager:
     def __init__(self):
-        pass
+        self._lock = threading.Lock()
+        self._catalog_version = None
+        self._catalog = []
+        self._catalog_by_id = {}
+        self._catalog_ids = []
+        self.hits = 0
+        self.reloads = 0
     # Remove initialize_content logic that seeds sample questions
-    def get_recommended_content(self, user, predictions):
-        ensemble_score = sum(predictions.values()) / len(predictions) if predictions else 50.0
-        if ensemble_score < 40:
-            target_difficulty = 'beginner'
-        elif ensemble_score < 70:
-            target_difficulty = 'intermediate'
-        else:
-            target_difficulty = 'advanced'
-        recommended_content = Content.query.filter_by(
-            difficulty_level=target_difficulty
-        ).all()
-        return recommended_content
+    def get_catalog(self):
+        """Return the cached content catalog, reloading it when the version stamp moved"""
+        version = get_version(CONTENT_CATALOG)
+        if version != self._catalog_version:
+            with self._lock:
+                if version != self._catalog_version:
+                    self.reloads += 1
+                    rows = Content.query.order_by(Content.id).all()
+                    catalog = [CatalogItem(*(getattr(row, field) for field in CatalogItem._fields))
+                               for row in rows]
+                    self._catalog = catalog
+                    self._catalog_by_id = {item.id: item for item in catalog}
+                    self._catalog_ids = [item.id for item in catalog]
+                    self._catalog_version = version
+                    return self._catalog
+        self.hits += 1
+        return self._catalog
+    def get_catalog_item(self, content_id):
+        self.get_catalog()
+        return self._catalog_by_id.get(content_id)
+    def get_content_page(self, difficulty_level=None, after_id=0, limit=24):
+        """Keyset page of the catalog ordered by id; returns (items, next_after_id)"""
+        catalog = self.get_catalog()
+        start = bisect_right(self._catalog_ids, after_id or 0)
+        items = []
+        for item in catalog[start:]:
+            if difficulty_level and item.difficulty_level != difficulty_level:
+                continue
+            items.append(item)
+            if len(items) > limit:
+                break
+        next_after_id = items[limit - 1].id if len(items) > limit else None
+        return items[:limit], next_after_id
+    def get_recommended_content(self, user, predictions, limit=6):
+        from recommendation_service import get_recommendation_service
+        return get_recommendation_service().get_recommendations(user, predictions, limit=limit)
     def get_content_by_difficulty(self, difficulty_level):
-        return Content.query.filter_by(difficulty_level=difficulty_level).all()
+        return [item for item in self.get_catalog() if item.difficulty_level == difficulty_level]
     def get_all_content(self):
-        return Content.query.all()
+        return list(self.get_catalog())
 content_manager = None
 def get_content_manager():
     global content_manager
     if content_manager is None:
         content_manager = ContentManager()
     return content_manager
+
+def _catalog_metrics():
+    if content_manager is None:
+        return []
+    return [('cache_requests_total', {'cache': 'content_catalog', 'result': 'hit'}, content_manager.hits),
+            ('cache_requests_total', {'cache': 'content_catalog', 'result': 'miss'}, content_manager.reloads)]
+
+metrics.register_collector(_catalog_metrics)
@@ -0,0 +1,313 @@
+"""
+Asynchronous email delivery through an outbox table.
+
+Requests only call enqueue_email(), which inserts an email_outbox row and
+wakes the sender; nothing touches SMTP on the request thread. A background
+OutboxSender thread (one per process, started on first use) claims due rows
+in batches, sends them over one reused, authenticated SMTP connection, and
+records the outcome: 'sent', 'pending' again with exponential backoff, or
+'failed' after EMAIL_MAX_ATTEMPTS. A claimed row is leased until
+next_attempt_at, so rows held by a worker that died are picked up again
+and several processes can share the table. The lease is renewed right
+before each send, and a row whose lease ran out and was taken over by
+another sender is left to that sender.
+
+SMTP settings come from email_config.py, overridable with SMTP_HOST,
+SMTP_PORT, SMTP_STARTTLS, SMTP_USERNAME and SMTP_PASSWORD (point them at a
+local SMTP stand-in for testing). When email is not enabled the messages are
+logged (recipient and subject only) and marked 'skipped'. Bodies carry OTP
+codes and reset links, so they are cleared as soon as a row is sent, skipped
+or failed; only pending rows keep theirs. EMAIL_OUTBOX_WORKER=0 keeps web processes from
+sending, for running the sender on its own:
+
+Usage:
+    python email_outbox.py              # run the sender in the foreground
+    python email_outbox.py --once       # send what is due now and exit
+    python email_outbox.py --status     # counts per status
+"""
+
+import argparse
+import logging
+import os
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+from sqlalchemy import func, or_, update
+import email_config
+from metrics import metrics
+
+BATCH_SIZE = int(os.environ.get('EMAIL_BATCH_SIZE', 20))
+MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS', 6))
+BACKOFF_SECONDS = float(os.environ.get('EMAIL_BACKOFF_SECONDS', 30))
+LEASE_SECONDS = 300
+POLL_SECONDS = float(os.environ.get('EMAIL_POLL_SECONDS', 5))
+IDLE_CLOSE_SECONDS = 60
+
+class SMTPSettings:
+    def __init__(self, host=None, port=None, starttls=None, username=None, password=None,
+                 sender=None, enabled=None, timeout=30):
+        self.host = host or os.environ.get('SMTP_HOST', 'smtp.gmail.com')
+        self.port = int(port or os.environ.get('SMTP_PORT', 587))
+        self.starttls = starttls if starttls is not None else os.environ.get('SMTP_STARTTLS', '1') != '0'
+        self.username = username if username is not None else os.environ.get(
+            'SMTP_USERNAME', getattr(email_config, 'GMAIL_EMAIL', None))
+        self.password = password if password is not None else os.environ.get(
+            'SMTP_PASSWORD', getattr(email_config, 'GMAIL_PASSWORD', None))
+        self.sender = sender or self.username or 'noreply@localhost'
+        self.enabled = enabled if enabled is not None else (
+            bool(os.environ.get('SMTP_HOST')) or getattr(email_config, 'GMAIL_ENABLED', False))
+        self.timeout = timeout
+
+class PooledSMTP:
+    """One authenticated SMTP connection kept open across batches (single sender thread)"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._smtp = None
+        self._last_used = 0.0
+
+    def _connect(self):
+        settings = self.settings
+        smtp = smtplib.SMTP(settings.host, settings.port, timeout=settings.timeout)
+        if settings.starttls:
+            smtp.starttls()
+        if settings.username and settings.password:
+            smtp.login(settings.username, settings.password)
+        return smtp
+
+    def connection(self):
+        if self._smtp is not None and time.monotonic() - self._last_used > IDLE_CLOSE_SECONDS:
+            # Servers drop idle sessions; check before reusing one that sat around
+            try:
+                self._smtp.noop()
+            except smtplib.SMTPException:
+                self._smtp = None
+        if self._smtp is None:
+            self._smtp = self._connect()
+        return self._smtp
+
+    def send(self, message):
+        for retry in (True, False):
+            smtp = self.connection()
+            try:
+                smtp.send_message(message)
+                self._last_used = time.monotonic()
+                return
+            except smtplib.SMTPServerDisconnected:
+                self._smtp = None
+                if not retry:
+                    raise
+            except Exception:
+                # Timeouts or errors mid-message leave the session in an unknown state: never reuse it
+                smtp.close()
+                self._smtp = None
+                raise
+
+    def close_if_idle(self):
+        if self._smtp is not None and time.monotonic() - self._last_used > IDLE_CLOSE_SECONDS:
+            self.close()
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except smtplib.SMTPException:
+                pass
+            self._smtp = None
+
+def backoff(attempts):
+    """Delay before retry number `attempts`: 30s, 60s, 120s, ... capped at one hour"""
+    return timedelta(seconds=min(BACKOFF_SECONDS * 2 ** (attempts - 1), 3600))
+
+class OutboxSender:
+    def __init__(self, app, db, settings=None):
+        self.app = app
+        self.db = db
+        self.settings = settings or SMTPSettings()
+        self.smtp = PooledSMTP(self.settings)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _claim_batch(self):
+        """Lease up to BATCH_SIZE due rows to this sender; returns (their ids, the lease expiry)"""
+        from models import EmailOutbox
+        now = datetime.utcnow()
+        lease = now + timedelta(seconds=LEASE_SECONDS)
+        session = self.db.session
+        candidates = [row_id for (row_id,) in session.query(EmailOutbox.id).filter(
+            EmailOutbox.status.in_(('pending', 'sending')),
+            EmailOutbox.next_attempt_at <= now).order_by(EmailOutbox.next_attempt_at).limit(BATCH_SIZE)]
+        claimed = []
+        for row_id in candidates:
+            # Conditional update: only one process wins each row
+            result = session.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id == row_id, EmailOutbox.next_attempt_at <= now,
+                       or_(EmailOutbox.status == 'pending', EmailOutbox.status == 'sending'))
+                .values(status='sending', next_attempt_at=lease)
+                .execution_options(synchronize_session=False))
+            if result.rowcount:
+                claimed.append(row_id)
+        session.commit()
+        return claimed, lease
+
+    def _renew_lease(self, email_id, lease):
+        """Extend the lease on a claimed row before sending it; False if another sender took it over"""
+        from models import EmailOutbox
+        # The batch may have been slow: only a row still under this sender's lease is renewed
+        result = self.db.session.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.id == email_id, EmailOutbox.status == 'sending', EmailOutbox.next_attempt_at == lease)
+            .values(next_attempt_at=datetime.utcnow() + timedelta(seconds=LEASE_SECONDS))
+            .execution_options(synchronize_session=False))
+        self.db.session.commit()
+        return bool(result.rowcount)
+
+    def _deliver(self, email):
+        if not self.settings.enabled:
+            logging.info(f"Email not enabled; not sending '{email.subject}' to {email.recipient}")
+            return 'skipped'
+        message = MIMEText(email.body, 'plain')
+        message['From'] = self.settings.sender
+        message['To'] = email.recipient
+        message['Subject'] = email.subject
+        self.smtp.send(message)
+        return 'sent'
+
+    def run_once(self):
+        """Send everything that is due now; returns {status: count}"""
+        from models import EmailOutbox
+        counts = {}
+        with self.app.app_context():
+            while True:
+                claimed, lease = self._claim_batch()
+                if not claimed:
+                    break
+                for email in EmailOutbox.query.filter(EmailOutbox.id.in_(claimed)).all():
+                    if not self._renew_lease(email.id, lease):
+                        continue
+                    email.attempts += 1
+                    try:
+                        email.status = self._deliver(email)
+                        email.sent_at = datetime.utcnow()
+                        email.last_error = None
+                    except Exception as e:
+                        email.last_error = f'{type(e).__name__}: {e}'
+                        if email.attempts >= MAX_ATTEMPTS:
+                            email.status = 'failed'
+                            logging.error(f"Giving up on email {email.id} to {email.recipient}: {email.last_error}")
+                        else:
+                            email.status = 'pending'
+                            email.next_attempt_at = datetime.utcnow() + backoff(email.attempts)
+                            logging.warning(f"Email {email.id} to {email.recipient} failed, "
+                                            f"retry {email.attempts}: {email.last_error}")
+                    if email.status != 'pending':
+                        email.body = ''  # finished: drop the OTP / reset link
+                    metrics.inc('email_deliveries_total', status=email.status)
+                    counts[email.status] = counts.get(email.status, 0) + 1
+                    # Record each outcome right away so a crash never resends a delivered email
+                    self.db.session.commit()
+            self.db.session.remove()
+        return counts
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logging.error(f"Email outbox sender error: {e}")
+            self.smtp.close_if_idle()
+            self._wake.wait(POLL_SECONDS)
+            self._wake.clear()
+        self.smtp.close()
+
+    def ensure_started(self):
+        """Start the background thread in this process (again after a fork)"""
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='email-outbox', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        if worker_enabled():
+            self.ensure_started()
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+_sender = None
+
+def get_outbox_sender():
+    global _sender
+    if _sender is None:
+        from app import app, db
+        _sender = OutboxSender(app, db)
+    return _sender
+
+def worker_enabled():
+    return os.environ.get('EMAIL_OUTBOX_WORKER', '1') != '0'
+
+def init_app(app):
+    """Start the sender with the first request a serving process handles (not on import)"""
+    @app.before_request
+    def start_email_outbox():
+        if worker_enabled():
+            get_outbox_sender().ensure_started()
+
+def enqueue_email(recipient, subject, body):
+    """Queue an email for the background sender; commits and returns the outbox row"""
+    from app import db
+    from models import EmailOutbox
+    email = EmailOutbox(recipient=recipient, subject=subject, body=body,
+                        status='pending', attempts=0, next_attempt_at=datetime.utcnow())
+    db.session.add(email)
+    db.session.commit()
+    get_outbox_sender().wake()
+    return email
+
+def outbox_status():
+    """{status: count} over the whole outbox"""
+    from app import db
+    from models import EmailOutbox
+    return dict(db.session.query(EmailOutbox.status, func.count(EmailOutbox.id)).group_by(EmailOutbox.status).all())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Send queued emails from the outbox')
+    parser.add_argument('--once', action='store_true', help='send what is due now and exit')
+    parser.add_argument('--status', action='store_true', help='print counts per status and exit')
+    args = parser.parse_args()
+
+    os.environ['EMAIL_OUTBOX_WORKER'] = '0'  # this process drives the sender itself
+    from app import app
+    sender = get_outbox_sender()
+    if args.status:
+        with app.app_context():
+            for status, count in sorted(outbox_status().items()):
+                print(f'{status:<8} {count}')
+    elif args.once:
+        print(sender.run_once())
+    else:
+        print('📧 Sending queued emails (Ctrl+C to stop)')
+        try:
+            while True:
+                counts = sender.run_once()
+                if counts:
+                    print(counts)
+                sender.smtp.close_if_idle()
+                time.sleep(POLL_SECONDS)
+        except KeyboardInterrupt:
+            sender.smtp.close()
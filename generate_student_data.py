@@ -1,31 +1,201 @@
+"""
+Synthetic student quiz data for training and load tests.
+
+Students get a fixed learning style, skill level and latent ability; each of
+their attempts picks a subject and difficulty, spends time according to the
+difficulty, and scores according to ability, skill, difficulty, how well the
+learning style suits the subject and how much time was spent. Rows are
+generated with NumPy one chunk of students at a time and streamed out, so the
+number of attempts is limited only by disk space.
+
+Usage:
+    python generate_student_data.py                                  # 1000 students -> student_quiz_data.csv
+    python generate_student_data.py --students 2000000 --seed 7      # ~10M attempts
+    python generate_student_data.py --students 50000 --db            # users + quiz attempts in the database
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
-import random
-
-subjects = ['Python', 'Data Structures', 'OOP', 'Machine Learning']
-difficulties = ['beginner', 'intermediate', 'advanced']
-learning_styles = ['visual', 'auditory', 'kinesthetic']
-skill_levels = ['beginner', 'intermediate', 'advanced']
-
-rows = []
-for user_id in range(1, 1001):
-    for _ in range(random.randint(3, 7)):  # Each student takes 3-7 quizzes
-        subject = random.choice(subjects)
-        difficulty = random.choice(difficulties)
-        score = random.randint(40, 100)
-        time_spent = random.randint(60, 300)  # seconds
-        learning_style = random.choice(learning_styles)
-        skill_level = random.choice(skill_levels)
-        rows.append({
-            'user_id': user_id,
+
+SUBJECTS = ['Python', 'Data Structures', 'OOP', 'Machine Learning']
+DIFFICULTIES = ['beginner', 'intermediate', 'advanced']
+LEARNING_STYLES = ['visual', 'auditory', 'kinesthetic']
+SKILL_LEVELS = ['beginner', 'intermediate', 'advanced']
+
+CSV_FILE = 'student_quiz_data.csv'
+CSV_COLUMNS = ['user_id', 'subject', 'difficulty', 'score', 'time_spent', 'learning_style', 'skill_level']
+
+# Score model: points added per category (indexed like the lists above)
+SKILL_EFFECT = np.array([-10.0, 0.0, 10.0])
+DIFFICULTY_EFFECT = np.array([10.0, 0.0, -12.0])
+DIFFICULTY_TIME = np.array([110.0, 170.0, 240.0])  # mean seconds per quiz
+STYLE_SUBJECT_EFFECT = np.array([  # rows: learning style, columns: subject
+    [2.0, 4.0, 1.0, 3.0],    # visual
+    [1.0, -3.0, 0.0, -2.0],  # auditory
+    [4.0, 1.0, 3.0, -1.0],   # kinesthetic
+])
+
+class StudentDataGenerator:
+    def __init__(self, seed=None, min_attempts=3, max_attempts=7):
+        self.rng = np.random.default_rng(seed)
+        self.min_attempts = min_attempts
+        self.max_attempts = max_attempts
+
+    def generate_chunk(self, first_user_id, num_students):
+        """Attempts for users first_user_id .. first_user_id + num_students - 1.
+
+        Returns a dict of NumPy arrays; categorical columns are integer codes.
+        """
+        rng = self.rng
+        style = rng.integers(0, len(LEARNING_STYLES), num_students)
+        skill = rng.choice(len(SKILL_LEVELS), num_students, p=[0.45, 0.35, 0.2])
+        ability = rng.normal(0.0, 8.0, num_students)
+        attempts = rng.integers(self.min_attempts, self.max_attempts + 1, num_students)
+
+        student = np.repeat(np.arange(num_students), attempts)
+        n = len(student)
+        subject = rng.integers(0, len(SUBJECTS), n)
+        # Stronger students pick harder quizzes more often
+        difficulty = np.clip(skill[student] + rng.integers(-1, 2, n), 0, len(DIFFICULTIES) - 1)
+
+        time_spent = rng.lognormal(np.log(DIFFICULTY_TIME[difficulty]), 0.35)
+        time_spent = np.clip(time_spent, 30, 900).round().astype(np.int32)
+        # Time relative to what the difficulty needs: rushing hurts, beyond ~2x helps little
+        effort = np.log(time_spent / DIFFICULTY_TIME[difficulty])
+        time_effect = np.where(effort < 0, 12.0 * effort, 3.0 * np.minimum(effort, 0.7))
+
+        score = (68.0 + ability[student] + SKILL_EFFECT[skill[student]]
+                 + DIFFICULTY_EFFECT[difficulty] + STYLE_SUBJECT_EFFECT[style[student], subject]
+                 + time_effect + rng.normal(0.0, 6.0, n))
+        score = np.clip(score, 0, 100).round().astype(np.int32)
+
+        return {
+            'user_id': student + first_user_id,
             'subject': subject,
             'difficulty': difficulty,
             'score': score,
             'time_spent': time_spent,
-            'learning_style': learning_style,
-            'skill_level': skill_level
-        })
+            'learning_style': style[student],
+            'skill_level': skill[student],
+            'students': {'learning_style': style, 'skill_level': skill},
+        }
+
+    def chunks(self, num_students, chunk_size, first_user_id=1):
+        for start in range(0, num_students, chunk_size):
+            yield self.generate_chunk(first_user_id + start, min(chunk_size, num_students - start))
+
+def chunk_to_frame(chunk):
+    """Training-data CSV layout (the format ml_models.train_from_csv reads)"""
+    return pd.DataFrame({
+        'user_id': chunk['user_id'],
+        'subject': pd.Categorical.from_codes(chunk['subject'], SUBJECTS),
+        'difficulty': pd.Categorical.from_codes(chunk['difficulty'], DIFFICULTIES),
+        'score': chunk['score'],
+        'time_spent': chunk['time_spent'],
+        'learning_style': pd.Categorical.from_codes(chunk['learning_style'], LEARNING_STYLES),
+        'skill_level': pd.Categorical.from_codes(chunk['skill_level'], SKILL_LEVELS),
+    }, columns=CSV_COLUMNS)
+
+def write_csv(path, num_students, chunk_size=100000, seed=None, min_attempts=3, max_attempts=7):
+    generator = StudentDataGenerator(seed, min_attempts, max_attempts)
+    rows = 0
+    for index, chunk in enumerate(generator.chunks(num_students, chunk_size)):
+        frame = chunk_to_frame(chunk)
+        frame.to_csv(path, mode='w' if index == 0 else 'a', header=index == 0, index=False)
+        rows += len(frame)
+    return rows
+
+def write_database(num_students, chunk_size=100000, seed=None, min_attempts=3, max_attempts=7,
+                   password='password123', batch_size=20000, question_ids=None, questions_per_attempt=15):
+    """Insert synthetic users and their quiz attempts with bulk Core inserts.
+
+    Users are named sim_<id> and all share one password hash. Attempts are
+    spread over the last 180 days; when question_ids are given, each attempt
+    records a random sample of them.
+    """
+    from sqlalchemy import func, insert
+    from werkzeug.security import generate_password_hash
+    from app import db
+    from models import User, QuizAttempt
+    from user_aggregates import rebuild
+
+    generator = StudentDataGenerator(seed, min_attempts, max_attempts)
+    password_hash = generate_password_hash(password)
+    first_user_id = (db.session.query(func.max(User.id)).scalar() or 0) + 1
+    now = datetime.utcnow()
+    empty_questions, empty_answers = json.dumps([]), json.dumps({})
+    rows = 0
+
+    for chunk in generator.chunks(num_students, chunk_size, first_user_id):
+        students = chunk['students']
+        user_ids = range(chunk['user_id'][0], chunk['user_id'][0] + len(students['skill_level']))
+        users = [{
+            'id': user_id,
+            'username': f'sim_{user_id}',
+            'email': f'sim_{user_id}@example.com',
+            'password_hash': password_hash,
+            'learning_style': LEARNING_STYLES[style],
+            'skill_level': SKILL_LEVELS[skill],
+            'created_at': now
+        } for user_id, style, skill in zip(user_ids, students['learning_style'].tolist(),
+                                           students['skill_level'].tolist())]
+        for start in range(0, len(users), batch_size):
+            db.session.execute(insert(User.__table__), users[start:start + batch_size])
+
+        n = len(chunk['user_id'])
+        seconds_ago = generator.rng.integers(0, 180 * 86400, n).tolist()
+        if question_ids:
+            sampled = np.asarray(question_ids)[generator.rng.integers(
+                0, len(question_ids), (n, min(questions_per_attempt, len(question_ids))))]
+            attempt_questions = [json.dumps(row) for row in sampled.tolist()]
+        else:
+            attempt_questions = [empty_questions] * n
+        attempts = [{
+            'user_id': user_id,
+            'questions': questions,
+            'answers': empty_answers,
+            'score': score,
+            'time_spent': time_spent,
+            'difficulty_level': DIFFICULTIES[difficulty],
+            'created_at': now - timedelta(seconds=ago)
+        } for user_id, questions, score, time_spent, difficulty, ago in zip(
+            chunk['user_id'].tolist(), attempt_questions, chunk['score'].tolist(),
+            chunk['time_spent'].tolist(), chunk['difficulty'].tolist(), seconds_ago)]
+        for start in range(0, n, batch_size):
+            db.session.execute(insert(QuizAttempt.__table__), attempts[start:start + batch_size])
+        db.session.commit()
+        rows += n
+    # Core inserts bypass evaluate_quiz, so fill the new users' aggregates in one pass
+    rebuild(db.session, min_user_id=first_user_id)
+    db.session.commit()
+    return rows
 
-# Save to CSV
-pd.DataFrame(rows).to_csv('student_quiz_data.csv', index=False)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate synthetic student quiz data')
+    parser.add_argument('--students', type=int, default=1000, help='number of students (default 1000)')
+    parser.add_argument('--min-attempts', type=int, default=3, help='fewest quizzes per student')
+    parser.add_argument('--max-attempts', type=int, default=7, help='most quizzes per student')
+    parser.add_argument('--seed', type=int, default=None, help='random seed for reproducible data')
+    parser.add_argument('--chunk-size', type=int, default=100000, help='students generated per chunk')
+    parser.add_argument('--output', default=CSV_FILE, help=f'CSV path (default {CSV_FILE})')
+    parser.add_argument('--db', action='store_true', help='insert users and quiz attempts into the database instead')
+    args = parser.parse_args()
 
-print('Generated student_quiz_data.csv with 1000 students.') 
\ No newline at end of file
+    started = time.perf_counter()
+    options = dict(chunk_size=args.chunk_size, seed=args.seed,
+                   min_attempts=args.min_attempts, max_attempts=args.max_attempts)
+    if args.db:
+        from app import app
+        with app.app_context():
+            rows = write_database(args.students, **options)
+        target = 'the database'
+    else:
+        rows = write_csv(args.output, args.students, **options)
+        target = args.output
+    elapsed = time.perf_counter() - started
+    print(f'Generated {rows} attempts for {args.students} students into {target} '
+          f'in {elapsed:.1f}s ({rows / elapsed:.0f} rows/sec).')
@@ -0,0 +1,112 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import request, make_response
+from metrics import metrics
+
+class ConditionalStats:
+    """Per-endpoint counters for conditional GETs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def record(self, endpoint, not_modified):
+        with self._lock:
+            counts = self._counts.setdefault(endpoint, {'checked': 0, 'not_modified': 0})
+            counts['checked'] += 1
+            if not_modified:
+                counts['not_modified'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: dict(counts) for endpoint, counts in self._counts.items()}
+
+conditional_stats = ConditionalStats()
+
+def _conditional_metrics():
+    for endpoint, counts in conditional_stats.snapshot().items():
+        yield 'cache_requests_total', {'cache': 'http_conditional', 'endpoint': endpoint, 'result': 'hit'}, counts['not_modified']
+        yield 'cache_requests_total', {'cache': 'http_conditional', 'endpoint': endpoint, 'result': 'miss'}, counts['checked'] - counts['not_modified']
+
+metrics.register_collector(_conditional_metrics)
+
+class FragmentCache:
+    """Rendered HTML fragments per (user, fragment), valid while their version key is unchanged.
+
+    The key is built from version stamps, so a new quiz attempt, catalog change
+    or retrain makes the old entry unreachable instead of needing an explicit purge.
+    """
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (user_id, name) -> (key, html)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, name, key):
+        with self._lock:
+            entry = self._entries.get((user_id, name))
+            if entry is None or entry[0] != key:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((user_id, name))
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id, name, key, html):
+        with self._lock:
+            self._entries[(user_id, name)] = (key, html)
+            self._entries.move_to_end((user_id, name))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+fragment_cache = FragmentCache()
+
+def _fragment_metrics():
+    yield 'cache_requests_total', {'cache': 'dashboard_fragments', 'result': 'hit'}, fragment_cache.hits
+    yield 'cache_requests_total', {'cache': 'dashboard_fragments', 'result': 'miss'}, fragment_cache.misses
+
+metrics.register_collector(_fragment_metrics)
+
+def make_etag(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:20]
+
+def conditional(version_func):
+    """Serve 304 Not Modified when the client already holds the current version.
+
+    version_func(*args, **kwargs) receives the view arguments and returns
+    (etag_parts, last_modified). It must only read cheap version stamps so the
+    view itself (queries, model inference, rendering) is skipped on a match.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            parts, last_modified = version_func(*args, **kwargs)
+            etag = make_etag(request.full_path, *parts)
+            if last_modified is not None:
+                last_modified = last_modified.replace(microsecond=0)
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            elif request.if_modified_since and last_modified is not None:
+                not_modified = last_modified <= request.if_modified_since.replace(tzinfo=None)
+            else:
+                not_modified = False
+            conditional_stats.record(request.endpoint, not_modified)
+
+            if not_modified:
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            # Per-user payloads: browsers may keep them but must revalidate every time
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
@@ -1,55 +1,139 @@
 import csv
+import hashlib
 import json
+import re
+import sys
+import time
+from sqlalchemy import insert
 from app import app, db
-from models import QuizQuestion, Content
+from models import QuizQuestion, Content, QuestionSignature
+from question_dedup import find_near_duplicates
 
 CSV_FILE = 'real_questions.csv'
+CHUNK_SIZE = 1000
 
-with app.app_context():
-    # Remove all existing questions
-    QuizQuestion.query.delete()
-    db.session.commit()
+def question_hash(subject, question_text):
+    """Stable identity of a question: sha1 of subject and whitespace-normalized text"""
+    normalized = re.sub(r'\s+', ' ', question_text).strip().lower()
+    return hashlib.sha1(f"{subject.strip()}\x1f{normalized}".encode('utf-8')).hexdigest()
+
+def backfill_question_hashes():
+    """Hash questions imported before content_hash existed (first copy wins on duplicates)"""
+    taken = {h for (h,) in db.session.query(QuizQuestion.content_hash).filter(
+        QuizQuestion.content_hash.isnot(None))}
+    updates = []
+    rows = db.session.query(QuizQuestion.id, QuizQuestion.subject, QuizQuestion.question_text).filter(
+        QuizQuestion.content_hash.is_(None)
+    ).order_by(QuizQuestion.id).all()
+    for question_id, subject, question_text in rows:
+        content_hash = question_hash(subject, question_text)
+        if content_hash not in taken:
+            taken.add(content_hash)
+            updates.append({'id': question_id, 'content_hash': content_hash})
+    if updates:
+        db.session.bulk_update_mappings(QuizQuestion, updates)
+        db.session.commit()
+    return len(updates)
 
-    # Get all unique subjects from the CSV
-    subjects = set()
-    with open(CSV_FILE, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            subjects.add(row['subject'])
-    # Create content entries for each subject if not exist
-    content_map = {}
-    for subject in subjects:
-        content = Content.query.filter_by(title=subject).first()
-        if not content:
-            content = Content(
-                title=subject,
-                description=f"Content for {subject}",
-                content_type='article',
-                difficulty_level='beginner',
-                subject=subject,
-                tags=json.dumps([subject.lower()])
-            )
-            db.session.add(content)
-            db.session.commit()
-            content_map[subject] = content.id
+def get_content_id(subject, content_map):
+    """Content row for a subject, created on first sight"""
+    if subject not in content_map:
+        content = Content(
+            title=subject,
+            description=f"Content for {subject}",
+            content_type='article',
+            difficulty_level='beginner',
+            subject=subject,
+            tags=json.dumps([subject.lower()])
+        )
+        db.session.add(content)
+        db.session.flush()
+        content_map[subject] = content.id
+    return content_map[subject]
+
+def import_chunk(chunk, stats):
+    """Insert new questions, update changed ones in place and skip unchanged ones"""
+    existing = {
+        row.content_hash: row
+        for row in db.session.query(
+            QuizQuestion.id, QuizQuestion.content_hash, QuizQuestion.content_id,
+            QuizQuestion.options, QuizQuestion.correct_answer
+        ).filter(QuizQuestion.content_hash.in_(list(chunk)))
+    }
+    inserts, updates = [], []
+    for content_hash, values in chunk.items():
+        current = existing.get(content_hash)
+        if current is None:
+            inserts.append(values)
+        elif (current.options, current.correct_answer, current.content_id) != (
+                values['options'], values['correct_answer'], values['content_id']):
+            updates.append({'id': current.id, 'options': values['options'],
+                            'correct_answer': values['correct_answer'],
+                            'content_id': values['content_id']})
         else:
-            content_map[subject] = content.id
-    # Insert questions
-    with open(CSV_FILE, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
+            stats['skipped'] += 1
+    if inserts:
+        db.session.execute(insert(QuizQuestion.__table__), inserts)
+    if updates:
+        db.session.bulk_update_mappings(QuizQuestion, updates)
+        # Changed options need a fresh MinHash signature
+        QuestionSignature.query.filter(
+            QuestionSignature.question_id.in_([update['id'] for update in updates])
+        ).delete(synchronize_session=False)
+    db.session.commit()
+    stats['inserted'] += len(inserts)
+    stats['updated'] += len(updates)
+
+def import_questions(csv_path=CSV_FILE, chunk_size=CHUNK_SIZE, dedup=True):
+    """Single-pass, idempotent import keyed on question_hash(); existing IDs are preserved"""
+    started = time.perf_counter()
+    stats = {'rows': 0, 'inserted': 0, 'updated': 0, 'skipped': 0, 'invalid': 0}
+    stats['backfilled'] = backfill_question_hashes()
+    content_map = {title: content_id for content_id, title in db.session.query(Content.id, Content.title)}
+
+    chunk = {}
+    with open(csv_path, newline='', encoding='utf-8') as csvfile:
+        for row in csv.DictReader(csvfile):
+            stats['rows'] += 1
             if not row.get('correct_answer') or not row['correct_answer'].strip():
                 print(f"Skipping row with missing correct_answer: {row}")
+                stats['invalid'] += 1
+                continue
+            subject = row['subject']
+            content_hash = question_hash(subject, row['question_text'])
+            if content_hash in chunk:
+                stats['skipped'] += 1  # duplicate within the file
                 continue
             options = [row['option_a'], row['option_b'], row['option_c'], row['option_d']]
-            question = QuizQuestion(
-                content_id=content_map[row['subject']],
-                question_text=row['question_text'],
-                options=json.dumps(options),
-                correct_answer=row['correct_answer'],
-                difficulty_level='beginner',
-                subject=row['subject']
-            )
-            db.session.add(question)
-        db.session.commit()
-    print('✅ Real questions imported successfully!') 
\ No newline at end of file
+            chunk[content_hash] = {
+                'content_id': get_content_id(subject, content_map),
+                'question_text': row['question_text'],
+                'options': json.dumps(options),
+                'correct_answer': row['correct_answer'].strip(),
+                'difficulty_level': 'beginner',
+                'subject': subject,
+                'content_hash': content_hash
+            }
+            if len(chunk) >= chunk_size:
+                import_chunk(chunk, stats)
+                chunk = {}
+    if chunk:
+        import_chunk(chunk, stats)
+    if dedup:
+        stats['near_duplicates'] = find_near_duplicates()['flagged']
+
+    elapsed = time.perf_counter() - started
+    stats['seconds'] = elapsed
+    stats['rows_per_sec'] = stats['rows'] / elapsed if elapsed else 0.0
+    return stats
+
+if __name__ == "__main__":
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else CSV_FILE
+    with app.app_context():
+        stats = import_questions(csv_path)
+    print(f"✅ Imported {stats['rows']} rows from {csv_path} in {stats['seconds']:.2f}s "
+          f"({stats['rows_per_sec']:.0f} rows/sec)")
+    print(f"   inserted={stats['inserted']} updated={stats['updated']} skipped={stats['skipped']} "
+          f"invalid={stats['invalid']} backfilled={stats['backfilled']}")
+    if 'near_duplicates' in stats:
+        print(f"   near-duplicates flagged: {stats['near_duplicates']} (see question_signature.near_duplicate_of)")
@@ -0,0 +1,329 @@
+"""
+End-to-end load test of the main user flows.
+
+Each virtual user registers, logs in, opens the dashboard, starts and submits
+a quiz, views content and downloads a certificate, with a random think time
+between steps. Per-step latency percentiles, throughput, error rates and
+(in-process only) SQL queries per request are printed and can be saved as
+JSON and compared against an earlier run.
+
+By default the app runs in-process through the Flask test client against a
+throwaway SQLite database and working directory (seeded from
+real_questions.csv), so real data is never touched. Use --url to drive a
+server that is already running instead.
+
+Usage:
+    python loadtest.py --users 20 --iterations 3 --output baseline.json
+    python loadtest.py --users 20 --iterations 3 --compare baseline.json
+    python loadtest.py --url http://localhost:8000 --users 50 --think-time 0.5
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from http.cookiejar import CookieJar
+from urllib import error, parse, request as urlrequest
+import numpy as np
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Status code each step returns when it succeeds
+EXPECTED_STATUS = {
+    'register': 302,
+    'login': 302,
+    'dashboard': 200,
+    'dashboard_panel': 200,
+    'start_quiz': 200,
+    'quiz': 200,
+    'submit_quiz': 200,
+    'content': 200,
+    'view_content': 200,
+    'download_certificate': 200,
+}
+
+class QueryCounter:
+    """Counts SQL statements per thread through engine events (in-process mode only)"""
+
+    def __init__(self, engines):
+        from sqlalchemy import event
+        self.local = threading.local()
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.local.count = getattr(self.local, 'count', 0) + 1
+
+    def reset(self):
+        self.local.count = 0
+
+    def value(self):
+        return getattr(self.local, 'count', 0)
+
+class InProcessClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, response.get_data()
+
+class HttpClient:
+    """urllib client with its own cookie jar that does not follow redirects"""
+
+    class _NoRedirect(urlrequest.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urlrequest.build_opener(urlrequest.HTTPCookieProcessor(CookieJar()), self._NoRedirect)
+
+    def request(self, method, path, data=None):
+        body = parse.urlencode(data).encode() if data is not None else None
+        req = urlrequest.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except error.HTTPError as e:
+            return e.code, e.read()
+
+class LoadTest:
+    def __init__(self, make_client, users=10, iterations=1, think_time=0.0, ramp_up=0.0,
+                 query_counter=None, seed=None):
+        self.make_client = make_client
+        self.users = users
+        self.iterations = iterations
+        self.think_time = think_time
+        self.ramp_up = ramp_up
+        self.query_counter = query_counter
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)  # step -> [(latency_sec, ok, queries)]
+        self.failures = defaultdict(int)  # (step, status) -> count
+
+    def record(self, step, latency, ok, status, queries):
+        with self.lock:
+            self.samples[step].append((latency, ok, queries))
+            if not ok:
+                self.failures[f'{step}:{status}'] += 1
+
+    def call(self, client, step, method, path, data=None):
+        if self.query_counter:
+            self.query_counter.reset()
+        started = time.perf_counter()
+        try:
+            status, body = client.request(method, path, data)
+        except Exception as e:
+            status, body = type(e).__name__, b''
+        latency = time.perf_counter() - started
+        queries = self.query_counter.value() if self.query_counter else None
+        ok = status == EXPECTED_STATUS[step]
+        self.record(step, latency, ok, status, queries)
+        return ok, body
+
+    def think(self, rng):
+        if self.think_time > 0:
+            time.sleep(rng.expovariate(1.0 / self.think_time))
+
+    def user_session(self, index):
+        rng = random.Random(None if self.seed is None else self.seed + index)
+        client = self.make_client()
+        name = f'load_{uuid.uuid4().hex[:12]}'
+        ok, _ = self.call(client, 'register', 'POST', '/register', {
+            'username': name, 'email': f'{name}@example.com', 'password': 'loadtest1',
+            'phone': '0000000000', 'college': 'Load Test', 'age': str(rng.randint(17, 40)),
+            'learning_style': rng.choice(['visual', 'auditory', 'kinesthetic']),
+            'skill_level': rng.choice(['beginner', 'intermediate', 'advanced'])
+        })
+        if not ok:
+            return
+        self.think(rng)
+        ok, _ = self.call(client, 'login', 'POST', '/login', {'username': name, 'password': 'loadtest1'})
+        if not ok:
+            return
+        for _ in range(self.iterations):
+            self.think(rng)
+            ok, body = self.call(client, 'dashboard', 'GET', '/dashboard')
+            # The browser then fetches each panel of the dashboard shell
+            for panel_url in re.findall(r'data-panel-url="([^"]+)"', body.decode('utf-8', 'replace')):
+                self.call(client, 'dashboard_panel', 'GET', panel_url)
+            self.think(rng)
+            ok, body = self.call(client, 'start_quiz', 'GET', '/start_quiz')
+            subjects = re.findall(r'<option value="([^"]+)">', body.decode('utf-8', 'replace'))
+            if subjects:
+                subject = rng.choice(subjects)
+                self.think(rng)
+                self.call(client, 'quiz', 'GET', '/quiz?' + parse.urlencode({'subject': subject}))
+                self.think(rng)
+                answers = {f'question_{i}': rng.choice('ABCD') for i in range(15)}
+                self.call(client, 'submit_quiz', 'POST', '/submit_quiz', answers)
+                self.think(rng)
+                self.call(client, 'download_certificate', 'GET', '/download_certificate?' + parse.urlencode(
+                    {'subject': subject, 'score': rng.randint(70, 100)}))
+            self.think(rng)
+            ok, body = self.call(client, 'content', 'GET', '/content')
+            content_ids = re.findall(r'href="/content/(\d+)"', body.decode('utf-8', 'replace'))
+            if content_ids:
+                self.think(rng)
+                self.call(client, 'view_content', 'GET', f'/content/{rng.choice(content_ids)}')
+
+    def run(self):
+        threads = []
+        started = time.perf_counter()
+        for index in range(self.users):
+            thread = threading.Thread(target=self.user_session, args=(index,), daemon=True)
+            threads.append(thread)
+            thread.start()
+            if self.ramp_up and self.users > 1:
+                time.sleep(self.ramp_up / (self.users - 1))
+        for thread in threads:
+            thread.join()
+        return self.report(time.perf_counter() - started)
+
+    def report(self, elapsed):
+        routes = {}
+        total = errors = 0
+        for step in EXPECTED_STATUS:
+            samples = self.samples.get(step)
+            if not samples:
+                continue
+            latencies = np.array([latency for latency, _, _ in samples]) * 1000
+            step_errors = sum(1 for _, ok, _ in samples if not ok)
+            queries = [count for _, _, count in samples if count is not None]
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            routes[step] = {
+                'requests': len(samples),
+                'errors': step_errors,
+                'error_rate': step_errors / len(samples),
+                'requests_per_sec': len(samples) / elapsed,
+                'mean_ms': float(latencies.mean()),
+                'p50_ms': float(p50),
+                'p95_ms': float(p95),
+                'p99_ms': float(p99),
+                'max_ms': float(latencies.max()),
+                'queries_per_request': float(np.mean(queries)) if queries else None,
+            }
+            total += len(samples)
+            errors += step_errors
+        return {
+            'config': {'users': self.users, 'iterations': self.iterations,
+                       'think_time': self.think_time, 'ramp_up': self.ramp_up, 'seed': self.seed},
+            'duration_sec': elapsed,
+            'requests': total,
+            'errors': errors,
+            'error_rate': errors / total if total else 0.0,
+            'requests_per_sec': total / elapsed if elapsed else 0.0,
+            'failures': dict(self.failures),
+            'routes': routes,
+        }
+
+def print_report(report):
+    print(f"\n{report['requests']} requests in {report['duration_sec']:.1f}s "
+          f"({report['requests_per_sec']:.1f} req/s), error rate {report['error_rate']:.1%}")
+    print(f"{'step':<22}{'reqs':>6}{'err%':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}")
+    for step, stats in report['routes'].items():
+        queries = stats['queries_per_request']
+        print(f"{step:<22}{stats['requests']:>6}{stats['error_rate']:>7.1%}{stats['p50_ms']:>9.1f}"
+              f"{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{'' if queries is None else f'{queries:.1f}':>9}")
+    if report['failures']:
+        print('failures:', ', '.join(f'{key} x{count}' for key, count in report['failures'].items()))
+
+def compare_reports(baseline, report, tolerance=0.2):
+    """Steps whose p95 latency or query count grew by more than `tolerance`, or that started failing"""
+    regressions = []
+    for step, stats in report['routes'].items():
+        before = baseline.get('routes', {}).get(step)
+        if not before:
+            continue
+        if stats['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{step}: p95 {before['p95_ms']:.1f} -> {stats['p95_ms']:.1f} ms")
+        if (stats['queries_per_request'] is not None and before.get('queries_per_request') is not None
+                and stats['queries_per_request'] > before['queries_per_request'] * (1 + tolerance)):
+            regressions.append(f"{step}: queries {before['queries_per_request']:.1f} -> "
+                               f"{stats['queries_per_request']:.1f}")
+        if stats['error_rate'] > before['error_rate']:
+            regressions.append(f"{step}: error rate {before['error_rate']:.1%} -> {stats['error_rate']:.1%}")
+    return regressions
+
+def setup_in_process(database_url=None, workdir=None):
+    """Import the app against a scratch database and working directory.
+
+    submit_quiz appends to student_quiz_data.csv in the working directory and
+    certificates read static/ relative to it, so both are provided there.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix='loadtest_')
+    os.environ['DATABASE_URL'] = database_url or 'sqlite:///' + os.path.join(workdir, 'loadtest.db')
+    os.makedirs(workdir, exist_ok=True)
+    if not os.path.exists(os.path.join(workdir, 'static')):
+        os.symlink(os.path.join(PACKAGE_DIR, 'static'), os.path.join(workdir, 'static'))
+    csv_path = os.path.join(workdir, 'student_quiz_data.csv')
+    if not os.path.exists(csv_path):
+        shutil.copy(os.path.join(PACKAGE_DIR, 'student_quiz_data.csv'), csv_path)
+    os.chdir(workdir)
+    sys.path.insert(0, PACKAGE_DIR)
+
+    import email_config
+    email_config.GMAIL_ENABLED = False
+    import main  # noqa: F401  (registers the routes)
+    from app import app, db
+    from models import QuizQuestion
+    from import_questions import import_questions
+    from sqlite_tuning import database_engines
+    with app.app_context():
+        if QuizQuestion.query.count() == 0:
+            import_questions(os.path.join(PACKAGE_DIR, 'real_questions.csv'), dedup=False)
+        counter = QueryCounter(database_engines(db))
+    print(f"In-process app: database {os.environ['DATABASE_URL']}, working directory {workdir}")
+    return app, counter
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load test the main user flows')
+    parser.add_argument('--users', type=int, default=10, help='concurrent virtual users')
+    parser.add_argument('--iterations', type=int, default=1, help='quiz/content rounds per user after login')
+    parser.add_argument('--think-time', type=float, default=0.0, help='mean think time between steps in seconds')
+    parser.add_argument('--ramp-up', type=float, default=0.0, help='seconds over which users are started')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--url', help='base URL of a running server (default: run the app in-process)')
+    parser.add_argument('--database', help='database URL for in-process mode (default: scratch SQLite)')
+    parser.add_argument('--workdir', help='working directory for in-process mode (default: temp dir)')
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--compare', help='baseline JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression (default 0.2)')
+    args = parser.parse_args()
+    # In-process mode changes directory, so resolve report paths first
+    args.output = args.output and os.path.abspath(args.output)
+    args.compare = args.compare and os.path.abspath(args.compare)
+
+    if args.url:
+        make_client, counter = (lambda: HttpClient(args.url)), None
+    else:
+        app, counter = setup_in_process(args.database, args.workdir)
+        make_client = lambda: InProcessClient(app)
+
+    load_test = LoadTest(make_client, args.users, args.iterations, args.think_time, args.ramp_up,
+                         counter, args.seed)
+    report = load_test.run()
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_reports(json.load(f), report, args.tolerance)
+        if regressions:
+            print('Regressions against', args.compare)
+            for line in regressions:
+                print('  ' + line)
+            sys.exit(1)
+        print(f'No regressions against {args.compare}')
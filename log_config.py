@@ -0,0 +1,205 @@
+"""
+Non-blocking, structured logging.
+
+Request threads only put records on an in-memory queue; a background
+QueueListener thread formats them as one JSON object per line and writes them
+to LOG_FILE (stderr when unset). When the queue is full, records are dropped
+and counted instead of blocking the request.
+
+Every record carries the request id (X-Request-ID, or a generated one that is
+echoed back in the response), the logged-in user id and the route of the
+request that logged it, plus any `extra=` fields.
+
+Environment:
+    LOG_LEVEL=INFO                                 root level
+    LOG_LEVELS=sql_profiler=DEBUG,werkzeug=WARNING per-logger levels
+    LOG_RATE_LIMITS=predictions=20                 records/second per logger; the rest are
+                                                   sampled out and the next kept record
+                                                   reports how many were skipped
+    LOG_FORMAT=json|text                           text for a readable dev console
+    LOG_FILE=/var/log/app.jsonl                    default stderr
+    LOG_QUEUE_SIZE=10000
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from flask import g, has_request_context, request
+
+DEFAULT_RATE_LIMITS = {'predictions': 20}
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+_CONTEXT_FIELDS = ('request_id', 'user_id', 'route')
+
+def _parse_mapping(value):
+    """'a=1,b.c=DEBUG' -> {'a': '1', 'b.c': 'DEBUG'}"""
+    mapping = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            name, setting = item.split('=', 1)
+            mapping[name.strip()] = setting.strip()
+    return mapping
+
+class LogStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.dropped = {'queue_full': 0, 'rate_limited': 0}
+
+    def drop(self, reason, count=1):
+        with self._lock:
+            self.dropped[reason] += count
+
+log_stats = LogStats()
+
+class RequestContextFilter(logging.Filter):
+    """Stamp request id, user id and route on records while still on the request thread"""
+
+    def filter(self, record):
+        if has_request_context():
+            if getattr(record, 'request_id', None) is None:
+                record.request_id = g.get('request_id')
+            if getattr(record, 'user_id', None) is None:
+                # Only a user Flask-Login already loaded; logging must not query the database
+                record.user_id = getattr(g.get('_login_user'), 'id', None)
+            if getattr(record, 'route', None) is None:
+                record.route = request.endpoint or request.path
+        return True
+
+class RateLimitFilter(logging.Filter):
+    """Keep at most `limit` records per second for each configured logger (and its children)"""
+
+    def __init__(self, limits):
+        super().__init__()
+        self.limits = {name: float(limit) for name, limit in limits.items()}
+        self._lock = threading.Lock()
+        self._windows = {}  # logger prefix -> [window start, kept, skipped]
+
+    def _limit_for(self, name):
+        while name:
+            if name in self.limits:
+                return name, self.limits[name]
+            name = name.rpartition('.')[0]
+        return None, None
+
+    def filter(self, record):
+        prefix, limit = self._limit_for(record.name)
+        if prefix is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.setdefault(prefix, [now, 0, 0])
+            if now - window[0] >= 1.0:
+                window[0], window[1] = now, 0
+            if window[1] >= limit:
+                window[2] += 1
+                log_stats.drop('rate_limited')
+                return False
+            window[1] += 1
+            if window[2]:
+                record.sampled_out = window[2]
+                window[2] = 0
+        return True
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+        }
+        for field in _CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in _CONTEXT_FIELDS and key not in entry:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of waiting on a full queue"""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_stats.drop('queue_full')
+
+    def prepare(self, record):
+        # Resolve the message and traceback here, but leave formatting to the listener thread
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record = logging.makeLogRecord(vars(record))
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+_listener = None
+
+def configure_logging():
+    """Route the root logger through the queue; safe to call more than once"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    if os.environ.get('LOG_FILE'):
+        output = logging.FileHandler(os.environ['LOG_FILE'], encoding='utf-8')
+    else:
+        output = logging.StreamHandler(sys.stderr)
+    if os.environ.get('LOG_FORMAT', 'json') == 'text':
+        output.setFormatter(logging.Formatter(
+            '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s', defaults={'request_id': '-'}))
+    else:
+        output.setFormatter(JsonFormatter())
+
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=int(os.environ.get('LOG_QUEUE_SIZE', 10000))))
+    handler.addFilter(RequestContextFilter())
+    limits = dict(DEFAULT_RATE_LIMITS, **_parse_mapping(os.environ.get('LOG_RATE_LIMITS')))
+    handler.addFilter(RateLimitFilter(limits))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+    for name, level in _parse_mapping(os.environ.get('LOG_LEVELS')).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(handler.queue, output)
+    _listener.start()
+    atexit.register(_listener.stop)  # drain what is still queued on shutdown
+    return _listener
+
+def _log_metrics():
+    for reason, count in log_stats.dropped.items():
+        yield 'log_records_dropped_total', {'reason': reason}, count
+
+def init_app(app):
+    """Give every request an id, returned as X-Request-ID, for correlating its log lines"""
+    from metrics import metrics
+    metrics.register_collector(_log_metrics)
+
+    @app.before_request
+    def assign_request_id():
+        g.request_id = request.headers.get('X-Request-ID', '')[:64] or uuid.uuid4().hex
+
+    @app.after_request
+    def return_request_id(response):
+        if 'request_id' in g:
+            response.headers['X-Request-ID'] = g.request_id
+        return response
@@ -1,5 +1,9 @@
 from app import app
 import routes  # noqa: F401
+from ml_models import model_manager
+
+# Each serving process trains once at startup if no models were saved; page views never train
+model_manager.ensure_models()
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8000, debug=True)
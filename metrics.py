@@ -0,0 +1,218 @@
+"""
+Request, SQL, model and cache metrics in the Prometheus text format.
+
+Every worker process keeps its metrics in memory. When METRICS_DIR is set
+(point all gunicorn workers at the same, empty-on-deploy directory) each
+process also writes a snapshot there at most once per second, and /metrics
+sums the snapshots of all workers, so any worker can answer a scrape.
+In-flight gauges of processes that are no longer running are left out.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+FLUSH_INTERVAL = 1.0
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'http_requests_total': ('counter', 'HTTP requests by endpoint, method and status', None),
+    'http_request_duration_seconds': ('histogram', 'HTTP request latency by endpoint', LATENCY_BUCKETS),
+    'http_requests_in_flight': ('gauge', 'HTTP requests currently being handled', None),
+    'db_queries_total': ('counter', 'SQL statements executed, by endpoint', None),
+    'db_query_duration_seconds_total': ('counter', 'Time spent in SQL statements, by endpoint', None),
+    'db_queries_per_request': ('histogram', 'SQL statements per request, by endpoint', QUERY_COUNT_BUCKETS),
+    'model_inference_duration_seconds': ('histogram', 'Model predict() latency by model', LATENCY_BUCKETS),
+    'cache_requests_total': ('counter', 'Cache lookups by cache and result (hit/miss)', None),
+    'email_deliveries_total': ('counter', 'Outbox delivery attempts by resulting status', None),
+    'http_response_bytes_total': ('counter', 'Response body bytes by endpoint, before compression and as sent per encoding', None),
+    'log_records_dropped_total': ('counter', 'Log records dropped by reason (queue_full/rate_limited)', None),
+}
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}  # (name, labels) -> float, or bucket counts + [sum, count] for histograms
+        self._collectors = []
+        self._last_flush = 0.0
+        self.directory = os.environ.get('METRICS_DIR')
+
+    def inc(self, name, amount=1.0, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * len(buckets) + [0.0, 0]
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def register_collector(self, collector):
+        """collector() -> iterable of (name, labels dict, value) read at snapshot time.
+
+        For counters kept by other objects (cache hit counts and the like).
+        """
+        self._collectors.append(collector)
+
+    def snapshot(self):
+        with self._lock:
+            values = {key: list(value) if isinstance(value, list) else value
+                      for key, value in self._values.items()}
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                values[(name, tuple(sorted(labels.items())))] = value
+        return values
+
+    def maybe_flush(self, force=False):
+        """Write this process's snapshot for the other workers (multi-process mode only)"""
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < FLUSH_INTERVAL:
+            return
+        self._last_flush = now
+        records = [[name, list(labels), value] for (name, labels), value in self.snapshot().items()]
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'pid': os.getpid(), 'values': records}, f)
+        os.replace(tmp_path, os.path.join(self.directory, f'metrics_{os.getpid()}.json'))
+
+    def aggregate(self):
+        """Metric values summed over all worker processes"""
+        if not self.directory:
+            return self.snapshot()
+        self.maybe_flush(force=True)
+        totals = {}
+        for filename in os.listdir(self.directory):
+            if not (filename.startswith('metrics_') and filename.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = _process_alive(data['pid'])
+            for name, labels, value in data['values']:
+                if name not in METRICS or (METRICS[name][0] == 'gauge' and not alive):
+                    continue
+                key = (name, tuple(tuple(pair) for pair in labels))
+                if isinstance(value, list):
+                    current = totals.setdefault(key, [0] * len(value))
+                    totals[key] = [a + b for a, b in zip(current, value)]
+                else:
+                    totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        by_name = {}
+        for (name, labels), value in self.aggregate().items():
+            by_name.setdefault(name, []).append((labels, value))
+        lines = []
+        for name, (metric_type, help_text, buckets) in METRICS.items():
+            samples = by_name.get(name)
+            if not samples:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for labels, value in sorted(samples):
+                if metric_type == 'histogram':
+                    for bound, count in zip(buckets, value):
+                        lines.append(f'{name}_bucket{_labels(labels, le=bound)} {count}')
+                    lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {value[-1]}')
+                    lines.append(f'{name}_sum{_labels(labels)} {value[-2]}')
+                    lines.append(f'{name}_count{_labels(labels)} {value[-1]}')
+                else:
+                    lines.append(f'{name}{_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+def _process_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+metrics = MetricsRegistry()
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+def init_app(app, engines):
+    """Instrument every request of `app` and every statement run on `engines`"""
+    from sqlalchemy import event
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_query_time = 0.0
+        metrics.inc('http_requests_in_flight')
+
+    @app.after_request
+    def record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        if 'metrics_started' not in g:
+            return
+        endpoint = _endpoint()
+        status = 500 if exc is not None else g.get('metrics_status', 500)
+        metrics.inc('http_requests_in_flight', -1)
+        metrics.inc('http_requests_total', endpoint=endpoint, method=request.method, status=str(status))
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - g.metrics_started,
+                        endpoint=endpoint)
+        metrics.observe('db_queries_per_request', g.metrics_queries, endpoint=endpoint)
+        if g.metrics_queries:
+            metrics.inc('db_queries_total', g.metrics_queries, endpoint=endpoint)
+            metrics.inc('db_query_duration_seconds_total', g.metrics_query_time, endpoint=endpoint)
+        metrics.maybe_flush()
+
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info['metrics_query_started'] = time.perf_counter()
+
+    def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'metrics_started' in g:
+            g.metrics_queries += 1
+            g.metrics_query_time += time.perf_counter() - conn.info['metrics_query_started']
+
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', start_query_timer)
+        event.listen(engine, 'after_cursor_execute', stop_query_timer)
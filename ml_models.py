@@ -9,12 +9,78 @@ import joblib
 import logging
 import json
 from datetime import datetime, timedelta
-from models import User, QuizAttempt, UserInteraction, UserPrediction
+from sqlalchemy import func, select
+from models import User, QuizAttempt, UserInteraction, UserInteractionDaily, UserPrediction
 from app import db
+from metrics import metrics
+import csv
+import hashlib
 import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: only threads of one process are serialized there
+    fcntl = None
+
+# High-volume per-prediction events; rate limited by log_config (LOG_RATE_LIMITS)
+prediction_logger = logging.getLogger('predictions')
+
+# Trained models are shared between worker processes through this file, saved next to
+# the training CSV in the working directory; MODEL_BACKGROUND_TRAINING=0 never trains at startup
+MODEL_PATH = os.environ.get('MODEL_PATH', 'ml_models.joblib')
+TRAINING_CSV = 'student_quiz_data.csv'
+MODEL_ATTRIBUTES = ('scaler', 'random_forest_model', 'xgboost_model', 'neural_network_model', 'model_version')
+
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock on `path` across threads and worker processes (flock on path + '.lock')"""
+    with _path_locks_guard:
+        thread_lock = _path_locks.setdefault(os.path.abspath(path), threading.Lock())
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(f'{path}.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def append_training_row(row, csv_path=TRAINING_CSV):
+    """Append one attempt to the training CSV (columns in the file's header order)"""
+    with file_lock(csv_path):
+        with open(csv_path, 'a+', newline='', encoding='utf-8') as f:
+            f.seek(0)
+            header = next(csv.reader(f), None)
+            writer = csv.DictWriter(f, fieldnames=header or list(row))
+            if header is None:
+                writer.writeheader()
+            writer.writerow(row)
+
+def training_data_version(*frames):
+    """Model version derived from the training data, so every worker that trains on (or loads
+    models trained on) the same data reports the same version"""
+    digest = hashlib.blake2b(digest_size=8)
+    for frame in frames:
+        digest.update(np.ascontiguousarray(frame, dtype=np.float64).tobytes())
+    return int.from_bytes(digest.digest(), 'big') >> 1
+
+def count_interactions(user_id):
+    """All of a user's interactions, including those retention.py folded into the daily rollup"""
+    raw = select(func.count(UserInteraction.id)).where(UserInteraction.user_id == user_id).scalar_subquery()
+    rolled_up = (select(func.coalesce(func.sum(UserInteractionDaily.count), 0))
+                 .where(UserInteractionDaily.user_id == user_id).scalar_subquery())
+    return db.session.execute(select(raw + rolled_up)).scalar()
 
 class MLModelManager:
-    def __init__(self):
+    def __init__(self, model_path=MODEL_PATH):
+        self.model_path = model_path
         self.random_forest_model = None
         self.xgboost_model = None
         self.neural_network_model = None
@@ -23,6 +89,96 @@ class MLModelManager:
             'avg_score', 'total_attempts', 'time_spent_avg', 'days_since_last_attempt',
             'difficulty_progression', 'interaction_frequency', 'learning_style_encoded'
         ]
+        # Hash of the training data (0 before training), so cached predictions can be revalidated
+        self.model_version = 0
+        self._loaded_mtime = None
+        self._trainer = None
+        self._trainer_lock = threading.Lock()
+        self._training = False
+        self._retrain = False  # new data arrived while training
+
+    def save_models(self, path=None):
+        """Write the fitted scaler and models for other processes (atomically replaced)"""
+        path = path or self.model_path
+        temporary = f'{path}.{os.getpid()}.tmp'
+        joblib.dump({name: getattr(self, name) for name in MODEL_ATTRIBUTES}, temporary)
+        os.replace(temporary, path)
+        self._loaded_mtime = os.path.getmtime(path)
+
+    def load_models(self, path=None):
+        """Adopt the models last saved by any process if the file changed; True when it did"""
+        path = path or self.model_path
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return False
+        if mtime == self._loaded_mtime:
+            return False
+        try:
+            bundle = joblib.load(path)
+        except Exception as e:
+            logging.error(f"Could not load models from {path}: {e}")
+            return False
+        for name in MODEL_ATTRIBUTES:
+            setattr(self, name, bundle[name])
+        self._loaded_mtime = mtime
+        logging.info(f"Loaded models from {path}")
+        return True
+
+    @property
+    def models_ready(self):
+        return self.random_forest_model is not None
+
+    @property
+    def training(self):
+        return self._training
+
+    def train_in_background(self, csv_path=TRAINING_CSV, if_missing=False):
+        """Train from the CSV on one background thread per process.
+
+        A call while that thread runs only makes it train once more when it is
+        done, so any number of requests cause at most one extra training. With
+        `if_missing`, models another process saved in the meantime are used instead.
+        """
+        with self._trainer_lock:
+            if self._training:
+                self._retrain = True
+                return False
+            self._training = True
+            self._trainer = threading.Thread(target=self._train_and_publish, args=(csv_path, if_missing),
+                                             name='model-trainer', daemon=True)
+            self._trainer.start()
+            return True
+
+    def _train_and_publish(self, csv_path, if_missing=False):
+        while True:
+            # Train on a separate instance so requests keep predicting with the current models;
+            # the lock lets one worker process train at a time
+            trainer = MLModelManager(self.model_path)
+            try:
+                with file_lock(self.model_path):
+                    if not (if_missing and os.path.exists(self.model_path)) and trainer.train_from_csv(csv_path):
+                        trainer.save_models()
+                self.load_models()
+            except Exception as e:
+                logging.error(f"Background model training failed: {e}")
+            with self._trainer_lock:
+                if not self._retrain:
+                    self._training = False
+                    return
+                self._retrain = False
+                if_missing = False
+
+    def ensure_models(self):
+        """Use the newest saved models, or start training them when none were saved.
+
+        For process startup only: requests just load_models() and fall back to
+        estimates while there are none. True when models are ready.
+        """
+        self.load_models()
+        if not self.models_ready and os.environ.get('MODEL_BACKGROUND_TRAINING', '1') != '0':
+            self.train_in_background(if_missing=True)
+        return self.models_ready
         
     def prepare_features(self, user_data):
         """Prepare enhanced features for ML models"""
@@ -37,24 +193,27 @@ class MLModelManager:
             time_spent_avg = 0
             days_since_last_attempt = 30  # default
             
-            if user.quiz_attempts:
-                time_spent_avg = np.mean([attempt.time_spent for attempt in user.quiz_attempts])
-                last_attempt = max(user.quiz_attempts, key=lambda x: x.created_at)
-                days_since_last_attempt = (datetime.utcnow() - last_attempt.created_at).days
+            if total_attempts:
+                time_spent_avg = (user.time_spent_sum or 0) / total_attempts
+                if user.last_attempt_at:
+                    days_since_last_attempt = (datetime.utcnow() - user.last_attempt_at).days
             
             # Calculate difficulty progression
             difficulty_progression = 0
-            if len(user.quiz_attempts) >= 2:
+            if total_attempts >= 2:
                 difficulty_levels = {'beginner': 1, 'intermediate': 2, 'advanced': 3}
-                recent_attempts = sorted(user.quiz_attempts, key=lambda x: x.created_at)[-5:]
-                if len(recent_attempts) >= 2:
+                # Newest first: only the last five attempts' levels, not the whole history
+                recent_levels = [level for (level,) in db.session.query(QuizAttempt.difficulty_level)
+                                 .filter_by(user_id=user.id)
+                                 .order_by(QuizAttempt.created_at.desc()).limit(5)]
+                if len(recent_levels) >= 2:
                     difficulty_progression = (
-                        difficulty_levels.get(recent_attempts[-1].difficulty_level, 1) - 
-                        difficulty_levels.get(recent_attempts[0].difficulty_level, 1)
+                        difficulty_levels.get(recent_levels[0], 1) - 
+                        difficulty_levels.get(recent_levels[-1], 1)
                     )
             
             # Calculate interaction frequency
-            interaction_frequency = len(user.interactions) / max(1, days_since_last_attempt)
+            interaction_frequency = count_interactions(user.id) / max(1, days_since_last_attempt)
             
             # Enhanced features from quiz performance
             subject_consistency = 0
@@ -173,6 +332,7 @@ class MLModelManager:
         self.train_random_forest(X_scaled, y)
         self.train_xgboost(X_scaled, y)
         self.train_neural_network(X_scaled, y)
+        self.model_version = training_data_version(X, y)
         
         return True
     
@@ -181,7 +341,8 @@ class MLModelManager:
         if not os.path.exists(csv_path):
             print(f"CSV file {csv_path} not found.")
             return False
-        df = pd.read_csv(csv_path)
+        with file_lock(csv_path):
+            df = pd.read_csv(csv_path)
         # Encode categorical variables
         df['subject'] = df['subject'].astype('category').cat.codes
         df['difficulty'] = df['difficulty'].astype('category').cat.codes
@@ -193,6 +354,7 @@ class MLModelManager:
         self.train_random_forest(X_scaled, y)
         self.train_xgboost(X_scaled, y)
         self.train_neural_network(X_scaled, y)
+        self.model_version = training_data_version(X, y)
         print("Models trained on synthetic student_quiz_data.csv!")
         return True
 
@@ -296,10 +458,15 @@ class MLModelManager:
     
     def predict_score(self, user, difficulty_level='intermediate'):
         """Predict score for a user using all models"""
+        return self.predict_score_with_source(user, difficulty_level)[0]
+
+    def predict_score_with_source(self, user, difficulty_level='intermediate'):
+        """(predictions, True if the trained models produced them rather than the fallback estimates)"""
+        self.load_models()
         try:
             # Check if scaler is fitted
             if not hasattr(self.scaler, 'scale_'):
-                return self.get_default_predictions(user, difficulty_level)
+                return self.get_default_predictions(user, difficulty_level), False
             
             # Prepare user features
             user_features = self.prepare_features([user])
@@ -309,22 +476,25 @@ class MLModelManager:
             
             # Random Forest prediction
             if self.random_forest_model:
-                rf_pred = self.random_forest_model.predict(user_features_scaled)[0]
+                with metrics.timer('model_inference_duration_seconds', model='random_forest'):
+                    rf_pred = self.random_forest_model.predict(user_features_scaled)[0]
                 predictions['random_forest'] = max(0, min(100, rf_pred))
             
             # XGBoost prediction
             if self.xgboost_model:
-                xgb_pred = self.xgboost_model.predict(user_features_scaled)[0]
+                with metrics.timer('model_inference_duration_seconds', model='xgboost'):
+                    xgb_pred = self.xgboost_model.predict(user_features_scaled)[0]
                 predictions['xgboost'] = max(0, min(100, xgb_pred))
             
             # Neural Network prediction
             if self.neural_network_model:
-                nn_pred = self.neural_network_model.predict(user_features_scaled)[0]
+                with metrics.timer('model_inference_duration_seconds', model='neural_network'):
+                    nn_pred = self.neural_network_model.predict(user_features_scaled)[0]
                 predictions['neural_network'] = max(0, min(100, nn_pred))
             
             # If no predictions were made, return defaults
             if not predictions:
-                return self.get_default_predictions(user, difficulty_level)
+                return self.get_default_predictions(user, difficulty_level), False
             
             # Store predictions in database
             for model_type, pred_score in predictions.items():
@@ -338,11 +508,16 @@ class MLModelManager:
             
             db.session.commit()
             
-            return predictions
+            for model_type, pred_score in predictions.items():
+                prediction_logger.info("prediction", extra={'user_id': user.id, 'model': model_type,
+                                                            'score': round(float(pred_score), 2),
+                                                            'difficulty_level': difficulty_level})
+            
+            return predictions, True
             
         except Exception as e:
             logging.error(f"Error in predict_score: {str(e)}")
-            return self.get_default_predictions(user, difficulty_level)
+            return self.get_default_predictions(user, difficulty_level), False
     
     def get_ensemble_prediction(self, user, difficulty_level='intermediate'):
         """Get ensemble prediction from all models"""
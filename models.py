@@ -1,4 +1,5 @@
 from datetime import datetime
+from sqlalchemy import event
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -15,6 +16,15 @@ class User(UserMixin, db.Model):
     college = db.Column(db.String(120), nullable=True)
     age = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Running quiz aggregates, kept in step with quiz_attempt by user_aggregates.record_attempt()
+    # (python user_aggregates.py --repair rebuilds them)
+    attempt_count = db.Column(db.Integer, nullable=True, default=0)
+    score_sum = db.Column(db.Float, nullable=True, default=0.0)
+    time_spent_sum = db.Column(db.Integer, nullable=True, default=0)
+    best_score = db.Column(db.Float, nullable=True)
+    last_attempt_at = db.Column(db.DateTime, nullable=True)
+    last_difficulty = db.Column(db.String(50), nullable=True)
     
     # Relationships
     quiz_attempts = db.relationship('QuizAttempt', backref='user', lazy=True)
@@ -28,12 +38,12 @@ class User(UserMixin, db.Model):
         return check_password_hash(self.password_hash, password)
     
     def get_average_score(self):
-        if not self.quiz_attempts:
+        if not self.attempt_count:
             return 0
-        return sum(attempt.score for attempt in self.quiz_attempts) / len(self.quiz_attempts)
+        return (self.score_sum or 0.0) / self.attempt_count
     
     def get_total_attempts(self):
-        return len(self.quiz_attempts)
+        return self.attempt_count or 0
 
 class Content(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -49,6 +59,10 @@ class Content(db.Model):
     # Relationships
     quiz_questions = db.relationship('QuizQuestion', backref='content', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_content_difficulty_level', 'difficulty_level'),
+    )
+
 class QuizQuestion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content_id = db.Column(db.Integer, db.ForeignKey('content.id'), nullable=False)
@@ -57,6 +71,19 @@ class QuizQuestion(db.Model):
     correct_answer = db.Column(db.String(10), nullable=False)
     difficulty_level = db.Column(db.String(50), nullable=False)
     subject = db.Column(db.String(100), nullable=False)
+    content_hash = db.Column(db.String(40), nullable=True)  # sha1 of (subject, question_text), set by the importer
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_quiz_question_content_hash', 'content_hash', unique=True),
+        db.Index('ix_quiz_question_subject', 'subject'),
+    )
+
+class QuestionSignature(db.Model):
+    question_id = db.Column(db.Integer, db.ForeignKey('quiz_question.id'), primary_key=True)
+    signature = db.Column(db.LargeBinary, nullable=False)  # MinHash values as little-endian uint32
+    near_duplicate_of = db.Column(db.Integer, db.ForeignKey('quiz_question.id'), nullable=True)
+    similarity = db.Column(db.Float, nullable=True)  # estimated Jaccard similarity to near_duplicate_of
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class QuizAttempt(db.Model):
@@ -69,6 +96,10 @@ class QuizAttempt(db.Model):
     difficulty_level = db.Column(db.String(50), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_quiz_attempt_user_id', 'user_id'),
+    )
+
 class UserInteraction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -78,6 +109,10 @@ class UserInteraction(db.Model):
     interaction_metadata = db.Column(db.Text)  # JSON string for additional data
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_user_interaction_user_type', 'user_id', 'interaction_type'),
+    )
+
 class UserPrediction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -88,6 +123,10 @@ class UserPrediction(db.Model):
     accuracy = db.Column(db.Float, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_user_prediction_user_created', 'user_id', 'created_at'),
+    )
+
 class LoginActivity(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -95,6 +134,52 @@ class LoginActivity(db.Model):
     ip_address = db.Column(db.String(45), nullable=True)
     user_agent = db.Column(db.String(256), nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_login_activity_user_id', 'user_id'),
+    )
+
+# Daily per-user rollups of raw rows removed by retention.py (the raw rows go to the archive files)
+class UserInteractionDaily(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    interaction_type = db.Column(db.String(50), nullable=False)
+    content_id = db.Column(db.Integer, db.ForeignKey('content.id'), nullable=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    duration_sum = db.Column(db.Integer, nullable=False, default=0)  # in seconds
+
+    __table_args__ = (
+        db.Index('ix_user_interaction_daily_user_day', 'user_id', 'day'),
+    )
+
+class UserPredictionDaily(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    model_type = db.Column(db.String(50), nullable=False)
+    difficulty_level = db.Column(db.String(50), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    predicted_score_sum = db.Column(db.Float, nullable=False, default=0.0)
+    scored_count = db.Column(db.Integer, nullable=False, default=0)  # predictions with an actual_score
+    actual_score_sum = db.Column(db.Float, nullable=False, default=0.0)
+    accuracy_sum = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        db.Index('ix_user_prediction_daily_user_day', 'user_id', 'day'),
+    )
+
+class LoginActivityDaily(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    first_login = db.Column(db.DateTime, nullable=True)
+    last_login = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_login_activity_daily_user_day', 'user_id', 'day', unique=True),
+    )
+
 class PasswordReset(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -104,3 +189,77 @@ class PasswordReset(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     user = db.relationship('User', backref='password_resets')
+
+class Certificate(db.Model):
+    __tablename__ = 'certificates'
+    id = db.Column(db.Integer, primary_key=True)
+    series_id = db.Column(db.String(10), unique=True, nullable=False)  # 10-digit public ID
+    user_name = db.Column(db.String(80), nullable=False)
+    subject = db.Column(db.String(100), nullable=False)
+    issue_date = db.Column(db.String(20), nullable=False)  # e.g. '23 Jul 2025'
+    expiry_date = db.Column(db.String(20), nullable=False)
+    score = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class EmailOutbox(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'sending', 'sent', 'failed', 'skipped'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # retry time, or lease end while sending
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+class SchemaMigration(db.Model):
+    id = db.Column(db.String(100), primary_key=True)  # e.g. '0001_analyze_after_hot_path_indexes'
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class VersionStamp(db.Model):
+    name = db.Column(db.String(50), primary_key=True)  # 'content_catalog', ...
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class AppSetting(db.Model):
+    name = db.Column(db.String(50), primary_key=True)  # 'certificate_id_key', ...
+    value = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UserRecommendation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    content_id = db.Column(db.Integer, db.ForeignKey('content.id'), nullable=False)
+    rank = db.Column(db.Integer, nullable=False)  # 1-based position in the candidate list
+    score = db.Column(db.Float, nullable=False)
+    catalog_version = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'rank', name='uq_user_recommendation_rank'),
+    )
+
+class CollaborativeRecommendation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    content_id = db.Column(db.Integer, db.ForeignKey('content.id'), nullable=False)
+    rank = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'rank', name='uq_collaborative_recommendation_rank'),
+    )
+
+# Any ORM write to Content invalidates the cached catalog in every process
+@event.listens_for(Content, 'after_insert')
+@event.listens_for(Content, 'after_update')
+@event.listens_for(Content, 'after_delete')
+def _bump_content_catalog(mapper, connection, target):
+    from version_stamps import CONTENT_CATALOG, bump_version
+    bump_version(CONTENT_CATALOG, connection)
@@ -0,0 +1,178 @@
+"""
+Near-duplicate question detection with MinHash signatures and LSH banding.
+
+Each question is shingled (character 5-grams of its text plus options), hashed
+into a 128-value MinHash signature in vectorized NumPy batches, and bucketed
+by 16 bands of 8 rows, which puts pairs above roughly 0.7 Jaccard similarity
+in a shared bucket with high probability. Signatures are stored in
+question_signature so later imports only hash questions that have none.
+
+Usage:
+    python question_dedup.py            # hash new questions and flag near-duplicates
+"""
+
+import heapq
+import json
+import re
+import zlib
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import islice
+import numpy as np
+from sqlalchemy import insert
+from models import QuestionSignature, QuizQuestion
+from app import app, db
+
+MERSENNE_PRIME = (1 << 31) - 1
+
+class MinHasher:
+    def __init__(self, num_perm=128, shingle_size=5, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.integers(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+
+    def shingle_ids(self, text):
+        normalized = re.sub(r'\s+', ' ', text).strip().lower()
+        k = self.shingle_size
+        shingles = {normalized[i:i + k] for i in range(max(1, len(normalized) - k + 1))}
+        return np.fromiter((zlib.crc32(s.encode('utf-8')) & MERSENNE_PRIME for s in shingles),
+                           dtype=np.uint64, count=len(shingles))
+
+    def signatures(self, texts, batch_size=200):
+        """MinHash signatures for many texts as an (n, num_perm) uint32 array"""
+        result = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        for start in range(0, len(texts), batch_size):
+            shingle_sets = [self.shingle_ids(text) for text in texts[start:start + batch_size]]
+            lengths = np.array([len(ids) for ids in shingle_sets])
+            offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            values = np.concatenate(shingle_sets)
+            # (a * x + b) mod p for every permutation and shingle, then min per document
+            hashed = (self.a[:, None] * values[None, :] + self.b[:, None]) % MERSENNE_PRIME
+            result[start:start + len(shingle_sets)] = np.minimum.reduceat(hashed, offsets, axis=1).T
+        return result
+
+class LSHIndex:
+    def __init__(self, bands=16, rows=8, seed=2):
+        self.bands = bands
+        self.rows = rows
+        rng = np.random.default_rng(seed)
+        self.mix = rng.integers(1, 1 << 62, rows, dtype=np.uint64)
+
+    def band_keys(self, signatures):
+        """(n, bands) uint64 bucket keys, one per band"""
+        banded = signatures[:, :self.bands * self.rows].astype(np.uint64).reshape(
+            len(signatures), self.bands, self.rows)
+        return (banded * self.mix).sum(axis=2)  # wraps mod 2**64, fine for bucketing
+
+    def build_buckets(self, keys):
+        """Per band, map bucket key -> row indices in ascending order"""
+        tables = []
+        for band in range(self.bands):
+            buckets = defaultdict(list)
+            for index, key in enumerate(keys[:, band].tolist()):
+                buckets[key].append(index)
+            tables.append(buckets)
+        return tables
+
+    def earliest_match(self, row, keys, tables, signatures, threshold, batch_size=64):
+        """Lowest earlier row sharing a bucket with `row` and similar enough, or None.
+
+        Candidates from all bands are merged in row order and checked in small
+        vectorized batches, so large clusters stop at their first member.
+        """
+        prefixes = []
+        for band, buckets in enumerate(tables):
+            members = buckets[keys[row, band]]
+            prefixes.append(islice(members, bisect_left(members, row)))
+        batch, previous = [], None
+        for candidate in heapq.merge(*prefixes):
+            if candidate == previous:
+                continue
+            previous = candidate
+            batch.append(candidate)
+            if len(batch) == batch_size:
+                match = self._first_similar(row, batch, signatures, threshold)
+                if match is not None:
+                    return match
+                batch = []
+        return self._first_similar(row, batch, signatures, threshold) if batch else None
+
+    def _first_similar(self, row, candidates, signatures, threshold):
+        similarity = (signatures[candidates] == signatures[row]).mean(axis=1)
+        hits = np.flatnonzero(similarity >= threshold)
+        if len(hits):
+            return candidates[hits[0]], float(similarity[hits[0]])
+        return None
+
+def question_text_for_hashing(question_text, options):
+    try:
+        options = json.loads(options)
+    except (json.JSONDecodeError, TypeError):
+        options = []
+    return ' '.join([question_text] + [str(option) for option in options])
+
+def find_near_duplicates(threshold=0.7, hasher=None, index=None):
+    """Hash questions without a stored signature and flag their near-duplicates.
+
+    A new question is flagged against the lowest-id older question (new or
+    existing) whose estimated Jaccard similarity is at least `threshold`.
+    Returns {'hashed': n, 'flagged': m}.
+    """
+    hasher = hasher or MinHasher()
+    index = index or LSHIndex()
+
+    new_rows = db.session.query(
+        QuizQuestion.id, QuizQuestion.question_text, QuizQuestion.options
+    ).outerjoin(
+        QuestionSignature, QuestionSignature.question_id == QuizQuestion.id
+    ).filter(QuestionSignature.question_id.is_(None)).order_by(QuizQuestion.id).all()
+    if not new_rows:
+        return {'hashed': 0, 'flagged': 0}
+
+    new_ids = np.array([row.id for row in new_rows])
+    new_signatures = hasher.signatures(
+        [question_text_for_hashing(row.question_text, row.options) for row in new_rows])
+
+    stored = db.session.query(QuestionSignature.question_id, QuestionSignature.signature).all()
+    stored_ids = np.array([question_id for question_id, _ in stored], dtype=new_ids.dtype)
+    if stored:
+        stored_signatures = np.frombuffer(b''.join(sig for _, sig in stored), dtype='<u4').reshape(
+            len(stored), hasher.num_perm)
+    else:
+        stored_signatures = np.empty((0, hasher.num_perm), dtype=np.uint32)
+
+    # Rows sorted by question id, so "earlier row" means "older question"
+    all_ids = np.concatenate([stored_ids, new_ids])
+    all_signatures = np.vstack([stored_signatures, new_signatures])
+    order = np.argsort(all_ids, kind='stable')
+    all_ids, all_signatures = all_ids[order], all_signatures[order]
+    keys = index.band_keys(all_signatures)
+    tables = index.build_buckets(keys)
+    row_of = {question_id: row for row, question_id in enumerate(all_ids.tolist())}
+
+    records = []
+    flagged = 0
+    for offset, question_id in enumerate(new_ids.tolist()):
+        match = index.earliest_match(row_of[question_id], keys, tables, all_signatures, threshold)
+        if match is not None:
+            flagged += 1
+        records.append({
+            'question_id': question_id,
+            'signature': new_signatures[offset].astype('<u4').tobytes(),
+            'near_duplicate_of': int(all_ids[match[0]]) if match else None,
+            'similarity': match[1] if match else None
+        })
+    for start in range(0, len(records), 5000):
+        db.session.execute(insert(QuestionSignature.__table__), records[start:start + 5000])
+    db.session.commit()
+    return {'hashed': len(records), 'flagged': flagged}
+
+if __name__ == "__main__":
+    with app.app_context():
+        stats = find_near_duplicates()
+        print(f"✅ Hashed {stats['hashed']} new questions, flagged {stats['flagged']} near-duplicates")
+        flagged = QuestionSignature.query.filter(QuestionSignature.near_duplicate_of.isnot(None)).all()
+        for record in flagged[:20]:
+            print(f"   question {record.question_id} ~ {record.near_duplicate_of} ({record.similarity:.2f})")
@@ -1,7 +1,9 @@
 import json
 import random
+from datetime import datetime
 from models import QuizQuestion, QuizAttempt, UserInteraction
 from app import db
+from user_aggregates import record_attempt
 
 class QuizGenerator:
     def __init__(self):
@@ -41,6 +43,7 @@ class QuizGenerator:
                 correct_answers += 1
 
         score = (correct_answers / total_questions) * 100
+        attempted_at = datetime.utcnow()
 
         # Create quiz attempt record
         quiz_attempt = QuizAttempt(
@@ -49,10 +52,13 @@ class QuizGenerator:
             answers=json.dumps(user_answers),
             score=score,
             time_spent=time_spent,
-            difficulty_level=quiz_data['difficulty_level']
+            difficulty_level=quiz_data['difficulty_level'],
+            created_at=attempted_at
         )
 
         db.session.add(quiz_attempt)
+        # Same transaction as the attempt, so the counters never disagree with quiz_attempt
+        record_attempt(db.session, user.id, score, time_spent, quiz_data['difficulty_level'], attempted_at)
 
         # Create user interaction record
         interaction = UserInteraction(
@@ -123,7 +129,15 @@ class QuizGenerator:
         difficulty_breakdown = {}
         subject_performance = {}
 
-        for attempt in attempts:
+        # Look up the subjects of all attempted questions at once instead of one query per question
+        attempt_questions = [json.loads(attempt.questions) for attempt in attempts]
+        question_ids = list({question_id for questions in attempt_questions for question_id in questions})
+        question_subjects = {}
+        for start in range(0, len(question_ids), 500):
+            question_subjects.update(db.session.query(QuizQuestion.id, QuizQuestion.subject).filter(
+                QuizQuestion.id.in_(question_ids[start:start + 500])))
+
+        for attempt, questions in zip(attempts, attempt_questions):
             # Difficulty breakdown
             diff = attempt.difficulty_level
             if diff not in difficulty_breakdown:
@@ -134,11 +148,9 @@ class QuizGenerator:
             ) / difficulty_breakdown[diff]['count']
 
             # Subject performance (from questions)
-            questions = json.loads(attempt.questions)
             for question_id in questions:
-                question = QuizQuestion.query.get(question_id)
-                if question:
-                    subject = question.subject
+                if question_id in question_subjects:
+                    subject = question_subjects[question_id]
                     if subject not in subject_performance:
                         subject_performance[subject] = {'count': 0, 'avg_score': 0}
                     subject_performance[subject]['count'] += 1
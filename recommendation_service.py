@@ -0,0 +1,157 @@
+import json
+import logging
+from collections import namedtuple
+from sqlalchemy import select, union
+from models import QuizAttempt, QuizQuestion, UserInteraction, UserInteractionDaily, UserRecommendation
+from app import db
+from content_manager import CatalogItem, get_content_manager
+from collaborative_recommender import get_collaborative_scores
+from version_stamps import CONTENT_CATALOG, get_version
+
+# Catalog snapshot plus its ranking, so templates can keep using content.title etc.
+ScoredContent = namedtuple('ScoredContent', CatalogItem._fields + ('score', 'rank'))
+
+DIFFICULTY_ORDER = {'beginner': 0, 'intermediate': 1, 'advanced': 2}
+
+class RecommendationService:
+    def __init__(self, max_candidates=100):
+        self.max_candidates = max_candidates
+        self.weights = {'weakness': 0.4, 'unseen': 0.25, 'difficulty': 0.15, 'collaborative': 0.2}
+        # Subjects the user has never been quizzed on are treated as moderately weak
+        self.unexplored_weakness = 0.6
+
+    def target_difficulty(self, predictions):
+        ensemble_score = sum(predictions.values()) / len(predictions) if predictions else 50.0
+        if ensemble_score < 40:
+            return 'beginner'
+        elif ensemble_score < 70:
+            return 'intermediate'
+        return 'advanced'
+
+    def get_subject_scores(self, user):
+        """Average quiz score per subject for a user"""
+        attempts = db.session.query(QuizAttempt.questions, QuizAttempt.score).filter_by(
+            user_id=user.id
+        ).all()
+        attempt_questions = []
+        question_ids = set()
+        for questions, score in attempts:
+            try:
+                ids = [int(qid) for qid in json.loads(questions)]
+            except (json.JSONDecodeError, TypeError, ValueError):
+                continue
+            attempt_questions.append((ids, score))
+            question_ids.update(ids)
+
+        # Resolve all question subjects in a few bulk queries instead of one per question
+        subject_by_question = {}
+        question_ids = list(question_ids)
+        for start in range(0, len(question_ids), 500):
+            chunk = question_ids[start:start + 500]
+            subject_by_question.update(
+                db.session.query(QuizQuestion.id, QuizQuestion.subject).filter(
+                    QuizQuestion.id.in_(chunk)
+                ).all()
+            )
+
+        totals = {}
+        for ids, score in attempt_questions:
+            for subject in {subject_by_question[qid] for qid in ids if qid in subject_by_question}:
+                total, count = totals.get(subject, (0.0, 0))
+                totals[subject] = (total + score, count + 1)
+        return {subject: total / count for subject, (total, count) in totals.items()}
+
+    def get_viewed_content_ids(self, user):
+        # Views older than the retention window only survive in the daily rollup
+        raw = select(UserInteraction.content_id).where(
+            UserInteraction.user_id == user.id,
+            UserInteraction.interaction_type == 'content_view',
+            UserInteraction.content_id.isnot(None)
+        )
+        rolled_up = select(UserInteractionDaily.content_id).where(
+            UserInteractionDaily.user_id == user.id,
+            UserInteractionDaily.interaction_type == 'content_view',
+            UserInteractionDaily.content_id.isnot(None)
+        )
+        return set(db.session.execute(union(raw, rolled_up)).scalars())
+
+    def score_catalog(self, user, predictions):
+        """Score every catalog item for a user; returns [(score, item)] best first"""
+        subject_scores = self.get_subject_scores(user)
+        viewed = self.get_viewed_content_ids(user)
+        target = DIFFICULTY_ORDER.get(self.target_difficulty(predictions), 1)
+        # Offline ALS scores, normalised to [0, 1] against the user's best item
+        collaborative = get_collaborative_scores(user.id)
+        best_collaborative = max(collaborative.values(), default=0.0)
+
+        scored = []
+        for item in get_content_manager().get_catalog():
+            if item.subject in subject_scores:
+                weakness = 1 - min(100.0, max(0.0, subject_scores[item.subject])) / 100
+            else:
+                weakness = self.unexplored_weakness
+            unseen = 0.0 if item.id in viewed else 1.0
+            distance = abs(DIFFICULTY_ORDER.get(item.difficulty_level, 1) - target)
+            difficulty_match = {0: 1.0, 1: 0.5}.get(distance, 0.0)
+            affinity = 0.0
+            if best_collaborative > 0:
+                affinity = max(0.0, collaborative.get(item.id, 0.0)) / best_collaborative
+            score = (self.weights['weakness'] * weakness +
+                     self.weights['unseen'] * unseen +
+                     self.weights['difficulty'] * difficulty_match +
+                     self.weights['collaborative'] * affinity)
+            scored.append((round(score, 4), item))
+        scored.sort(key=lambda pair: (-pair[0], pair[1].id))
+        return scored
+
+    def refresh_candidates(self, user, predictions=None):
+        """Recompute and store the user's precomputed candidate list"""
+        from ml_models import model_manager
+        if predictions is None:
+            predictions = model_manager.get_default_predictions(user)
+        catalog_version = get_version(CONTENT_CATALOG)
+        scored = self.score_catalog(user, predictions)[:self.max_candidates]
+
+        UserRecommendation.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        db.session.bulk_insert_mappings(UserRecommendation, [
+            {
+                'user_id': user.id,
+                'content_id': item.id,
+                'rank': rank,
+                'score': score,
+                'catalog_version': catalog_version
+            }
+            for rank, (score, item) in enumerate(scored, start=1)
+        ])
+        db.session.commit()
+        logging.info(f"Refreshed {len(scored)} recommendation candidates for user {user.id}")
+        return len(scored)
+
+    def get_recommendations(self, user, predictions=None, limit=10, after_rank=0):
+        """Top-k scored content after the given rank (keyset pagination on rank)"""
+        rows = self._load_candidates(user, limit, after_rank)
+        stale = bool(rows) and rows[0].catalog_version != get_version(CONTENT_CATALOG)
+        if stale or (not rows and after_rank == 0):
+            self.refresh_candidates(user, predictions)
+            rows = self._load_candidates(user, limit, after_rank)
+
+        content_mgr = get_content_manager()
+        recommendations = []
+        for row in rows:
+            item = content_mgr.get_catalog_item(row.content_id)
+            if item is not None:
+                recommendations.append(ScoredContent(*item, score=row.score, rank=row.rank))
+        return recommendations
+
+    def _load_candidates(self, user, limit, after_rank):
+        return UserRecommendation.query.filter(
+            UserRecommendation.user_id == user.id,
+            UserRecommendation.rank > after_rank
+        ).order_by(UserRecommendation.rank).limit(limit).all()
+
+recommendation_service = None
+def get_recommendation_service():
+    global recommendation_service
+    if recommendation_service is None:
+        recommendation_service = RecommendationService()
+    return recommendation_service
@@ -0,0 +1,248 @@
+"""
+Retention for the append-only activity tables: user_prediction,
+user_interaction and login_activity.
+
+Raw rows older than the retention window (RETENTION_DAYS, default 90, or
+RETENTION_DAYS_<TABLE> per table) are processed in batches of BATCH_SIZE ids.
+Each batch runs in one short write transaction that:
+  1. appends the raw rows as one gzip member to the table's monthly archive
+     file (<archive dir>/<table>/<table>-YYYY-MM.jsonl.gz, fsynced, never
+     rewritten),
+  2. adds them to the daily per-user rollup (user_prediction_daily,
+     user_interaction_daily, login_activity_daily), and
+  3. deletes them.
+The lock is released between batches, so requests keep writing while a large
+backlog drains. A crash after step 1 only means the next run archives those
+rows again; load_archive() keeps the first copy of each (id, timestamp).
+'enhanced_quiz' interactions are never removed because the prediction
+features are computed from their metadata; the interaction-frequency feature
+counts raw rows plus user_interaction_daily.count (ml_models.count_interactions).
+
+Archived rows stay queryable offline with load_archive() / load_archive_frame().
+
+Usage:
+    python retention.py --dry-run                  # rows each table would roll up
+    python retention.py                            # archive, roll up and delete
+    python retention.py --table login_activity --days 30 --pause 0.05
+    python retention.py --load user_prediction --since 2025-01-01 --output predictions.csv
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+from sqlalchemy import case, delete, func, insert, select, update
+
+DEFAULT_RETENTION_DAYS = int(os.environ.get('RETENTION_DAYS', 90))
+BATCH_SIZE = int(os.environ.get('RETENTION_BATCH_SIZE', 1000))
+KEPT_INTERACTION_TYPES = ('enhanced_quiz',)
+
+class RetentionPolicy:
+    """How one raw table is rolled up: key(row) -> rollup key, values(row) -> {column: (op, value)}"""
+
+    def __init__(self, name, model, timestamp, rollup, key, values, filters=()):
+        self.name = name
+        self.model = model
+        self.timestamp = timestamp
+        self.rollup = rollup
+        self.key = key
+        self.values = values
+        self.filters = filters  # extra WHERE clauses rows must match to be rolled up
+
+    def retention_days(self):
+        return int(os.environ.get(f'RETENTION_DAYS_{self.name.upper()}', DEFAULT_RETENTION_DAYS))
+
+def _policies():
+    from models import (UserPrediction, UserPredictionDaily, UserInteraction, UserInteractionDaily,
+                        LoginActivity, LoginActivityDaily)
+    return {
+        'user_prediction': RetentionPolicy(
+            'user_prediction', UserPrediction, 'created_at', UserPredictionDaily,
+            key=lambda row: {'user_id': row['user_id'], 'day': row['created_at'].date(),
+                             'model_type': row['model_type'], 'difficulty_level': row['difficulty_level']},
+            values=lambda row: {
+                'count': ('add', 1),
+                'predicted_score_sum': ('add', row['predicted_score']),
+                'scored_count': ('add', 0 if row['actual_score'] is None else 1),
+                'actual_score_sum': ('add', row['actual_score'] or 0.0),
+                'accuracy_sum': ('add', row['accuracy'] or 0.0),
+            }),
+        'user_interaction': RetentionPolicy(
+            'user_interaction', UserInteraction, 'created_at', UserInteractionDaily,
+            key=lambda row: {'user_id': row['user_id'], 'day': row['created_at'].date(),
+                             'interaction_type': row['interaction_type'], 'content_id': row['content_id']},
+            values=lambda row: {'count': ('add', 1), 'duration_sum': ('add', row['duration'] or 0)},
+            filters=(UserInteraction.interaction_type.notin_(KEPT_INTERACTION_TYPES),)),
+        'login_activity': RetentionPolicy(
+            'login_activity', LoginActivity, 'login_time', LoginActivityDaily,
+            key=lambda row: {'user_id': row['user_id'], 'day': row['login_time'].date()},
+            values=lambda row: {'count': ('add', 1), 'first_login': ('min', row['login_time']),
+                                'last_login': ('max', row['login_time'])}),
+    }
+
+def _combine(op, current, value):
+    if op == 'add':
+        return current + value
+    if current is None or value is None:
+        return current if value is None else value
+    return min(current, value) if op == 'min' else max(current, value)
+
+def _merge_rollup(conn, table, key, values):
+    """Add one key's totals to its rollup row, creating the row if needed"""
+    where = [table.c[name].is_(None) if value is None else table.c[name] == value
+             for name, value in key.items()]
+    assignments = {}
+    for name, (op, value) in values.items():
+        column = table.c[name]
+        if op == 'add':
+            assignments[name] = column + value
+        elif value is not None:
+            better = column > value if op == 'min' else column < value
+            assignments[name] = case((column.is_(None), value), (better, value), else_=column)
+    if conn.execute(update(table).where(*where).values(**assignments)).rowcount == 0:
+        conn.execute(insert(table).values(**key, **{name: value for name, (op, value) in values.items()}))
+
+def _to_json(row):
+    return json.dumps({name: value.isoformat() if isinstance(value, (date, datetime)) else value
+                       for name, value in row.items()})
+
+def append_archive(archive_dir, policy, rows):
+    """Append rows to their monthly archive files as one gzip member per file; returns the paths"""
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(row[policy.timestamp].strftime('%Y-%m'), []).append(row)
+    directory = os.path.join(archive_dir, policy.name)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for month, month_rows in sorted(by_month.items()):
+        path = os.path.join(directory, f'{policy.name}-{month}.jsonl.gz')
+        payload = ''.join(_to_json(row) + '\n' for row in month_rows).encode('utf-8')
+        with open(path, 'ab') as f:
+            f.write(gzip.compress(payload, mtime=0))
+            f.flush()
+            os.fsync(f.fileno())
+        paths.append(path)
+    return paths
+
+def cutoff_for(policy, days=None, now=None):
+    """Start of the first day that is still kept raw"""
+    days = policy.retention_days() if days is None else days
+    now = now or datetime.utcnow()
+    return datetime.combine((now - timedelta(days=days)).date(), datetime.min.time())
+
+def apply_retention(engine, policy, archive_dir, cutoff=None, batch_size=BATCH_SIZE, pause=0.0, dry_run=False):
+    """Archive, roll up and delete the rows of `policy` older than `cutoff`; returns counts"""
+    table = policy.model.__table__
+    timestamp = table.c[policy.timestamp]
+    cutoff = cutoff or cutoff_for(policy)
+    eligible = [timestamp < cutoff, *policy.filters]
+    if dry_run:
+        with engine.connect() as conn:
+            rows = conn.execute(select(func.count()).select_from(table).where(*eligible)).scalar()
+        return {'table': policy.name, 'cutoff': cutoff, 'eligible': rows}
+
+    rollup = policy.rollup.__table__
+    stats = {'table': policy.name, 'cutoff': cutoff, 'archived': 0, 'rollup_rows': 0, 'batches': 0}
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(select(table).where(*eligible, table.c.id > last_id)
+                                .order_by(table.c.id).limit(batch_size)).mappings().all()
+            if not rows:
+                break
+            append_archive(archive_dir, policy, rows)
+            totals = {}
+            for row in rows:
+                key = policy.key(row)
+                entry = totals.setdefault(tuple(key.items()), {})
+                for name, (op, value) in policy.values(row).items():
+                    entry[name] = (op, _combine(op, entry[name][1], value) if name in entry else value)
+            for key, values in totals.items():
+                _merge_rollup(conn, rollup, dict(key), values)
+            ids = [row['id'] for row in rows]
+            conn.execute(delete(table).where(table.c.id.in_(ids)))
+        last_id = ids[-1]
+        stats['archived'] += len(rows)
+        stats['rollup_rows'] += len(totals)
+        stats['batches'] += 1
+        logging.info(f"Retention {policy.name}: archived and removed {len(rows)} rows up to id {last_id}")
+        if pause:
+            time.sleep(pause)
+    return stats
+
+def load_archive(table_name, archive_dir, since=None, until=None):
+    """Yield archived rows of a table (oldest file first) with the timestamp parsed back.
+
+    since/until are datetimes. A row archived twice by a retried batch is
+    yielded once; it is recognised by (id, timestamp) because SQLite reuses
+    the ids of deleted rows once a table has been emptied.
+    """
+    policy = _policies()[table_name]
+    paths = sorted(glob.glob(os.path.join(archive_dir, table_name, f'{table_name}-*.jsonl.gz')))
+    for path in paths:
+        # Skip whole monthly files outside [since, until)
+        month = os.path.basename(path)[len(table_name) + 1:-len('.jsonl.gz')]
+        if since is not None and month < since.strftime('%Y-%m'):
+            continue
+        if until is not None and month > until.strftime('%Y-%m'):
+            continue
+        # A retried batch lands in the same monthly file, so duplicates are only looked for per file
+        seen = set()
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                row = json.loads(line)
+                identity = (row['id'], row[policy.timestamp])
+                if identity in seen:
+                    continue
+                seen.add(identity)
+                stamp = row[policy.timestamp] = datetime.fromisoformat(row[policy.timestamp])
+                if (since is not None and stamp < since) or (until is not None and stamp >= until):
+                    continue
+                yield row
+
+def load_archive_frame(table_name, archive_dir, since=None, until=None):
+    """load_archive() as a pandas DataFrame"""
+    import pandas as pd
+    return pd.DataFrame(list(load_archive(table_name, archive_dir, since, until)))
+
+def default_archive_dir(app):
+    return os.environ.get('ARCHIVE_DIR', os.path.join(app.instance_path, 'archive'))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Roll up, archive and delete old activity rows')
+    parser.add_argument('--table', action='append', choices=['user_prediction', 'user_interaction', 'login_activity'],
+                        help='only this table (repeatable; default all)')
+    parser.add_argument('--days', type=int, help='retention window in days (default RETENTION_DAYS / 90)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='rows per transaction')
+    parser.add_argument('--pause', type=float, default=0.0, help='seconds to sleep between batches')
+    parser.add_argument('--archive-dir', help='archive directory (default ARCHIVE_DIR or instance/archive)')
+    parser.add_argument('--dry-run', action='store_true', help='only count the rows that would be processed')
+    parser.add_argument('--load', metavar='TABLE', help='read archived rows of TABLE instead')
+    parser.add_argument('--since', type=datetime.fromisoformat, help='with --load: rows at or after this time')
+    parser.add_argument('--until', type=datetime.fromisoformat, help='with --load: rows before this time')
+    parser.add_argument('--output', help='with --load: write the rows to this CSV file')
+    args = parser.parse_args()
+
+    from app import app, db
+    archive_dir = args.archive_dir or default_archive_dir(app)
+    with app.app_context():
+        policies = _policies()
+        if args.load:
+            frame = load_archive_frame(args.load, archive_dir, args.since, args.until)
+            print(f'{len(frame)} archived {args.load} rows')
+            if args.output:
+                frame.to_csv(args.output, index=False)
+                print(f'Wrote {args.output}')
+            else:
+                print(frame.head(20).to_string())
+        else:
+            for name in args.table or list(policies):
+                policy = policies[name]
+                stats = apply_retention(db.engine, policy, archive_dir, cutoff_for(policy, args.days),
+                                        batch_size=args.batch_size,
+                                        pause=args.pause, dry_run=args.dry_run)
+                print(stats)
@@ -1,91 +1,58 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify, session
+from flask import render_template, request, redirect, url_for, flash, jsonify, session, abort, g
 from flask_login import login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 import json
 import time
-import pandas as pd
 import os
 import csv
+import logging
 import secrets
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from random import randint
 
 from app import app, db
-from models import User, Content, QuizAttempt, UserInteraction, QuizQuestion, PasswordReset
-from ml_models import model_manager
+from models import User, QuizAttempt, UserInteraction, QuizQuestion, PasswordReset
+from ml_models import append_training_row, model_manager
 from quiz_generator import quiz_generator
 from content_manager import get_content_manager
-from certificate_generator import CertificateGenerator
-import email_config
+from recommendation_service import get_recommendation_service
+from certificate_generator import CertificateGenerator, CertificateNotSaved
+from certificate_verifier import get_certificate_verifier
+from search_index import get_search_index
+from http_cache import conditional, fragment_cache
+from compression import stream_page
+from metrics import metrics
+from version_stamps import CONTENT_CATALOG, get_stamp, get_last_attempt_stamp
+from email_outbox import enqueue_email, get_outbox_sender
 
 def send_reset_email(user_email, reset_url):
-    """Send password reset email"""
+    """Queue the password reset email (sent by the email outbox worker)"""
     try:
-        # For development, we'll use a simple print instead of actual email
-        print(f"Password reset email would be sent to: {user_email}")
-        print(f"Reset URL: {reset_url}")
-        print("In production, configure SMTP settings to send actual emails")
-        
-        # Check if Gmail is enabled in email_config.py
-        if hasattr(email_config, 'GMAIL_ENABLED') and email_config.GMAIL_ENABLED:
-            try:
-                msg = MIMEMultipart()
-                msg['From'] = email_config.GMAIL_EMAIL
-                msg['To'] = user_email
-                msg['Subject'] = "Password Reset Request - BroderAI Learning Platform"
-                
-                body = f"Hello,\n\nYou have requested a password reset for your BroderAI Learning Platform account.\n\nClick the following link to reset your password:\n{reset_url}\n\nThis link will expire in 1 hour.\n\nIf you didn't request this reset, please ignore this email.\n\nBest regards,\nBroderAI Team"
-                
-                msg.attach(MIMEText(body, 'plain'))
-                
-                server = smtplib.SMTP('smtp.gmail.com', 587)
-                server.starttls()
-                server.login(email_config.GMAIL_EMAIL, email_config.GMAIL_PASSWORD)
-                text = msg.as_string()
-                server.sendmail(email_config.GMAIL_EMAIL, user_email, text)
-                server.quit()
-                
-                print(f"✅ Email sent successfully to {user_email}")
-                return True
-                
-            except Exception as e:
-                print(f"❌ Error sending email via Gmail: {e}")
-                print("📧 Email configuration failed. Check email_config.py settings.")
-                return False
+        if app.debug or not get_outbox_sender().settings.enabled:
+            # Development only: the link is otherwise never written to the logs
+            logging.info(f"Password reset requested for {user_email}: {reset_url}")
         else:
-            print("📧 Gmail not enabled. Update email_config.py to enable email sending.")
-            print("📧 For now, check the console above for the reset link.")
-            return True
-        
+            logging.info(f"Password reset requested for {user_email}")
+        body = f"Hello,\n\nYou have requested a password reset for your BroderAI Learning Platform account.\n\nClick the following link to reset your password:\n{reset_url}\n\nThis link will expire in 1 hour.\n\nIf you didn't request this reset, please ignore this email.\n\nBest regards,\nBroderAI Team"
+        enqueue_email(user_email, "Password Reset Request - BroderAI Learning Platform", body)
+        return True
     except Exception as e:
-        print(f"Error in send_reset_email: {e}")
+        db.session.rollback()
+        logging.error(f"Error in send_reset_email: {e}")
         return False
 
 def send_otp_email(user_email, otp_code):
+    """Queue a login OTP email (sent by the email outbox worker)"""
     try:
-        if hasattr(email_config, 'GMAIL_ENABLED') and email_config.GMAIL_ENABLED:
-            msg = MIMEMultipart()
-            msg['From'] = email_config.GMAIL_EMAIL
-            msg['To'] = user_email
-            msg['Subject'] = "Your OTP for BroderAI Login"
-            body = f"Your OTP for login is: {otp_code}\nThis OTP is valid for 10 minutes."
-            msg.attach(MIMEText(body, 'plain'))
-            server = smtplib.SMTP('smtp.gmail.com', 587)
-            server.starttls()
-            server.login(email_config.GMAIL_EMAIL, email_config.GMAIL_PASSWORD)
-            text = msg.as_string()
-            server.sendmail(email_config.GMAIL_EMAIL, user_email, text)
-            server.quit()
-            print(f"✅ OTP email sent successfully to {user_email}")
-            return True
-        else:
-            print(f"OTP for {user_email}: {otp_code}")
-            return True
+        if app.debug or not get_outbox_sender().settings.enabled:
+            # Development only, so logging in works without SMTP; never logged otherwise
+            logging.info(f"OTP for {user_email}: {otp_code}")
+        body = f"Your OTP for login is: {otp_code}\nThis OTP is valid for 10 minutes."
+        enqueue_email(user_email, "Your OTP for BroderAI Login", body)
+        return True
     except Exception as e:
-        print(f"Error sending OTP email: {e}")
+        db.session.rollback()
+        logging.error(f"Error queueing OTP email: {e}")
         return False
 
 @app.route('/')
@@ -256,31 +223,66 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    """User dashboard with ML predictions and analytics"""
-    # Train models if not already trained
-    if not model_manager.random_forest_model:
-        model_manager.train_all_models()
-    
-    # Get predictions from all models
-    predictions = model_manager.predict_score(current_user)
-    
-    # Get quiz statistics
+    """Dashboard shell; the panels are fetched separately by dashboard.js"""
+    return render_template('dashboard.html', panels=DASHBOARD_PANELS)
+
+def _panel_version(name):
+    """(etag parts, last modified) of a dashboard panel, from version stamps only"""
+    if name not in DASHBOARD_PANELS:
+        abort(404)
+    attempt_id, attempted_at = get_last_attempt_stamp(current_user.id)
+    parts = (current_user.id, name, attempt_id)
+    last_modified = attempted_at
+    if name == 'predictions':
+        model_manager.load_models()  # a stat of the saved models file; picks up other workers' training
+        parts += (model_manager.model_version, model_manager.training)
+    elif name == 'recommendations':
+        catalog_version, catalog_updated_at = get_stamp(CONTENT_CATALOG)
+        parts += (catalog_version,)
+        if catalog_updated_at and (last_modified is None or catalog_updated_at > last_modified):
+            last_modified = catalog_updated_at
+    g.dashboard_panel_key = parts
+    return parts, last_modified
+
+def _render_predictions_panel():
+    # Never train on a page view: without saved models predict_score falls back to estimates
+    # from the user's history until startup, a quiz submission or /api/retrain_models trains them
+    predictions, from_models = model_manager.predict_score_with_source(current_user)
+    return render_template('_dashboard_predictions.html', predictions=predictions, from_models=from_models,
+                           models_ready=model_manager.models_ready, training=model_manager.training)
+
+def _render_stats_panel():
     quiz_stats = quiz_generator.get_quiz_statistics(current_user)
-    
-    # Get recommended content
-    content_mgr = get_content_manager()
-    recommended_content = content_mgr.get_recommended_content(current_user, predictions)
-    
-    # Get recent quiz attempts
+    return render_template('_dashboard_stats.html', quiz_stats=quiz_stats)
+
+def _render_recommendations_panel():
+    # Precomputed candidates; refreshed on quiz submission and catalog changes
+    recommended_content = get_content_manager().get_recommended_content(current_user, None)
+    return render_template('_dashboard_recommendations.html', recommended_content=recommended_content)
+
+def _render_recent_attempts_panel():
     recent_attempts = QuizAttempt.query.filter_by(
         user_id=current_user.id
     ).order_by(QuizAttempt.created_at.desc()).limit(5).all()
-    
-    return render_template('dashboard.html',
-                         predictions=predictions,
-                         quiz_stats=quiz_stats,
-                         recommended_content=recommended_content,
-                         recent_attempts=recent_attempts)
+    return render_template('_dashboard_recent_attempts.html', recent_attempts=recent_attempts)
+
+DASHBOARD_PANELS = {
+    'predictions': _render_predictions_panel,
+    'stats': _render_stats_panel,
+    'recommendations': _render_recommendations_panel,
+    'recent_attempts': _render_recent_attempts_panel,
+}
+
+@app.route('/dashboard/panel/<name>')
+@login_required
+@conditional(_panel_version)
+def dashboard_panel(name):
+    """One dashboard panel as an HTML fragment, cached per user until its version stamps move"""
+    html = fragment_cache.get(current_user.id, name, g.dashboard_panel_key)
+    if html is None:
+        html = DASHBOARD_PANELS[name]()
+        fragment_cache.put(current_user.id, name, g.dashboard_panel_key, html)
+    return html
 
 @app.route('/start_quiz', methods=['GET', 'POST'])
 @login_required
@@ -351,49 +353,66 @@ def submit_quiz():
         'learning_style': current_user.learning_style,
         'skill_level': current_user.skill_level
     }
-    csv_path = 'student_quiz_data.csv'
-    if os.path.exists(csv_path):
-        df = pd.read_csv(csv_path)
-        df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-        df.to_csv(csv_path, index=False)
-    else:
-        pd.DataFrame([new_row]).to_csv(csv_path, index=False)
-    # Retrain model on updated CSV
-    model_manager.train_from_csv(csv_path)
+    append_training_row(new_row)
+    # Retrain on the updated CSV; concurrent submissions share one background training
+    model_manager.train_in_background()
     # --- End CSV/model update ---
     
     # Generate updated predictions based on new data (for next quiz)
     next_predictions = model_manager.predict_score(current_user)
     results['next_predictions'] = next_predictions
     
+    # Refresh the precomputed recommendation candidates for the dashboard
+    get_recommendation_service().refresh_candidates(current_user, next_predictions)
+    
     # Clear session
     session.pop('current_quiz', None)
     session.pop('quiz_start_time', None)
     
-    return render_template('results.html', results=results)
+    return stream_page('results.html', results=results)
+
+def _catalog_version(*args, **kwargs):
+    version, updated_at = get_stamp(CONTENT_CATALOG)
+    return (current_user.id, version), updated_at
+
+def _user_stats_version():
+    attempt_id, attempted_at = get_last_attempt_stamp(current_user.id)
+    return (current_user.id, attempt_id), attempted_at
+
+def _user_predictions_version():
+    attempt_id, attempted_at = get_last_attempt_stamp(current_user.id)
+    model_manager.load_models()  # the version of the newest models any worker saved
+    return (current_user.id, attempt_id, model_manager.model_version), attempted_at
 
 @app.route('/content')
 @login_required
+@conditional(_catalog_version)
 def content():
     """Display available content"""
     difficulty_filter = request.args.get('difficulty', 'all')
+    after_id = request.args.get('after', 0, type=int)
+    limit = max(1, min(request.args.get('limit', 24, type=int), 100))
     
     content_mgr = get_content_manager()
     
-    if difficulty_filter == 'all':
-        content_list = content_mgr.get_all_content()
-    else:
-        content_list = content_mgr.get_content_by_difficulty(difficulty_filter)
+    content_list, next_after = content_mgr.get_content_page(
+        None if difficulty_filter == 'all' else difficulty_filter,
+        after_id=after_id,
+        limit=limit
+    )
     
-    return render_template('content.html', 
-                         content_list=content_list,
-                         current_filter=difficulty_filter)
+    return stream_page('content.html',
+                       content_list=content_list,
+                       current_filter=difficulty_filter,
+                       next_after=next_after)
 
 @app.route('/content/<int:content_id>')
 @login_required
 def view_content(content_id):
     """View specific content"""
-    content_item = Content.query.get_or_404(content_id)
+    content_item = get_content_manager().get_catalog_item(content_id)
+    if content_item is None:
+        abort(404)
     
     # Record user interaction
     interaction = UserInteraction(
@@ -406,10 +425,15 @@ def view_content(content_id):
     db.session.add(interaction)
     db.session.commit()
     
+    return _render_content_detail(content_id, content_item)
+
+@conditional(_catalog_version)
+def _render_content_detail(content_id, content_item):
     return render_template('content_detail.html', content=content_item)
 
 @app.route('/api/model_predictions')
 @login_required
+@conditional(_user_predictions_version)
 def api_model_predictions():
     """API endpoint for real-time model predictions"""
     predictions = model_manager.predict_score(current_user)
@@ -417,6 +441,7 @@ def api_model_predictions():
 
 @app.route('/api/quiz_stats')
 @login_required
+@conditional(_user_stats_version)
 def api_quiz_stats():
     """API endpoint for quiz statistics"""
     stats = quiz_generator.get_quiz_statistics(current_user)
@@ -428,6 +453,8 @@ def api_retrain_models():
     """API endpoint to retrain ML models"""
     try:
         success = model_manager.train_all_models()
+        if success:
+            model_manager.save_models()  # other workers adopt these models and their version
         return jsonify({'success': success})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -436,6 +463,9 @@ def api_retrain_models():
 @login_required
 def download_certificate():
     """Generate and send certificate PDF if score >= 70%"""
+    series_id = request.args.get('series_id', '').strip()
+    if series_id:
+        return _redownload_certificate(series_id)
     subject = request.args.get('subject')
     score = request.args.get('score', type=float)
     if not subject or score is None:
@@ -447,12 +477,35 @@ def download_certificate():
     user_name = current_user.username
     date_str = datetime.now().strftime('%d %b %Y')
     cert_gen = CertificateGenerator()
-    pdf_bytes = cert_gen.generate_certificate(user_name, subject, int(score), date_str)
+    try:
+        pdf_bytes = cert_gen.generate_certificate(user_name, subject, int(score), date_str)
+    except CertificateNotSaved as e:
+        logging.error(str(e))
+        flash('Your certificate could not be issued right now. Please try again.', 'error')
+        return redirect(url_for('dashboard'))
+    return app.response_class(
+        pdf_bytes,
+        mimetype='application/pdf',
+        headers={
+            'Content-Disposition': f'attachment; filename=certificate_{subject}_{user_name}.pdf',
+            'X-Certificate-Series-Id': cert_gen.last_series_id or ''
+        }
+    )
+
+def _redownload_certificate(series_id):
+    """Serve an already issued certificate of the current user from the byte cache"""
+    cert_gen = CertificateGenerator()
+    cert = cert_gen.verify_certificate(series_id)
+    if not cert.get('valid') or cert['user_name'] != current_user.username:
+        flash('Certificate not found.', 'error')
+        return redirect(url_for('dashboard'))
+    pdf_bytes = cert_gen.get_certificate_pdf(series_id)
     return app.response_class(
         pdf_bytes,
         mimetype='application/pdf',
         headers={
-            'Content-Disposition': f'attachment; filename=certificate_{subject}_{user_name}.pdf'
+            'Content-Disposition': f'attachment; filename=certificate_{cert["subject"]}_{cert["user_name"]}.pdf',
+            'X-Certificate-Series-Id': series_id
         }
     )
 
@@ -467,8 +520,7 @@ def verify_search():
             error = 'Please enter a valid numeric Series ID.'
         else:
             try:
-                cert_gen = CertificateGenerator()
-                verification_result = cert_gen.verify_certificate(series_id)
+                verification_result = get_certificate_verifier().verify(series_id)
                 
                 if verification_result.get('valid'):
                     cert_data = verification_result
@@ -478,6 +530,44 @@ def verify_search():
                 error = f'Error verifying certificate: {str(e)}'
     return render_template('verify_search.html', cert_data=cert_data, error=error)
     
+@app.route('/search')
+@login_required
+def search():
+    """Full-text search over content and quiz questions"""
+    query = request.args.get('q', '').strip()
+    search_type = request.args.get('type', 'content')
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    index = get_search_index()
+    started = time.perf_counter()
+    if search_type == 'questions':
+        results = index.search_questions(query, limit) if query else []
+    else:
+        search_type = 'content'
+        results = index.search_content(query, limit) if query else []
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'query': query,
+            'type': search_type,
+            'elapsed_ms': elapsed_ms,
+            'results': [dict(result, snippet=str(result['snippet'])) for result in results]
+        })
+    return render_template('search.html', query=query, search_type=search_type,
+                           results=results, elapsed_ms=elapsed_ms)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus text-format metrics, summed over all workers when METRICS_DIR is set"""
+    token = os.environ.get('METRICS_TOKEN')
+    if token and not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Build the series ID filter and make sure the search index exists once per worker at startup
+with app.app_context():
+    get_certificate_verifier().rebuild()
+    get_search_index()
+
 @app.errorhandler(404)
 def not_found(error):
     return render_template('404.html'), 404
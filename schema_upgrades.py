@@ -0,0 +1,117 @@
+"""
+Schema upgrades for existing databases.
+
+db.create_all() only creates missing tables. upgrade_schema() brings an
+existing database (e.g. instance/adaptive_learning.db) up to the models: it
+creates missing tables, adds nullable columns that were later added to a
+model, creates declared indexes that are missing, and then runs the ordered
+migrations below that have not been applied yet (recorded in
+schema_migration). The app runs it at startup unless AUTO_MIGRATE=0.
+
+Usage:
+    python schema_upgrades.py              # apply pending changes
+    python schema_upgrades.py --dry-run    # only list what would change
+"""
+
+import argparse
+import logging
+import os
+from datetime import datetime
+from sqlalchemy import inspect, insert, select, text
+
+MIGRATIONS = []
+
+def migration(migration_id):
+    """Register a one-off migration; ids sort in the order they must run"""
+    def register(func):
+        MIGRATIONS.append((migration_id, func))
+        return func
+    return register
+
+@migration('0001_analyze_after_hot_path_indexes')
+def analyze_after_hot_path_indexes(conn):
+    """Refresh planner statistics once the user_id/subject/difficulty indexes exist"""
+    conn.execute(text('ANALYZE'))
+
+@migration('0002_backfill_user_quiz_aggregates')
+def backfill_user_quiz_aggregates(conn):
+    """Fill the new User aggregate columns from existing quiz attempts"""
+    from user_aggregates import rebuild
+    rebuild(conn)
+
+@migration('0003_clear_finished_email_bodies')
+def clear_finished_email_bodies(conn):
+    """Drop the OTP codes and reset links kept in outbox rows that were already sent, skipped or failed"""
+    conn.execute(text("UPDATE email_outbox SET body = '' WHERE status IN ('sent', 'skipped', 'failed')"))
+
+def plan_schema_changes(conn, metadata):
+    """[(description, apply(conn))] needed to bring the database up to `metadata`"""
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    changes = []
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            changes.append((f'create table {table.name}',
+                            lambda conn, table=table: table.create(bind=conn, checkfirst=True)))
+            continue
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            if not column.nullable:
+                logging.warning(f"Cannot add NOT NULL column {table.name}.{column.name} automatically")
+                continue
+            column_type = column.type.compile(dialect=conn.dialect)
+            ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+            changes.append((f'add column {table.name}.{column.name}',
+                            lambda conn, ddl=ddl: conn.execute(text(ddl))))
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            columns = ', '.join(column.name for column in index.columns)
+            changes.append((f'create index {index.name} on {table.name} ({columns})',
+                            lambda conn, index=index: index.create(bind=conn, checkfirst=True)))
+    return changes
+
+def upgrade_schema(dry_run=False):
+    """Apply (or with dry_run only list) pending schema changes and migrations"""
+    from app import db
+    from models import SchemaMigration
+    from sqlite_tuning import writer_connection
+
+    with writer_connection(db) as conn:
+        changes = plan_schema_changes(conn, db.metadata)
+        applied = set()
+        if inspect(conn).has_table(SchemaMigration.__tablename__):
+            applied = {migration_id for (migration_id,) in conn.execute(select(SchemaMigration.id))}
+        pending = [(migration_id, func) for migration_id, func in sorted(MIGRATIONS)
+                   if migration_id not in applied]
+        descriptions = [description for description, _ in changes]
+        descriptions += [f'run migration {migration_id}' for migration_id, _ in pending]
+        if dry_run:
+            return descriptions
+
+        for description, apply in changes:
+            apply(conn)
+            logging.info(f"Schema upgrade: {description}")
+        for migration_id, func in pending:
+            func(conn)
+            conn.execute(insert(SchemaMigration.__table__).values(id=migration_id, applied_at=datetime.utcnow()))
+            logging.info(f"Schema upgrade: applied migration {migration_id}")
+    return descriptions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Bring an existing database up to the current models')
+    parser.add_argument('--dry-run', action='store_true', help='only list the pending changes')
+    args = parser.parse_args()
+
+    # Importing the app must not upgrade the database behind our back
+    os.environ['AUTO_MIGRATE'] = '0'
+    from app import app
+    with app.app_context():
+        descriptions = upgrade_schema(dry_run=args.dry_run)
+    if not descriptions:
+        print("✅ Database schema is up to date")
+    for description in descriptions:
+        print(f"{'would ' if args.dry_run else '✅ '}{description}")
@@ -0,0 +1,159 @@
+import logging
+import re
+from markupsafe import Markup, escape
+from sqlalchemy import or_, text
+from models import Content, QuizQuestion
+from app import db
+from sqlite_tuning import writer_connection
+
+# Private-use characters mark hits inside FTS snippets so the text can be escaped safely
+HIT_START = '\ue000'
+HIT_END = '\ue001'
+
+FTS_TABLES = {
+    'content_fts': {
+        'source': 'content',
+        'columns': ['title', 'description', 'tags', 'subject'],
+    },
+    'question_fts': {
+        'source': 'quiz_question',
+        'columns': ['question_text', 'subject'],
+    },
+}
+
+class SearchIndex:
+    """Full-text search over content and questions.
+
+    On SQLite this is backed by FTS5 external-content tables kept in sync with
+    their source tables by triggers, so every insert/update/delete (ORM or bulk)
+    is indexed in the same transaction. Other databases fall back to LIKE matching.
+    """
+
+    def __init__(self):
+        self.fts_enabled = False
+
+    def ensure_index(self):
+        """Create the FTS tables and triggers if needed; builds them on first creation"""
+        if db.engine.dialect.name != 'sqlite':
+            return False
+        try:
+            with writer_connection(db) as conn:
+                existing = {row[0] for row in conn.execute(
+                    text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+                for name, spec in FTS_TABLES.items():
+                    self._create_fts_table(conn, name, spec['source'], spec['columns'],
+                                           rebuild=name not in existing)
+            self.fts_enabled = True
+        except Exception as e:
+            logging.warning(f"FTS5 search index unavailable, falling back to LIKE search: {e}")
+            self.fts_enabled = False
+        return self.fts_enabled
+
+    def _create_fts_table(self, conn, name, source, columns, rebuild):
+        column_list = ', '.join(columns)
+        new_values = ', '.join(f'new.{column}' for column in columns)
+        old_values = ', '.join(f'old.{column}' for column in columns)
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5("
+            f"{column_list}, content='{source}', content_rowid='id', tokenize='porter unicode61')"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {name}_ai AFTER INSERT ON {source} BEGIN "
+            f"INSERT INTO {name}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {name}_ad AFTER DELETE ON {source} BEGIN "
+            f"INSERT INTO {name}({name}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {name}_au AFTER UPDATE ON {source} BEGIN "
+            f"INSERT INTO {name}({name}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO {name}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+        ))
+        if rebuild:
+            conn.execute(text(f"INSERT INTO {name}({name}) VALUES ('rebuild')"))
+            logging.info(f"Built full-text index {name}")
+
+    def rebuild(self):
+        with writer_connection(db) as conn:
+            for name in FTS_TABLES:
+                conn.execute(text(f"INSERT INTO {name}({name}) VALUES ('rebuild')"))
+
+    def _match_expression(self, query):
+        """Turn free text into an FTS5 query: every word must match, as a prefix"""
+        terms = re.findall(r'\w+', query.lower())
+        return ' '.join(f'"{term}"*' for term in terms[:10])
+
+    def _highlight(self, snippet):
+        return Markup(str(escape(snippet or ''))
+                      .replace(HIT_START, '<mark>').replace(HIT_END, '</mark>'))
+
+    def search_content(self, query, limit=20):
+        match = self._match_expression(query)
+        if not match:
+            return []
+        if not self.fts_enabled:
+            return self._like_search(Content, [Content.title, Content.description, Content.tags],
+                                     query, limit, lambda row: (row.title, row.description[:160]))
+        rows = db.session.execute(text(
+            "SELECT c.id, c.title, c.subject, c.difficulty_level, "
+            f"snippet(content_fts, 1, '{HIT_START}', '{HIT_END}', '…', 16) AS snippet, "
+            "bm25(content_fts, 10.0, 1.0, 4.0, 2.0) AS rank "
+            "FROM content_fts JOIN content c ON c.id = content_fts.rowid "
+            "WHERE content_fts MATCH :match ORDER BY rank LIMIT :limit"
+        ), {'match': match, 'limit': limit}).all()
+        return [{
+            'id': row.id,
+            'title': row.title,
+            'subject': row.subject,
+            'difficulty_level': row.difficulty_level,
+            'snippet': self._highlight(row.snippet),
+            'score': -row.rank
+        } for row in rows]
+
+    def search_questions(self, query, limit=20):
+        match = self._match_expression(query)
+        if not match:
+            return []
+        if not self.fts_enabled:
+            return self._like_search(QuizQuestion, [QuizQuestion.question_text], query, limit,
+                                     lambda row: (row.subject, row.question_text[:160]))
+        rows = db.session.execute(text(
+            "SELECT q.id, q.subject, q.difficulty_level, "
+            f"snippet(question_fts, 0, '{HIT_START}', '{HIT_END}', '…', 24) AS snippet, "
+            "bm25(question_fts) AS rank "
+            "FROM question_fts JOIN quiz_question q ON q.id = question_fts.rowid "
+            "WHERE question_fts MATCH :match ORDER BY rank LIMIT :limit"
+        ), {'match': match, 'limit': limit}).all()
+        return [{
+            'id': row.id,
+            'title': row.subject,
+            'subject': row.subject,
+            'difficulty_level': row.difficulty_level,
+            'snippet': self._highlight(row.snippet),
+            'score': -row.rank
+        } for row in rows]
+
+    def _like_search(self, model, columns, query, limit, describe):
+        terms = re.findall(r'\w+', query.lower())[:10]
+        filters = [or_(*[column.ilike(f'%{term}%') for column in columns]) for term in terms]
+        results = []
+        for row in model.query.filter(*filters).limit(limit).all():
+            title, snippet = describe(row)
+            results.append({
+                'id': row.id,
+                'title': title,
+                'subject': row.subject,
+                'difficulty_level': row.difficulty_level,
+                'snippet': escape(snippet),
+                'score': 0.0
+            })
+        return results
+
+search_index = None
+def get_search_index():
+    global search_index
+    if search_index is None:
+        search_index = SearchIndex()
+        search_index.ensure_index()
+    return search_index
@@ -0,0 +1,180 @@
+"""
+Opt-in per-request SQL profiling and N+1 detection.
+
+With SQL_PROFILE=1 (or app.config['SQL_PROFILE']) every statement a request
+runs is captured with its duration and the application line that issued it.
+Statements are grouped by shape (literals and IN-lists collapsed), and any
+shape repeated at least SQL_PROFILE_REPEAT_THRESHOLD times in one request is
+logged as a likely N+1 together with its call site. Each response carries an
+X-SQL-Profile summary header.
+
+Strict mode (SQL_PROFILE_STRICT=1 or app.config['SQL_PROFILE_STRICT'], meant
+for tests) raises QueryBudgetExceeded when a request runs more statements than
+its budget: app.config['SQL_QUERY_BUDGETS'][endpoint], falling back to
+app.config['SQL_QUERY_BUDGET_DEFAULT'] (no limit when neither is set).
+query_budget() applies the same check to any block of code.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+SKIP_FILES = {os.path.abspath(__file__), os.path.join(PACKAGE_DIR, 'metrics.py')}
+
+logger = logging.getLogger('sql_profiler')
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:\?|%\(\w+\)s|:\w+|__\[POSTCOMPILE_\w+\])\s*,?)+\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize_statement(statement):
+    """Shape of a statement: literals become ? and IN-lists of any length look the same"""
+    shape = _STRING_LITERAL.sub('?', statement)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _IN_LIST.sub('IN (...)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+def call_site():
+    """file:line (function) of the innermost application frame running the statement"""
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(PACKAGE_DIR) and filename not in SKIP_FILES and 'site-packages' not in filename:
+            return f'{os.path.relpath(filename, PACKAGE_DIR)}:{frame.lineno} ({frame.name})'
+    return 'unknown'
+
+class QueryLog:
+    def __init__(self):
+        self.groups = OrderedDict()  # shape -> {'count', 'time', 'sites'}
+        self.total = 0
+        self.time = 0.0
+
+    def record(self, statement, duration, site):
+        shape = normalize_statement(statement)
+        group = self.groups.get(shape)
+        if group is None:
+            group = self.groups[shape] = {'count': 0, 'time': 0.0, 'sites': OrderedDict()}
+        group['count'] += 1
+        group['time'] += duration
+        group['sites'][site] = group['sites'].get(site, 0) + 1
+        self.total += 1
+        self.time += duration
+
+    def repeated(self, threshold):
+        return [(shape, group) for shape, group in self.groups.items() if group['count'] >= threshold]
+
+class SQLProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.strict = False
+        self.repeat_threshold = 5
+        self._local = threading.local()
+
+    def _logs(self):
+        """Query logs currently collecting on this thread (request and query_budget blocks)"""
+        if not hasattr(self._local, 'logs'):
+            self._local.logs = []
+        return self._local.logs
+
+    def before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info['sql_profiler_started'] = time.perf_counter()
+
+    def after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        logs = self._logs()
+        if not logs:
+            return
+        duration = time.perf_counter() - conn.info.get('sql_profiler_started', time.perf_counter())
+        site = call_site()
+        for log in logs:
+            log.record(statement, duration, site)
+
+    @contextmanager
+    def collect(self):
+        log = QueryLog()
+        logs = self._logs()
+        logs.append(log)
+        try:
+            yield log
+        finally:
+            logs.remove(log)
+
+    def report_repeated(self, log, label):
+        repeated = log.repeated(self.repeat_threshold)
+        for shape, group in repeated:
+            sites = ', '.join(f'{site} x{count}' for site, count in group['sites'].items())
+            logger.warning(f"Possible N+1 in {label}: {group['count']} x {shape[:200]} "
+                           f"({group['time'] * 1000:.1f} ms) from {sites}")
+        return repeated
+
+profiler = SQLProfiler()
+
+@contextmanager
+def query_budget(max_queries, label='block'):
+    """Fail with QueryBudgetExceeded when the block runs more than max_queries statements.
+
+    Works regardless of SQL_PROFILE, e.g. in tests:
+        with query_budget(12):
+            client.get('/dashboard')
+    """
+    with profiler.collect() as log:
+        yield log
+    if log.total > max_queries:
+        profiler.report_repeated(log, label)
+        raise QueryBudgetExceeded(f'{label} ran {log.total} SQL statements, budget is {max_queries}')
+
+def _budget_for(app, endpoint):
+    budgets = app.config.get('SQL_QUERY_BUDGETS', {})
+    return budgets.get(endpoint, app.config.get('SQL_QUERY_BUDGET_DEFAULT'))
+
+def _flag(app, name):
+    return bool(app.config.get(name)) or os.environ.get(name, '').lower() in ('1', 'true', 'yes')
+
+def init_app(app, engines):
+    """Hook the profiler into `engines`; per-request capture only when SQL_PROFILE is on"""
+    from sqlalchemy import event
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', profiler.before_execute)
+        event.listen(engine, 'after_cursor_execute', profiler.after_execute)
+    profiler.enabled = _flag(app, 'SQL_PROFILE')
+    profiler.strict = _flag(app, 'SQL_PROFILE_STRICT')
+    profiler.repeat_threshold = int(app.config.get(
+        'SQL_PROFILE_REPEAT_THRESHOLD', os.environ.get('SQL_PROFILE_REPEAT_THRESHOLD', 5)))
+
+    @app.before_request
+    def start_sql_profile():
+        if profiler.enabled or profiler.strict:
+            g.sql_profile = profiler.collect()
+            g.sql_profile_log = g.sql_profile.__enter__()
+
+    @app.after_request
+    def finish_sql_profile(response):
+        if 'sql_profile' not in g:
+            return response
+        log = g.sql_profile_log
+        g.pop('sql_profile').__exit__(None, None, None)
+        endpoint = request.endpoint or 'unmatched'
+        repeated = profiler.report_repeated(log, f'{request.method} {request.path}')
+        response.headers['X-SQL-Profile'] = (f'queries={log.total}; time_ms={log.time * 1000:.1f}; '
+                                             f'shapes={len(log.groups)}; repeated={len(repeated)}')
+        logger.info(f'{request.method} {request.path} [{endpoint}] {log.total} queries, '
+                    f'{log.time * 1000:.1f} ms in SQL, {len(repeated)} repeated shapes')
+        budget = _budget_for(app, endpoint)
+        if profiler.strict and budget is not None and log.total > budget:
+            raise QueryBudgetExceeded(f'{endpoint} ran {log.total} SQL statements, budget is {budget}')
+        return response
+
+    @app.teardown_request
+    def discard_sql_profile(exc):
+        # Requests that failed before after_request still have to stop collecting
+        if has_request_context() and 'sql_profile' in g:
+            g.pop('sql_profile').__exit__(None, None, None)
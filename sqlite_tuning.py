@@ -0,0 +1,229 @@
+"""
+Production mode for running on a SQLite file behind several workers.
+
+Every pooled connection gets WAL journaling, synchronous=NORMAL, a larger
+page cache, memory-mapped I/O and a busy timeout, so readers never block the
+writer and a writer waits for the lock instead of failing with
+"database is locked".
+
+Inside each process, writes are serialized through one dedicated writer
+connection (db.engine with a pool of exactly one). Threads queue for it in
+the pool. Reads go to a separate read-only pool. RoutingSession sends a
+session to the writer from its first INSERT/UPDATE/DELETE or flush until the
+transaction ends, so a request still reads its own uncommitted writes.
+Helpers that write with Core statements go through writer_connection(),
+which reuses the session's writer connection instead of queueing behind it.
+
+Enabled for SQLite file databases unless SQLITE_PRODUCTION_MODE=0.
+
+Usage (throughput benchmark, default and production mode side by side):
+    python sqlite_tuning.py --processes 4 --threads 4 --seconds 10
+"""
+
+import os
+import re
+from contextlib import contextmanager
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 10000))
+
+PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}',
+    'PRAGMA cache_size=-32000',   # 32 MB page cache per connection
+    'PRAGMA mmap_size=268435456',  # 256 MB memory-mapped reads
+    'PRAGMA temp_store=MEMORY',
+]
+
+_READ_STATEMENT = re.compile(r'^\s*(SELECT|WITH|EXPLAIN|PRAGMA)\b', re.IGNORECASE)
+
+def production_mode_enabled(database_uri):
+    """True for SQLite file databases unless SQLITE_PRODUCTION_MODE=0"""
+    if os.environ.get('SQLITE_PRODUCTION_MODE', '1') == '0':
+        return False
+    url = make_url(database_uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+def writer_engine_options():
+    """SQLALCHEMY_ENGINE_OPTIONS for the single serialized writer connection"""
+    return {
+        'poolclass': QueuePool,
+        'pool_size': 1,
+        'max_overflow': 0,
+        'pool_timeout': 60,
+        'connect_args': {'timeout': BUSY_TIMEOUT_MS / 1000, 'check_same_thread': False},
+    }
+
+def _apply_pragmas(read_only):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in PRAGMAS:
+            cursor.execute(pragma)
+        if read_only:
+            cursor.execute('PRAGMA query_only=ON')
+        cursor.close()
+    return on_connect
+
+class RoutingSession(Session):
+    """Reads on the read pool, writes (and everything after them) on the writer"""
+
+    reader = None  # set by init_app when production mode is on
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is not None:
+            return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        # Tracked in every mode so writer_connection() knows when to join this transaction
+        if self.info.get('uses_writer') or self._is_write(clause):
+            self.info['uses_writer'] = True
+            return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+        if self.reader is None:
+            return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+        return self.reader
+
+    def _is_write(self, clause):
+        if self._flushing or clause is None:
+            return True  # flushes and bulk_*_mappings() ask for a connection without a statement
+        if getattr(clause, 'is_dml', False):
+            return True
+        if getattr(clause, 'is_text', False):
+            return not _READ_STATEMENT.match(clause.text)
+        return False
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _release_writer(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('uses_writer', None)
+
+@contextmanager
+def writer_connection(db):
+    """A connection for a short write outside the ORM.
+
+    If the request's session already holds the writer (it has flushed or
+    written in the open transaction), its own connection is used and the
+    write commits or rolls back with that transaction. Asking the pool for a
+    second writer connection there would wait for the session to let go,
+    which it never does. Otherwise the write runs in its own transaction,
+    committed on exit.
+    """
+    if db.session.info.get('uses_writer'):
+        yield db.session.connection()
+    else:
+        with db.engine.begin() as conn:
+            yield conn
+
+def init_app(app, db):
+    """Tune the writer engine and start the read pool; call inside an app context"""
+    if not production_mode_enabled(app.config['SQLALCHEMY_DATABASE_URI']):
+        return False
+    event.listen(db.engine, 'connect', _apply_pragmas(read_only=False))
+    reader = create_engine(
+        db.engine.url,
+        pool_size=int(os.environ.get('SQLITE_READ_POOL_SIZE', 8)),
+        max_overflow=8,
+        pool_recycle=300,
+        pool_pre_ping=True,
+        connect_args={'timeout': BUSY_TIMEOUT_MS / 1000, 'check_same_thread': False},
+    )
+    event.listen(reader, 'connect', _apply_pragmas(read_only=True))
+    RoutingSession.reader = reader
+    return True
+
+def database_engines(db):
+    """Every engine the app talks to: the writer (db.engine) and, in production mode, the read pool"""
+    return [db.engine] + ([RoutingSession.reader] if RoutingSession.reader is not None else [])
+
+def _benchmark_worker(seconds, threads, result_queue):
+    """Mixed page-view load: every operation reads a user's attempts and writes an interaction"""
+    import threading
+    import time
+    from app import app, db
+    from models import QuizAttempt, UserInteraction, UserPrediction
+    counts = {'ops': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def run():
+        ops = errors = 0
+        deadline = time.monotonic() + seconds
+        with app.app_context():
+            while time.monotonic() < deadline:
+                try:
+                    user_id = ops % 50 + 1
+                    QuizAttempt.query.filter_by(user_id=user_id).limit(10).all()
+                    db.session.add(UserInteraction(user_id=user_id, interaction_type='content_view',
+                                                   content_id=1, duration=5))
+                    db.session.add(UserPrediction(user_id=user_id, model_type='random_forest',
+                                                  predicted_score=70.0, difficulty_level='beginner'))
+                    db.session.commit()
+                    ops += 1
+                except Exception:
+                    db.session.rollback()
+                    errors += 1
+            db.session.remove()
+        with lock:
+            counts['ops'] += ops
+            counts['errors'] += errors
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    result_queue.put(counts)
+
+def run_benchmark(processes=4, threads=4, seconds=10):
+    """Ops/sec and lock errors for `processes` x `threads` concurrent workers on a scratch DB"""
+    import multiprocessing
+    context = multiprocessing.get_context('fork')
+    result_queue = context.Queue()
+    workers = [context.Process(target=_benchmark_worker, args=(seconds, threads, result_queue))
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    results = [result_queue.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    ops = sum(result['ops'] for result in results)
+    errors = sum(result['errors'] for result in results)
+    return {'ops': ops, 'errors': errors, 'ops_per_sec': ops / seconds}
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import subprocess
+    import sys
+    import tempfile
+
+    parser = argparse.ArgumentParser(description='Concurrent SQLite throughput, default vs production mode')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--mode', choices=['default', 'production'], help='run one mode in this process')
+    args = parser.parse_args()
+
+    if args.mode:
+        # Child run: DATABASE_URL and SQLITE_PRODUCTION_MODE were set by the parent
+        print(json.dumps(run_benchmark(args.processes, args.threads, args.seconds)))
+        sys.exit(0)
+
+    for mode in ('default', 'production'):
+        db_path = os.path.join(tempfile.mkdtemp(), 'concurrency.db')
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}',
+                   SQLITE_PRODUCTION_MODE='1' if mode == 'production' else '0',
+                   PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+        setup = ("from app import app, db\nfrom models import User\n"
+                 "with app.app_context():\n"
+                 "    db.session.add_all([User(username=f'u{i}', email=f'u{i}@example.com', password_hash='x')"
+                 " for i in range(1, 51)])\n"
+                 "    db.session.commit()\n")
+        subprocess.run([sys.executable, '-c', setup], env=env, check=True, capture_output=True)
+        output = subprocess.run(
+            [sys.executable, __file__, '--mode', mode, '--processes', str(args.processes),
+             '--threads', str(args.threads), '--seconds', str(args.seconds)],
+            env=env, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<11} {args.processes} processes x {args.threads} threads: "
+              f"{result['ops_per_sec']:8.1f} ops/sec, {result['errors']} failed with errors")
@@ -2,17 +2,44 @@
 
 let predictionsChart, progressChart, difficultyChart;
 
-function initializeDashboard(data) {
-    // Initialize all charts
-    initializePredictionsChart(data.predictions);
-    initializeProgressChart(data.recentScores);
-    initializeDifficultyChart(data.quizStats);
-    
-    // Setup real-time updates
-    setupRealTimeUpdates();
-    
-    // Setup interactive elements
-    setupInteractiveElements();
+// Fetch each dashboard panel on its own; a slow or failing panel only affects itself
+function loadDashboardPanels() {
+    const panels = document.querySelectorAll('.dashboard-panel[data-panel-url]');
+    const loads = Array.from(panels).map(panel =>
+        fetch(panel.dataset.panelUrl, { credentials: 'same-origin' })
+            .then(response => {
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                return response.text();
+            })
+            .then(html => {
+                panel.innerHTML = html;
+                initializePanel(panel);
+            })
+            .catch(error => {
+                console.error('Error loading dashboard panel:', panel.dataset.panelUrl, error);
+                panel.innerHTML = '<div class="alert alert-warning mb-4">This section could not be loaded. Please refresh the page.</div>';
+            })
+    );
+    Promise.allSettled(loads).then(() => {
+        setupRealTimeUpdates();
+        setupInteractiveElements();
+    });
+}
+
+function initializePanel(panel) {
+    const predictionsHolder = panel.querySelector('[data-predictions]');
+    if (predictionsHolder) {
+        initializePredictionsChart(JSON.parse(predictionsHolder.dataset.predictions));
+    }
+    const statsHolder = panel.querySelector('[data-quiz-stats]');
+    if (statsHolder) {
+        const quizStats = JSON.parse(statsHolder.dataset.quizStats);
+        initializeProgressChart(quizStats.recent_scores || []);
+        initializeDifficultyChart(quizStats);
+    }
+    if (window.feather) {
+        feather.replace();
+    }
 }
 
 function initializePredictionsChart(predictions) {
@@ -0,0 +1,144 @@
+"""
+Fingerprinted, precompressed static assets.
+
+At startup every file under static/ is hashed and given a content-addressed
+name (js/dashboard.js -> js/dashboard.3f2a9c1b7e4d.js). url_for('static',
+filename='js/dashboard.js') keeps working in templates and now returns the
+fingerprinted URL. Those URLs are served with
+"Cache-Control: public, max-age=31536000, immutable", so browsers stop
+revalidating them. A new deploy changes the name whenever the content
+changes.
+
+Text assets (css, js, svg, ...) are compressed once at startup: gzip always,
+brotli too when the brotli package is installed. The variant the client
+accepts is served with Content-Encoding and Vary: Accept-Encoding. Plain
+/static/<file> URLs still work with Flask's default caching. With
+app.debug, edited files are re-fingerprinted on the next url_for.
+STATIC_FINGERPRINT=0 turns the pipeline off.
+
+Usage (list the manifest and the compressed sizes):
+    python static_assets.py
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from flask import make_response, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+MIN_COMPRESS_BYTES = 512
+
+class Asset:
+    def __init__(self, filename, path):
+        self.filename = filename
+        self.path = path
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.mtime = os.path.getmtime(path)
+        self.digest = hashlib.sha256(data).hexdigest()[:12]
+        stem, ext = os.path.splitext(filename)
+        self.fingerprinted = f'{stem}.{self.digest}{ext}'
+        self.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        self.encodings = {}  # 'br' / 'gzip' -> compressed bytes
+        if self.mimetype.startswith(COMPRESSIBLE_TYPES) and len(data) >= MIN_COMPRESS_BYTES:
+            self.encodings['gzip'] = gzip.compress(data, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.encodings['br'] = brotli.compress(data, quality=11)
+        self.size = len(data)
+
+class AssetManifest:
+    def __init__(self, static_folder, check_mtime=False):
+        self.static_folder = static_folder
+        self.check_mtime = check_mtime
+        self._lock = threading.Lock()
+        self.assets = {}  # original filename -> Asset
+        self.by_fingerprint = {}  # fingerprinted filename -> Asset
+        for root, _, files in os.walk(static_folder):
+            for name in files:
+                path = os.path.join(root, name)
+                filename = os.path.relpath(path, static_folder).replace(os.sep, '/')
+                self._add(Asset(filename, path))
+
+    def _add(self, asset):
+        previous = self.assets.get(asset.filename)
+        if previous is not None:
+            self.by_fingerprint.pop(previous.fingerprinted, None)
+        self.assets[asset.filename] = asset
+        self.by_fingerprint[asset.fingerprinted] = asset
+
+    def lookup(self, filename):
+        asset = self.assets.get(filename)
+        if asset is not None and self.check_mtime:
+            try:
+                if os.path.getmtime(asset.path) != asset.mtime:
+                    with self._lock:
+                        asset = Asset(filename, asset.path)
+                        self._add(asset)
+            except OSError:
+                return None
+        return asset
+
+def _preferred_encoding(asset):
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if encoding in asset.encodings and accepted[encoding]:
+            return encoding
+    return None
+
+def init_app(app):
+    """Fingerprint app.static_folder and serve it with immutable caching"""
+    if os.environ.get('STATIC_FINGERPRINT', '1') == '0' or not app.static_folder:
+        return None
+    manifest = AssetManifest(app.static_folder, check_mtime=app.debug)
+    default_static = app.view_functions['static']
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            asset = manifest.lookup(values['filename'])
+            if asset is not None:
+                values['filename'] = asset.fingerprinted
+
+    def static(filename):
+        asset = manifest.by_fingerprint.get(filename)
+        if asset is None:
+            return default_static(filename=filename)
+        etag = asset.digest
+        encoding = _preferred_encoding(asset)
+        if encoding:
+            etag = f'{etag}-{encoding}'
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        elif encoding:
+            response = make_response(asset.encodings[encoding])
+            response.mimetype = asset.mimetype
+            response.headers['Content-Encoding'] = encoding
+        else:
+            response = send_from_directory(app.static_folder, asset.filename, conditional=False, etag=False)
+        response.set_etag(etag)
+        if asset.encodings:
+            response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = static
+    app.extensions['static_assets'] = manifest
+    return manifest
+
+if __name__ == "__main__":
+    static_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    manifest = AssetManifest(static_folder)
+    print(f"{'asset':<40} {'fingerprinted':<48} {'bytes':>8} {'gzip':>8} {'br':>8}")
+    for filename, asset in sorted(manifest.assets.items()):
+        sizes = [str(len(asset.encodings[e])) if e in asset.encodings else '-' for e in ('gzip', 'br')]
+        print(f'{filename:<40} {asset.fingerprinted:<48} {asset.size:>8} {sizes[0]:>8} {sizes[1]:>8}')
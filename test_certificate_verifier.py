@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Certificate verification: the Bloom filter never rejects an issued ID, and
+certificates issued by other workers verify without waiting for a sync.
+"""
+
+from app import db
+from certificate_verifier import BloomFilter, CertificateVerifier
+from models import Certificate
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    bloom = BloomFilter(5000, error_rate=0.01)
+    members = [f'{10**9 + i * 7919}' for i in range(5000)]
+    for key in members:
+        bloom.add(key)
+    assert all(key in bloom for key in members)
+    false_positives = sum(f'other-{i}' in bloom for i in range(20000))
+    assert false_positives / 20000 < 0.03
+
+def test_overfilled_bloom_filter_still_has_no_false_negatives():
+    bloom = BloomFilter(100, error_rate=0.01)
+    members = [f'series-{i}' for i in range(1000)]
+    for key in members:
+        bloom.add(key)
+    assert all(key in bloom for key in members)
+
+def test_certificates_from_other_workers_verify_after_sync(app):
+    with app.app_context():
+        verifier = CertificateVerifier(sync_interval=0.0)
+        assert not verifier.verify('1999999999')['valid']
+        # Inserted without verifier.add(), as another worker process would
+        series_ids = [f'19{i:08d}' for i in range(50)]
+        db.session.add_all([Certificate(series_id=series_id, user_name='Verifier', subject='AI',
+                                        issue_date='01 Jan 2025', expiry_date='01 Jan 2027', score=90)
+                            for series_id in series_ids])
+        db.session.commit()
+        try:
+            assert all(verifier.verify(series_id)['valid'] for series_id in series_ids)
+            assert verifier.verify(series_ids[0])['valid']  # from the LRU
+            assert verifier.get_stats()['lru_hits'] >= 1
+            assert not verifier.verify('1999999999')['valid']
+        finally:
+            Certificate.query.filter(Certificate.series_id.in_(series_ids)).delete()
+            db.session.commit()
+
+def test_certificate_from_another_worker_verifies_before_the_next_sync(app):
+    with app.app_context():
+        verifier = CertificateVerifier(sync_interval=3600.0)
+        assert not verifier.verify('1888888888')['valid']  # builds the filter
+        db.session.add(Certificate(series_id='1888888888', user_name='Verifier', subject='AI',
+                                   issue_date='01 Jan 2025', expiry_date='01 Jan 2027', score=90))
+        db.session.commit()
+        try:
+            assert verifier.verify('1888888888')['valid']
+            assert not verifier.verify('1888888889')['valid']
+        finally:
+            Certificate.query.filter_by(series_id='1888888888').delete()
+            db.session.commit()
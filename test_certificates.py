@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Certificates: the template frame is decoded once, series IDs are a keyed
+bijection that never repeats, and certificates are only handed out under
+series IDs that were stored, one by one or in bulk.
+"""
+
+import zipfile
+import pytest
+from fpdf import FPDF
+
+from app import app, db
+import bulk_certificates
+from certificate_generator import (CertificateGenerator, CertificateNotSaved, CertificateTemplate, SeriesIdAllocator,
+                                   certificate_cache)
+from models import AppSetting, Certificate
+
+def test_template_frame_is_decoded_once_and_drawn_on_every_certificate(monkeypatch):
+    decoded = []
+    parsepng = FPDF._parsepng
+    monkeypatch.setattr(FPDF, '_parsepng', lambda pdf, name: decoded.append(name) or parsepng(pdf, name))
+    template = CertificateTemplate()
+    documents = []
+    for name in ('First Student', 'Second Student'):
+        pdf = template.new_document()
+        CertificateGenerator().add_certificate_details(pdf, '1000000001', name, 'AI', '01 Jan 2025', '01 Jan 2027', 90)
+        pdf.set_compression(False)
+        documents.append((name, pdf.output(dest='S').encode('latin1')))
+    assert decoded == [template.frame_path]
+    for name, pdf_bytes in documents:
+        assert pdf_bytes.startswith(b'%PDF') and b'/Subtype /Image' in pdf_bytes
+        assert name.encode('latin1') in pdf_bytes and b'OF ACHIEVEMENT' in pdf_bytes
+
+def small_domain_allocator(key, domain, half_bits):
+    allocator = SeriesIdAllocator(key=key)
+    allocator.DOMAIN, allocator.HALF_BITS = domain, half_bits
+    return allocator
+
+@pytest.mark.parametrize('domain', [1024, 1000, 600])
+def test_permutation_is_a_bijection_with_cycle_walking(domain):
+    # 2 * 5 bits cover 1024 values; smaller domains walk the cycle back into range
+    allocator = small_domain_allocator('test-key', domain, 5)
+    permuted = [allocator.permute(n) for n in range(domain)]
+    assert sorted(permuted) == list(range(domain))
+    assert permuted != list(range(domain))
+    assert permuted == [allocator.permute(n) for n in range(domain)]
+    assert permuted != [small_domain_allocator('other-key', domain, 5).permute(n) for n in range(domain)]
+
+def test_series_ids_never_repeat_across_allocators(app):
+    with app.app_context():
+        # Two allocators stand in for two worker processes sharing the counter and the stored key
+        first, second = SeriesIdAllocator(block_size=4), SeriesIdAllocator(block_size=4)
+        ids = first.allocate(3) + second.allocate(5) + first.allocate(6)
+        assert len(set(ids)) == len(ids) == 14
+        assert all(len(series_id) == 10 and series_id.isdigit() for series_id in ids)
+        assert first.permute(7) == second.permute(7)
+        stored = db.session.get(AppSetting, 'certificate_id_key').value
+        assert len(stored) == 64 and stored != app.secret_key
+
+def test_unsaved_certificate_is_not_rendered_or_cached(monkeypatch):
+    generator = CertificateGenerator()
+    issued = []
+    monkeypatch.setattr(generator, 'save_certificate_to_db', lambda series_id, *args: issued.append(series_id))
+    with app.app_context():
+        with pytest.raises(CertificateNotSaved):
+            generator.generate_certificate('Unsaved Student', 'AI', 90)
+    assert len(issued) == 3
+    assert all(certificate_cache.get(series_id) is None for series_id in issued)
+    assert generator.last_series_id is None
+
+def test_bulk_insert_reallocates_ids_taken_by_legacy_certificates(monkeypatch):
+    with app.app_context():
+        legacy = bulk_certificates.series_id_allocator.allocate(1)[0]
+        db.session.add(Certificate(series_id=legacy, user_name='Legacy', subject='AI',
+                                   issue_date='01 Jan 2024', expiry_date='01 Jan 2026', score=80))
+        db.session.commit()
+        # The next allocation hands out the legacy ID again, as a random legacy ID could collide
+        allocate = bulk_certificates.series_id_allocator.allocate
+        calls = []
+        def colliding_allocate(count):
+            calls.append(count)
+            ids = allocate(count)
+            return [legacy] + ids[1:] if len(calls) == 1 else ids
+        monkeypatch.setattr(bulk_certificates.series_id_allocator, 'allocate', colliding_allocate)
+        jobs = [{'series_id': series_id, 'user_name': f'Bulk {i}', 'subject': 'AI', 'issue_date': '01 Jan 2025',
+                 'expiry_date': '01 Jan 2027', 'score': 90}
+                for i, series_id in enumerate(colliding_allocate(3))]
+        bulk_certificates.insert_jobs(jobs)
+        assert calls == [3, 1]
+        assert jobs[0]['series_id'] != legacy
+        issued = [job['series_id'] for job in jobs]
+        stored = {c.series_id: c.user_name for c in Certificate.query.filter(Certificate.series_id.in_(issued))}
+        assert stored == {job['series_id']: job['user_name'] for job in jobs}
+        Certificate.query.filter(Certificate.series_id.in_(issued + [legacy])).delete()
+        db.session.commit()
+
+def test_bulk_issue_renders_one_stored_pdf_per_eligible_row(app, tmp_path):
+    rows = [('Cohort Ada', 'AI', '91'), ('Cohort Grace', 'AI', '78'), ('Cohort Alan', 'ML', '85'),
+            ('Cohort Late', 'AI', '40')]
+    output = tmp_path / 'cohort.zip'
+    with app.app_context():
+        # One worker with a window of one, so every further job waits for a finished PDF
+        report = bulk_certificates.issue_certificates(rows, str(output), workers=1, window_per_worker=1)
+        assert (report['issued'], report['skipped']) == (3, 1)
+        with zipfile.ZipFile(output) as archive:
+            pdfs = {name: archive.read(name) for name in archive.namelist()}
+        series_ids = [name.split('_')[1] for name in pdfs]
+        stored = Certificate.query.filter(Certificate.series_id.in_(series_ids)).all()
+        try:
+            assert sorted((c.user_name, c.subject, c.score) for c in stored) == [
+                ('Cohort Ada', 'AI', 91), ('Cohort Alan', 'ML', 85), ('Cohort Grace', 'AI', 78)]
+            assert set(pdfs) == {f"certificate_{c.series_id}_{c.user_name.replace(' ', '_')}_{c.subject}.pdf"
+                                 for c in stored}
+            assert all(pdf.startswith(b'%PDF') for pdf in pdfs.values())
+        finally:
+            Certificate.query.filter(Certificate.series_id.in_(series_ids)).delete()
+            db.session.commit()
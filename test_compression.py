@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Response compression: large HTML/JSON is gzip-encoded for clients that accept
+it, small responses are not, and streamed pages decompress to the same HTML.
+"""
+
+import gzip
+
+def test_large_page_is_gzipped(client):
+    response = client.get('/dashboard', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert int(response.headers['Content-Length']) == len(response.data)
+    assert b'</html>' in gzip.decompress(response.data)
+
+def test_identity_and_small_responses_are_not_compressed(client):
+    response = client.get('/dashboard', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.headers['Vary']
+    small = client.get('/api/model_predictions', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+
+def test_streamed_page_decompresses_to_the_same_html(client):
+    plain = client.get('/content', headers={'Accept-Encoding': 'identity'})
+    assert plain.is_streamed
+    compressed = client.get('/content', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in compressed.headers
+    assert gzip.decompress(compressed.data) == plain.data
+
+def test_flash_on_streamed_page_is_consumed(client):
+    with client.session_transaction() as session:
+        session['_flashes'] = [('info', 'Shown once')]
+    assert b'Shown once' in client.get('/content', headers={'Accept-Encoding': 'identity'}).data
+    assert b'Shown once' not in client.get('/dashboard', headers={'Accept-Encoding': 'identity'}).data
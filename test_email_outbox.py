@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Email outbox: requests only enqueue, and the sender delivers over one reused
+SMTP connection to a local stand-in server, retrying with backoff.
+"""
+
+import socketserver
+import threading
+import pytest
+
+from app import app, db
+from models import EmailOutbox
+from email_outbox import OutboxSender, SMTPSettings, enqueue_email, get_outbox_sender
+
+class StandInSMTP(socketserver.ThreadingTCPServer):
+    """Just enough SMTP for smtplib; rejects the first `fail_first` messages with 451"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, fail_first=0):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.fail_first = fail_first
+        self.connections = 0
+        self.messages = []
+
+class StandInHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply('220 stand-in ready')
+        while True:
+            line = self.rfile.readline().decode('utf-8').strip()
+            command = line[:4].upper()
+            if not line or command == 'QUIT':
+                self.reply('221 bye')
+                return
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 stand-in')
+            elif command == 'DATA':
+                self.reply('354 end with .')
+                lines = []
+                while (data := self.rfile.readline().decode('utf-8')) not in ('.\r\n', ''):
+                    lines.append(data)
+                if server.fail_first > 0:
+                    server.fail_first -= 1
+                    self.reply('451 try again later')
+                else:
+                    server.messages.append(''.join(lines))
+                    self.reply('250 queued')
+            else:  # MAIL, RCPT, RSET, NOOP
+                self.reply('250 ok')
+
+@pytest.fixture
+def smtp_server():
+    server = StandInSMTP()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def make_sender(server):
+    host, port = server.server_address
+    return OutboxSender(app, db, SMTPSettings(host=host, port=port, starttls=False, username='',
+                                              password='', sender='noreply@example.com', enabled=True))
+
+@pytest.fixture(autouse=True)
+def empty_outbox():
+    with app.app_context():
+        EmailOutbox.query.delete()
+        db.session.commit()
+
+def test_forgot_password_only_enqueues(user):
+    response = app.test_client().post('/forgot_password', data={'email': user.email})
+    assert response.status_code == 302
+    email = EmailOutbox.query.filter_by(recipient=user.email).one()
+    assert email.status == 'pending'
+    assert '/reset_password/' in email.body
+
+def test_reset_link_is_not_logged_when_email_is_sent(user, caplog, monkeypatch):
+    monkeypatch.setattr(get_outbox_sender().settings, 'enabled', True)
+    with caplog.at_level('INFO'):
+        app.test_client().post('/forgot_password', data={'email': user.email})
+    assert f'Password reset requested for {user.email}' in caplog.text
+    assert '/reset_password/' not in caplog.text
+
+def test_otp_is_logged_only_while_email_is_disabled(caplog, monkeypatch):
+    from routes import send_otp_email
+    sender_settings = get_outbox_sender().settings
+    with app.app_context(), caplog.at_level('INFO'):
+        monkeypatch.setattr(sender_settings, 'enabled', False)
+        assert send_otp_email('dev@example.com', '246810')
+        monkeypatch.setattr(sender_settings, 'enabled', True)
+        assert send_otp_email('live@example.com', '135791')
+    assert 'OTP for dev@example.com: 246810' in caplog.text
+    assert '135791' not in caplog.text
+
+def test_batch_is_sent_over_one_connection(smtp_server):
+    with app.app_context():
+        for i in range(5):
+            enqueue_email(f'student{i}@example.com', 'Hello', f'Message {i}')
+    sender = make_sender(smtp_server)
+    assert sender.run_once() == {'sent': 5}
+    sender.smtp.close()
+    assert smtp_server.connections == 1
+    assert len(smtp_server.messages) == 5
+    with app.app_context():
+        assert {(email.status, email.body) for email in EmailOutbox.query} == {('sent', '')}
+
+def test_skipped_email_body_is_neither_logged_nor_kept(caplog):
+    with app.app_context():
+        email_id = enqueue_email('skip@example.com', 'Your code', 'OTP 123456').id
+    sender = OutboxSender(app, db, SMTPSettings(enabled=False))
+    with caplog.at_level('INFO'):
+        assert sender.run_once() == {'skipped': 1}
+    assert 'skip@example.com' in caplog.text and '123456' not in caplog.text
+    with app.app_context():
+        assert db.session.get(EmailOutbox, email_id).body == ''
+
+def test_failed_send_is_retried_with_backoff(smtp_server):
+    smtp_server.fail_first = 1
+    with app.app_context():
+        email_id = enqueue_email('retry@example.com', 'Retry', 'Body').id
+    sender = make_sender(smtp_server)
+    assert sender.run_once() == {'pending': 1}
+    with app.app_context():
+        email = db.session.get(EmailOutbox, email_id)
+        assert email.attempts == 1
+        assert email.body == 'Body'  # kept for the retry
+        assert '451' in email.last_error
+        # Not due yet, so a second pass leaves it alone
+        assert sender.run_once() == {}
+        email.next_attempt_at = email.created_at
+        db.session.commit()
+    assert sender.run_once() == {'sent': 1}
+    sender.smtp.close()
+    assert smtp_server.connections == 2  # the connection that failed was not reused
+
+def test_row_taken_over_after_the_lease_ran_out_is_not_sent_again(monkeypatch):
+    with app.app_context():
+        first_id = enqueue_email('first@example.com', 'Slow', 'Body 1').id
+        second_id = enqueue_email('second@example.com', 'Slow', 'Body 2').id
+    sender, other = OutboxSender(app, db, SMTPSettings(enabled=False)), OutboxSender(app, db, SMTPSettings(enabled=False))
+    delivered, taken = [], []
+    def slow_deliver(email):
+        delivered.append(email.id)
+        if len(delivered) == 1:
+            # The first send outlasts the batch lease and another sender claims the rest
+            with db.engine.begin() as conn:
+                conn.execute(EmailOutbox.__table__.update().where(EmailOutbox.__table__.c.id == second_id)
+                             .values(next_attempt_at=EmailOutbox.__table__.c.created_at))
+            with app.app_context():
+                taken.extend(other._claim_batch()[0])
+        return 'sent'
+    monkeypatch.setattr(sender, '_deliver', slow_deliver)
+    assert sender.run_once() == {'sent': 1}
+    assert delivered == [first_id] and taken == [second_id]
+    with app.app_context():
+        assert db.session.get(EmailOutbox, second_id).status == 'sending'
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Structured logging: request context on records, JSON output, sampling, and
+a full queue dropping records instead of blocking.
+"""
+
+import json
+import logging
+import queue
+
+from app import app
+from log_config import (JsonFormatter, NonBlockingQueueHandler, RateLimitFilter,
+                        RequestContextFilter, log_stats)
+
+def make_record(name='routes', msg='hello %s', args=('world',), **extra):
+    record = logging.LogRecord(name, logging.INFO, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+def test_request_id_is_echoed():
+    response = app.test_client().get('/login', headers={'X-Request-ID': 'abc123'})
+    assert response.headers['X-Request-ID'] == 'abc123'
+    assert app.test_client().get('/login').headers['X-Request-ID']
+
+def test_json_record_carries_request_context_and_extra_fields():
+    record = make_record(score=81.5)
+    with app.test_request_context('/login'):
+        from flask import g
+        g.request_id = 'req-1'
+        RequestContextFilter().filter(record)
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['message'] == 'hello world'
+    assert entry['request_id'] == 'req-1'
+    assert entry['route'] == 'login'
+    assert entry['score'] == 81.5
+
+def test_rate_limit_samples_out_and_reports_skipped():
+    limiter = RateLimitFilter({'predictions': 3})
+    kept = [limiter.filter(make_record('predictions.rf')) for _ in range(10)]
+    assert kept.count(True) == 3
+    assert all(limiter.filter(make_record('routes')) for _ in range(10))
+    limiter._windows['predictions'][0] -= 1.0  # next window
+    record = make_record('predictions')
+    assert limiter.filter(record)
+    assert record.sampled_out == 7
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    dropped = log_stats.dropped['queue_full']
+    handler.handle(make_record())
+    handler.handle(make_record())
+    assert handler.queue.qsize() == 1
+    assert log_stats.dropped['queue_full'] == dropped + 1
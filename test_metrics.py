@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Metrics: Prometheus text rendering, summing worker snapshots, and the
+/metrics endpoint.
+"""
+
+import json
+
+from metrics import LATENCY_BUCKETS, MetricsRegistry
+
+def test_counters_and_histograms_render_in_the_text_format():
+    registry = MetricsRegistry()
+    registry.directory = None
+    registry.inc('http_requests_total', endpoint='login', method='GET', status='200')
+    registry.inc('http_requests_total', 2, endpoint='login', method='GET', status='200')
+    registry.inc('cache_requests_total', cache='say "hi"\n', result='hit')
+    for value in (0.003, 0.02, 0.02, 20.0):
+        registry.observe('http_request_duration_seconds', value, endpoint='login')
+    lines = registry.render().splitlines()
+
+    assert lines[:3] == [
+        '# HELP http_requests_total HTTP requests by endpoint, method and status',
+        '# TYPE http_requests_total counter',
+        'http_requests_total{endpoint="login",method="GET",status="200"} 3.0',
+    ]
+    assert 'cache_requests_total{cache="say \\"hi\\"\\n",result="hit"} 1.0' in lines
+    assert '# TYPE http_request_duration_seconds histogram' in lines
+    # Buckets are cumulative and +Inf equals the count
+    buckets = [line for line in lines if line.startswith('http_request_duration_seconds_bucket')]
+    assert len(buckets) == len(LATENCY_BUCKETS) + 1
+    assert buckets[0] == 'http_request_duration_seconds_bucket{endpoint="login",le="0.005"} 1'
+    assert buckets[2] == 'http_request_duration_seconds_bucket{endpoint="login",le="0.025"} 3'
+    assert buckets[-2] == 'http_request_duration_seconds_bucket{endpoint="login",le="10.0"} 3'
+    assert buckets[-1] == 'http_request_duration_seconds_bucket{endpoint="login",le="+Inf"} 4'
+    assert 'http_request_duration_seconds_sum{endpoint="login"} 20.043' in lines
+    assert 'http_request_duration_seconds_count{endpoint="login"} 4' in lines
+    # Metrics without samples are left out
+    assert not any(line.startswith('# HELP email_deliveries_total') for line in lines)
+
+def test_worker_snapshots_are_summed_and_dead_gauges_dropped(tmp_path):
+    registry = MetricsRegistry()
+    registry.directory = str(tmp_path)
+    registry.inc('http_requests_total', endpoint='login', method='GET', status='200')
+    registry.inc('http_requests_in_flight', 1)
+    registry.observe('http_request_duration_seconds', 0.02, endpoint='login')
+    # Another worker's snapshot, written by a process that has exited
+    dead_pid = 2 ** 22 + 1
+    (tmp_path / f'metrics_{dead_pid}.json').write_text(json.dumps({'pid': dead_pid, 'values': [
+        ['http_requests_total', [['endpoint', 'login'], ['method', 'GET'], ['status', '200']], 4.0],
+        ['http_requests_in_flight', [], 7.0],
+        ['http_request_duration_seconds', [['endpoint', 'login']], [0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0.02, 1]],
+    ]}))
+    lines = registry.render().splitlines()
+    assert 'http_requests_total{endpoint="login",method="GET",status="200"} 5.0' in lines
+    assert 'http_requests_in_flight 1.0' in lines
+    assert 'http_request_duration_seconds_count{endpoint="login"} 2' in lines
+    assert 'http_request_duration_seconds_bucket{endpoint="login",le="0.025"} 2' in lines
+
+def test_metrics_endpoint_serves_request_counts(app, monkeypatch):
+    client = app.test_client()
+    client.get('/login')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert 'http_requests_total{endpoint="login",method="GET",status="200"}' in response.get_data(as_text=True)
+
+    monkeypatch.setenv('METRICS_TOKEN', 'scrape-token')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'}).status_code == 200
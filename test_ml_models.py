@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Trained models are saved for other worker processes and trained at most once
+in the background when none exist, never because of a page view.
+"""
+
+import os
+import threading
+import pandas as pd
+import pytest
+
+from ml_models import MLModelManager, append_training_row
+
+@pytest.fixture
+def training_csv(tmp_path):
+    path = tmp_path / 'student_quiz_data.csv'
+    rows = ['user_id,subject,difficulty,score,time_spent,learning_style,skill_level']
+    for i in range(60):
+        rows.append(f"{i},{['AI', 'ML'][i % 2]},{['beginner', 'advanced'][i % 3 == 0]},{40 + i % 50},"
+                    f"{100 + i},{['visual', 'auditory'][i % 2]},beginner")
+    path.write_text('\n'.join(rows) + '\n')
+    return str(path)
+
+def test_background_training_is_published_to_other_processes(tmp_path, training_csv):
+    model_path = str(tmp_path / 'ml_models.joblib')
+    worker = MLModelManager(model_path)
+    assert not worker.models_ready
+    assert worker.train_in_background(training_csv)
+    assert not worker.train_in_background(training_csv)  # one training at a time
+    worker._trainer.join(120)
+    assert worker.models_ready and not worker.training
+    assert os.path.exists(model_path)
+
+    # A fresh worker picks the saved models up instead of training again
+    other = MLModelManager(model_path)
+    assert other.ensure_models()
+    assert not other.training
+    assert other.model_version == worker.model_version
+
+def test_concurrent_appends_keep_the_csv_whole(training_csv):
+    row = {'user_id': 1, 'subject': 'AI', 'difficulty': 'beginner', 'score': 80.0, 'time_spent': 120,
+           'learning_style': 'visual', 'skill_level': 'beginner'}
+    threads = [threading.Thread(target=lambda: [append_training_row(row, training_csv) for _ in range(25)])
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    frame = pd.read_csv(training_csv)
+    assert len(frame) == 60 + 8 * 25
+    assert list(frame.columns) == list(row)
+
+def test_retrain_requests_during_training_coalesce(tmp_path, training_csv, monkeypatch):
+    runs = []
+    release = threading.Event()
+    def slow_train(self, csv_path):
+        runs.append(csv_path)
+        release.wait(30)
+        return False
+    monkeypatch.setattr(MLModelManager, 'train_from_csv', slow_train)
+    worker = MLModelManager(str(tmp_path / 'ml_models.joblib'))
+    assert worker.train_in_background(training_csv)
+    assert not any([worker.train_in_background(training_csv) for _ in range(5)])
+    release.set()
+    for _ in range(300):
+        if not worker.training:
+            break
+        worker._trainer.join(0.1)
+    assert not worker.training
+    assert len(runs) == 2  # the running training plus one for everything requested meanwhile
+
+def test_model_version_is_the_same_in_every_worker(tmp_path, training_csv):
+    first, second = MLModelManager(str(tmp_path / 'a.joblib')), MLModelManager(str(tmp_path / 'b.joblib'))
+    assert first.train_from_csv(training_csv) and second.train_from_csv(training_csv)
+    assert first.model_version == second.model_version != 0
+    append_training_row({'user_id': 1, 'subject': 'AI', 'difficulty': 'beginner', 'score': 80.0,
+                         'time_spent': 120, 'learning_style': 'visual', 'skill_level': 'beginner'}, training_csv)
+    assert second.train_from_csv(training_csv)
+    assert second.model_version != first.model_version
+
+def test_startup_training_uses_models_saved_meanwhile(tmp_path, training_csv, monkeypatch):
+    model_path = str(tmp_path / 'ml_models.joblib')
+    trained = MLModelManager(model_path)
+    assert trained.train_from_csv(training_csv)
+    trained.save_models()
+    runs = []
+    monkeypatch.setattr(MLModelManager, 'train_from_csv', lambda self, csv_path: runs.append(csv_path))
+    worker = MLModelManager(model_path)
+    assert worker.train_in_background(training_csv, if_missing=True)
+    worker._trainer.join(30)
+    assert runs == [] and worker.models_ready
+
+def test_predictions_panel_never_starts_training(client, tmp_path, monkeypatch):
+    from ml_models import model_manager
+    started = []
+    monkeypatch.setenv('MODEL_BACKGROUND_TRAINING', '1')
+    monkeypatch.setattr(model_manager, 'model_path', str(tmp_path / 'missing.joblib'))
+    monkeypatch.setattr(model_manager, 'random_forest_model', None)
+    monkeypatch.setattr(model_manager, 'train_in_background', lambda *args, **kwargs: started.append(args))
+    response = client.get('/dashboard/panel/predictions')
+    assert response.status_code == 200
+    assert 'estimates from your quiz history' in response.get_data(as_text=True)
+    assert started == []
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Query budgets for the main pages, checked with the SQL profiler's strict mode.
+
+Runs against a scratch SQLite database; the budgets must not grow with the
+number of quiz attempts a user has.
+"""
+
+import json
+import pytest
+
+from app import db
+from models import Content, QuizQuestion, QuizAttempt, UserRecommendation
+from sql_profiler import profiler, query_budget, QueryBudgetExceeded
+
+BUDGETS = {
+    'dashboard': 1,
+    'dashboard_panel': 16,  # recommendations rebuild the candidate list on first view
+    'content': 5,
+    'view_content': 8,
+    'api_quiz_stats': 6,
+    'start_quiz': 3,
+}
+
+@pytest.fixture
+def history(user):
+    """A subject with 20 questions and 20 attempts by `user` at it; yields the content id"""
+    content = Content(title='Budget Subject', description='Query budget fixture',
+                      content_type='article', difficulty_level='beginner',
+                      subject='Budget Subject', tags=json.dumps(['budget']))
+    db.session.add(content)
+    db.session.flush()
+    questions = [QuizQuestion(content_id=content.id, question_text=f'Budget question {i}?',
+                              options=json.dumps(['a', 'b', 'c', 'd']), correct_answer='A',
+                              difficulty_level='beginner', subject='Budget Subject')
+                 for i in range(20)]
+    db.session.add_all(questions)
+    db.session.flush()
+    question_ids = [question.id for question in questions]
+    # Enough history that a per-attempt or per-question query would blow the budget
+    db.session.add_all([QuizAttempt(user_id=user.id, questions=json.dumps(question_ids[:15]), answers='[]',
+                                    score=50 + i, time_spent=120, difficulty_level='beginner')
+                        for i in range(20)])
+    db.session.commit()
+    content_id = content.id
+    yield content_id
+    db.session.rollback()
+    QuizAttempt.query.filter_by(user_id=user.id).delete()
+    QuizQuestion.query.filter(QuizQuestion.id.in_(question_ids)).delete()
+    UserRecommendation.query.filter_by(content_id=content_id).delete()
+    db.session.delete(db.session.get(Content, content_id))
+    db.session.commit()
+
+@pytest.fixture(autouse=True)
+def strict_budgets(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'SQL_QUERY_BUDGETS', BUDGETS)
+    monkeypatch.setattr(profiler, 'strict', True)
+    monkeypatch.setattr(app, 'testing', True)
+
+def get(app, client, path):
+    with app.app_context():  # a fresh session per request, as when served
+        return client.get(path)
+
+@pytest.mark.parametrize('path', ['/dashboard', '/dashboard/panel/predictions', '/dashboard/panel/stats',
+                                  '/dashboard/panel/recommendations', '/dashboard/panel/recent_attempts',
+                                  '/content', '/content/{content_id}', '/api/quiz_stats', '/start_quiz'])
+def test_route_within_query_budget(app, client, history, path):
+    response = get(app, client, path.format(content_id=history))
+    assert response.status_code == 200
+    assert 'X-SQL-Profile' in response.headers
+
+def test_query_budget_fails_when_exceeded(app, client, history):
+    with pytest.raises(QueryBudgetExceeded):
+        with query_budget(1):
+            get(app, client, '/api/quiz_stats')
+
+def test_authenticated_requests_reuse_cached_user(app, client, history):
+    get(app, client, '/api/quiz_stats')
+    with profiler.collect() as log:
+        assert get(app, client, '/api/quiz_stats').status_code == 200
+    user_lookups = [shape for shape in log.groups if 'FROM user WHERE user.id' in shape]
+    assert not user_lookups, user_lookups
+
+def test_dashboard_panels_are_served_from_fragment_cache(app, client, history):
+    get(app, client, '/dashboard/panel/stats')
+    with query_budget(1, 'cached stats panel'):  # only the version stamp lookup
+        assert get(app, client, '/dashboard/panel/stats').status_code == 200
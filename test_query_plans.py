@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+EXPLAIN QUERY PLAN checks for the hot queries, so a full table scan or an
+extra sort never sneaks back in when an index or a query changes.
+"""
+
+import pytest
+
+from sqlalchemy import select
+from app import app, db
+from models import (QuizAttempt, UserInteraction, UserPrediction, QuizQuestion, Content,
+                    LoginActivity, Certificate, UserRecommendation)
+
+with app.app_context():
+    DIALECT = db.engine.dialect
+if DIALECT.name != 'sqlite':
+    pytest.skip('query plans are checked on SQLite', allow_module_level=True)
+
+# name -> (statement, whether its ORDER BY must come straight from an index)
+HOT_QUERIES = {
+    'quiz_attempts_by_user': (
+        select(QuizAttempt).where(QuizAttempt.user_id == 1), False),
+    'last_attempt_stamp': (
+        select(QuizAttempt.id, QuizAttempt.created_at).where(QuizAttempt.user_id == 1)
+        .order_by(QuizAttempt.id.desc()).limit(1), True),
+    'enhanced_interactions': (
+        select(UserInteraction).where(UserInteraction.user_id == 1,
+                                      UserInteraction.interaction_type == 'enhanced_quiz'), False),
+    'viewed_content': (
+        select(UserInteraction.content_id).where(UserInteraction.user_id == 1,
+                                                 UserInteraction.interaction_type == 'content_view',
+                                                 UserInteraction.content_id.isnot(None)).distinct(), False),
+    'pending_predictions': (
+        select(UserPrediction).where(UserPrediction.user_id == 1, UserPrediction.actual_score.is_(None))
+        .order_by(UserPrediction.created_at.desc()).limit(3), True),
+    'questions_by_subject': (
+        select(QuizQuestion).where(QuizQuestion.subject == 'AI'), False),
+    'question_by_content_hash': (
+        select(QuizQuestion.id).where(QuizQuestion.content_hash == 'abc'), False),
+    'content_by_difficulty': (
+        select(Content).where(Content.difficulty_level == 'beginner'), False),
+    'logins_by_user': (
+        select(LoginActivity).where(LoginActivity.user_id == 1), False),
+    'certificate_by_series_id': (
+        select(Certificate).where(Certificate.series_id == '1234567890'), False),
+    'recommendations_by_user': (
+        select(UserRecommendation).where(UserRecommendation.user_id == 1)
+        .order_by(UserRecommendation.rank), True),
+}
+
+def query_plan(statement):
+    sql = str(statement.compile(dialect=DIALECT, compile_kwargs={'literal_binds': True}))
+    with db.engine.connect() as conn:
+        return [row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql)]
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_query_uses_index(name):
+    statement, ordered_by_index = HOT_QUERIES[name]
+    with app.app_context():
+        plan = query_plan(statement)
+    scans = [step for step in plan if step.startswith('SCAN')]
+    assert not scans, f'{name} scans instead of searching an index: {plan}'
+    if ordered_by_index:
+        assert not any('TEMP B-TREE' in step for step in plan), f'{name} sorts its results: {plan}'
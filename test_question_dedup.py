@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate questions: MinHash estimates Jaccard similarity, and LSH only
+matches earlier questions at or above the threshold.
+"""
+
+import numpy as np
+
+from question_dedup import LSHIndex, MinHasher
+
+BASE = ('Which activation function outputs values between zero and one and is commonly used '
+        'in the output layer of a binary classifier? Sigmoid Tanh ReLU Softmax')
+NEAR = BASE.replace('commonly', 'typically')
+FAR = ('What does the learning rate control in gradient descent when training a neural '
+       'network? Step size Batch size Number of layers Dropout')
+
+def jaccard(hasher, first, second):
+    a, b = set(hasher.shingle_ids(first).tolist()), set(hasher.shingle_ids(second).tolist())
+    return len(a & b) / len(a | b)
+
+def test_minhash_estimates_jaccard_similarity():
+    hasher = MinHasher()
+    texts = [BASE, NEAR, FAR, '  which ACTIVATION function ' + BASE[len('Which activation function '):]]
+    signatures = hasher.signatures(texts)
+    assert signatures.shape == (4, hasher.num_perm) and signatures.dtype == np.uint32
+    for other in (1, 2):
+        estimate = (signatures[0] == signatures[other]).mean()
+        assert abs(estimate - jaccard(hasher, texts[0], texts[other])) < 0.15
+    # Case and whitespace are normalized away
+    assert (signatures[0] == signatures[3]).all()
+
+def test_lsh_matches_only_earlier_questions_above_the_threshold():
+    hasher, index = MinHasher(), LSHIndex()
+    texts = [FAR, BASE, NEAR, BASE.upper()]
+    signatures = hasher.signatures(texts)
+    keys = index.band_keys(signatures)
+    tables = index.build_buckets(keys)
+    assert jaccard(hasher, BASE, NEAR) >= 0.7 > jaccard(hasher, BASE, FAR)
+
+    assert index.earliest_match(0, keys, tables, signatures, 0.7) is None
+    assert index.earliest_match(1, keys, tables, signatures, 0.7) is None  # FAR is not similar
+    match, similarity = index.earliest_match(2, keys, tables, signatures, 0.7)
+    assert match == 1 and similarity >= 0.7
+    # An exact duplicate points at the lowest earlier copy
+    assert index.earliest_match(3, keys, tables, signatures, 0.7) == (1, 1.0)
+    # Sharing a bucket is not enough: candidates below the threshold are dropped
+    assert index.earliest_match(2, keys, tables, signatures, 0.999) is None
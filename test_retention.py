@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Retention: old activity rows are archived, rolled up per user and day, and
+deleted in batches; the archive stays readable offline.
+"""
+
+from datetime import datetime, timedelta
+import pytest
+
+from app import db
+from models import (Content, UserPrediction, UserPredictionDaily, UserInteraction,
+                    UserInteractionDaily, LoginActivity, LoginActivityDaily)
+from ml_models import count_interactions
+from recommendation_service import get_recommendation_service
+from retention import _policies, append_archive, apply_retention, load_archive
+
+OLD = datetime(2024, 3, 5, 9, 0)
+CUTOFF = datetime(2024, 6, 1)
+
+@pytest.fixture
+def activity(user):
+    """Five old predictions, content views and logins of `user`, plus rows retention keeps"""
+    content = Content(title='Retention', description='Retention fixture', content_type='article',
+                      difficulty_level='beginner', subject='Retention')
+    db.session.add(content)
+    db.session.flush()
+    for minutes in range(5):
+        at = OLD + timedelta(minutes=minutes)
+        db.session.add(UserPrediction(user_id=user.id, model_type='xgboost', predicted_score=60 + minutes,
+                                      difficulty_level='beginner', created_at=at))
+        db.session.add(UserInteraction(user_id=user.id, interaction_type='content_view',
+                                       content_id=content.id, duration=30, created_at=at))
+        db.session.add(LoginActivity(user_id=user.id, login_time=at))
+    db.session.add(UserInteraction(user_id=user.id, interaction_type='enhanced_quiz',
+                                   interaction_metadata='{}', created_at=OLD))
+    db.session.add(UserPrediction(user_id=user.id, model_type='xgboost', predicted_score=80,
+                                  difficulty_level='beginner', created_at=CUTOFF + timedelta(days=1)))
+    db.session.commit()
+    yield content
+    db.session.rollback()
+    for model in (UserInteraction, UserInteractionDaily):
+        model.query.filter_by(content_id=content.id).delete()
+    Content.query.filter_by(id=content.id).delete()
+    db.session.commit()
+
+def test_old_rows_are_archived_rolled_up_and_deleted(user, activity, tmp_path):
+    policies = _policies()
+    interactions_before = count_interactions(user.id)
+    for name in ('user_prediction', 'user_interaction', 'login_activity'):
+        stats = apply_retention(db.engine, policies[name], str(tmp_path), cutoff=CUTOFF, batch_size=2)
+        assert stats['archived'] >= 5
+        assert stats['batches'] >= 3
+
+    assert [p.predicted_score for p in UserPrediction.query.filter_by(user_id=user.id)] == [80]
+    assert [i.interaction_type for i in UserInteraction.query.filter_by(user_id=user.id)] == ['enhanced_quiz']
+    assert LoginActivity.query.filter_by(user_id=user.id).count() == 0
+
+    prediction_rollup = UserPredictionDaily.query.filter_by(user_id=user.id).one()
+    assert (prediction_rollup.day, prediction_rollup.count, prediction_rollup.predicted_score_sum) == (OLD.date(), 5, 310)
+    view_rollup = UserInteractionDaily.query.filter_by(user_id=user.id).one()
+    assert (view_rollup.count, view_rollup.duration_sum, view_rollup.content_id) == (5, 150, activity.id)
+    login_rollup = LoginActivityDaily.query.filter_by(user_id=user.id).one()
+    assert (login_rollup.count, login_rollup.first_login, login_rollup.last_login) == (
+        5, OLD, OLD + timedelta(minutes=4))
+
+    # Rolled-up views still count toward the model features and as seen for recommendations
+    assert count_interactions(user.id) == interactions_before == 6
+    assert activity.id in get_recommendation_service().get_viewed_content_ids(user)
+
+    archived = [row for row in load_archive('user_prediction', str(tmp_path)) if row['user_id'] == user.id]
+    assert sorted(row['predicted_score'] for row in archived) == [60, 61, 62, 63, 64]
+    assert archived[0]['created_at'].date() == OLD.date()
+    assert list(load_archive('user_prediction', str(tmp_path), since=CUTOFF)) == []
+
+def test_reloading_a_batch_archived_twice_yields_each_row_once(user, tmp_path):
+    policy = _policies()['login_activity']
+    rows = [{'id': 1, 'user_id': user.id, 'login_time': OLD, 'ip_address': None, 'user_agent': None}]
+    append_archive(str(tmp_path), policy, rows)
+    append_archive(str(tmp_path), policy, rows)  # a batch retried after a crash
+    assert len(list(load_archive('login_activity', str(tmp_path)))) == 1
+
+def test_reused_ids_are_not_mistaken_for_duplicates(user, tmp_path):
+    policy = _policies()['login_activity']
+    first = {'id': 1, 'user_id': user.id, 'login_time': OLD, 'ip_address': None, 'user_agent': None}
+    # After the table was emptied SQLite hands out id 1 again
+    reused = dict(first, login_time=OLD + timedelta(days=2))
+    append_archive(str(tmp_path), policy, [first])
+    append_archive(str(tmp_path), policy, [reused])
+    assert [row['login_time'] for row in load_archive('login_activity', str(tmp_path))] == [
+        OLD, OLD + timedelta(days=2)]
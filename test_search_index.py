@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Full-text search: the FTS5 index follows inserts, updates and deletes of its
+source tables, whether they come from the ORM or bulk statements.
+"""
+
+import pytest
+from sqlalchemy import insert
+
+from app import db
+from models import Content, QuizQuestion
+from search_index import get_search_index
+
+@pytest.fixture
+def index(app):
+    with app.app_context():
+        index = get_search_index()
+        if not index.fts_enabled:
+            pytest.skip('FTS5 is not available')
+        yield index
+
+def content_ids(index, query):
+    return [row['id'] for row in index.search_content(query)]
+
+def test_content_index_follows_insert_update_and_delete(index):
+    content = Content(title='Zygomorphic flowers', description='Bilateral symmetry in botany',
+                      content_type='article', difficulty_level='beginner', subject='Botany')
+    db.session.add(content)
+    db.session.commit()
+    assert content_ids(index, 'zygomorphic') == [content.id]
+    assert content_ids(index, 'zygomorph') == [content.id]  # prefix match
+
+    content.title = 'Xerophytic plants'
+    db.session.commit()
+    assert content_ids(index, 'zygomorphic') == []
+    assert content_ids(index, 'xerophytic') == [content.id]
+    assert content_ids(index, 'bilateral symmetry') == [content.id]
+
+    db.session.delete(content)
+    db.session.commit()
+    assert content_ids(index, 'xerophytic') == []
+
+def test_bulk_inserted_questions_are_searchable(index):
+    content = Content(title='Search fixture', description='Questions for the FTS test',
+                      content_type='article', difficulty_level='beginner', subject='Botany')
+    db.session.add(content)
+    db.session.flush()
+    db.session.execute(insert(QuizQuestion.__table__), [
+        {'content_id': content.id, 'question_text': f'Which quillwort species number {i} grows underwater?',
+         'options': '[]', 'correct_answer': 'A', 'difficulty_level': 'beginner', 'subject': 'Botany'}
+        for i in range(3)])
+    db.session.commit()
+    try:
+        assert len(index.search_questions('quillwort underwater')) == 3
+        snippet = index.search_questions('quillwort')[0]['snippet']
+        assert '<mark>quillwort</mark>' in snippet
+    finally:
+        QuizQuestion.query.filter_by(content_id=content.id).delete()
+        db.session.delete(content)
+        db.session.commit()
+    assert index.search_questions('quillwort') == []
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Core-level writes made while the request session holds the single writer
+connection join its transaction instead of waiting for the pool.
+"""
+
+import threading
+
+from app import app, db
+from models import VersionStamp
+from version_stamps import get_version, reserve_sequence
+
+def run_with_deadline(func, seconds=5):
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(value=func()), daemon=True)
+    thread.start()
+    thread.join(seconds)
+    assert not thread.is_alive(), 'timed out waiting for the writer connection'
+    return result['value']
+
+def test_reserve_sequence_after_flush_joins_the_session():
+    def reserve_after_flush():
+        with app.app_context():
+            before = get_version('tuning_sequence')
+            db.session.add(VersionStamp(name='tuning_flushed', version=1))
+            db.session.flush()
+            first = reserve_sequence('tuning_sequence', 5)
+            db.session.rollback()
+            # Joined the rolled-back transaction, so the counter is back where it was
+            return before, first, get_version('tuning_sequence')
+    before, first, after = run_with_deadline(reserve_after_flush)
+    assert first == before + 1
+    assert after == before
+
+def test_reserve_sequence_without_writes_commits_on_its_own():
+    with app.app_context():
+        before = get_version('tuning_sequence')
+        first = reserve_sequence('tuning_sequence', 3)
+        db.session.rollback()
+        assert first == before + 1
+        assert get_version('tuning_sequence') == before + 3
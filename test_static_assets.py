@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Static assets: url_for('static') returns fingerprinted URLs that are served
+immutable, with the precompressed variant the client accepts.
+"""
+
+import gzip
+import os
+import pytest
+
+from flask import url_for
+from app import app
+
+if 'static_assets' not in app.extensions:
+    pytest.skip('static fingerprinting is disabled', allow_module_level=True)
+
+def asset_url(filename):
+    with app.test_request_context():
+        return url_for('static', filename=filename)
+
+def test_url_for_static_is_fingerprinted():
+    manifest = app.extensions['static_assets']
+    url = asset_url('js/dashboard.js')
+    assert url == f"/static/js/dashboard.{manifest.assets['js/dashboard.js'].digest}.js"
+
+def test_fingerprinted_asset_is_immutable_and_precompressed():
+    client = app.test_client()
+    url = asset_url('js/dashboard.js')
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'Accept-Encoding' in response.headers['Vary']
+    with open(os.path.join(app.static_folder, 'js', 'dashboard.js'), 'rb') as f:
+        assert gzip.decompress(response.data) == f.read()
+
+    identity = client.get(url, headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in identity.headers
+    assert identity.headers['ETag'] != response.headers['ETag']
+    identity.close()
+
+    revalidated = client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
+
+def test_plain_static_path_still_served():
+    response = app.test_client().get('/static/js/dashboard.js')
+    assert response.status_code == 200
+    assert 'immutable' not in response.headers.get('Cache-Control', '')
+    response.close()
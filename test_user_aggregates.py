@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+User quiz aggregates stay in step with quiz_attempt and can be repaired.
+"""
+
+
+from datetime import datetime
+
+from app import db
+from ml_models import model_manager
+from models import QuizAttempt, User
+from quiz_generator import quiz_generator
+from sql_profiler import query_budget
+from user_aggregates import check, rebuild
+from user_cache import user_cache
+
+def make_quiz(difficulty_level):
+    questions = [{'id': i, 'question_text': f'Q{i}', 'options': [], 'correct_answer': 'A', 'subject': 'AI'}
+                 for i in range(4)]
+    return {'difficulty_level': difficulty_level, 'questions': questions}
+
+def test_evaluate_quiz_updates_aggregates(user):
+    quiz_generator.evaluate_quiz(user, make_quiz('beginner'), ['A', 'A', 'B', 'B'], 30)
+    quiz_generator.evaluate_quiz(user, make_quiz('advanced'), ['A', 'A', 'A', 'B'], 50)
+    assert user.get_total_attempts() == 2
+    assert user.best_score == 75.0
+    assert user.last_difficulty == 'advanced'
+    assert user.time_spent_sum == 80
+    with query_budget(0, 'average score'):
+        assert user.get_average_score() == 62.5
+    with db.engine.begin() as conn:
+        assert check(conn, [user.id]) == []
+
+def test_check_finds_and_rebuild_repairs_drift(user):
+    quiz_generator.evaluate_quiz(user, make_quiz('beginner'), ['A', 'A', 'A', 'A'], 20)
+    with db.engine.begin() as conn:
+        conn.execute(User.__table__.update().where(User.__table__.c.id == user.id).values(attempt_count=7))
+        assert check(conn, [user.id]) == [(user.id, {'attempt_count': (7, 1)})]
+        rebuild(conn, user_ids=[user.id])
+        assert check(conn, [user.id]) == []
+
+def test_cached_user_reads_aggregates_written_by_another_worker(app, client, user, monkeypatch):
+    monkeypatch.setattr(model_manager, 'predict_score_with_source',
+                        lambda user, difficulty_level='intermediate': (model_manager.get_default_predictions(user), False))
+    user_id = user.id
+    for _ in range(2):
+        with app.app_context():  # a fresh session per request, as when served
+            assert client.get('/dashboard/panel/predictions').status_code == 200
+    assert user_cache.get(user_id) is not None
+    # Another worker records an attempt: nothing in this process evicts the cached user
+    with db.engine.begin() as conn:
+        conn.execute(QuizAttempt.__table__.insert().values(
+            user_id=user_id, questions='[]', answers='[]', score=90.0, time_spent=60,
+            difficulty_level='beginner', created_at=datetime.utcnow()))
+        conn.execute(User.__table__.update().where(User.__table__.c.id == user_id).values(
+            attempt_count=1, score_sum=90.0, time_spent_sum=60, best_score=90.0,
+            last_attempt_at=datetime.utcnow(), last_difficulty='beginner'))
+    with app.app_context():
+        html = client.get('/dashboard/panel/predictions').get_data(as_text=True)
+    assert user_cache.get(user_id) is not None
+    assert '"random_forest": 92.0' in html and '"xgboost": 89.0' in html
@@ -0,0 +1,119 @@
+"""
+Per-user quiz aggregates stored on User (attempt_count, score_sum,
+time_spent_sum, best_score, last_attempt_at, last_difficulty).
+
+record_attempt() bumps them with a single UPDATE in the same transaction that
+inserts the QuizAttempt, so concurrent submissions cannot lose an increment.
+rebuild() recomputes them from quiz_attempt, and check() lists the users
+whose stored values have drifted.
+
+Usage:
+    python user_aggregates.py            # report drifted users (exit 1 if any)
+    python user_aggregates.py --repair   # rebuild the drifted users' counters
+"""
+
+import argparse
+import sys
+from sqlalchemy import case, func, select, update
+
+AGGREGATE_COLUMNS = ('attempt_count', 'score_sum', 'time_spent_sum', 'best_score',
+                     'last_attempt_at', 'last_difficulty')
+
+def record_attempt(session, user_id, score, time_spent, difficulty_level, attempted_at):
+    """Add one attempt to the user's aggregates (call before committing the attempt)"""
+    from models import User
+    session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(attempt_count=func.coalesce(User.attempt_count, 0) + 1,
+                score_sum=func.coalesce(User.score_sum, 0.0) + score,
+                time_spent_sum=func.coalesce(User.time_spent_sum, 0) + time_spent,
+                best_score=case((User.best_score.is_(None), score),
+                                (User.best_score < score, score),
+                                else_=User.best_score),
+                last_attempt_at=attempted_at,
+                last_difficulty=difficulty_level)
+        .execution_options(synchronize_session=False))
+
+def _aggregates_from_attempts():
+    """Column -> correlated subquery computing it from quiz_attempt"""
+    from models import User, QuizAttempt
+    attempts = QuizAttempt.__table__
+
+    def per_user(expression):
+        return select(expression).where(attempts.c.user_id == User.__table__.c.id).scalar_subquery()
+
+    return {
+        'attempt_count': per_user(func.count(attempts.c.id)),
+        'score_sum': per_user(func.coalesce(func.sum(attempts.c.score), 0.0)),
+        'time_spent_sum': per_user(func.coalesce(func.sum(attempts.c.time_spent), 0)),
+        'best_score': per_user(func.max(attempts.c.score)),
+        'last_attempt_at': per_user(func.max(attempts.c.created_at)),
+        'last_difficulty': (select(attempts.c.difficulty_level)
+                            .where(attempts.c.user_id == User.__table__.c.id)
+                            .order_by(attempts.c.created_at.desc(), attempts.c.id.desc())
+                            .limit(1).scalar_subquery()),
+    }
+
+def rebuild(conn, user_ids=None, min_user_id=None):
+    """Recompute the aggregates from quiz_attempt (all users, a list of ids, or ids >= min_user_id)"""
+    from models import User
+    users = User.__table__
+    statement = update(users).values(**_aggregates_from_attempts())
+    if user_ids is not None:
+        statement = statement.where(users.c.id.in_(list(user_ids)))
+    if min_user_id is not None:
+        statement = statement.where(users.c.id >= min_user_id)
+    return conn.execute(statement).rowcount
+
+def _differs(stored, actual):
+    if isinstance(actual, float) or isinstance(stored, float):
+        return abs((stored or 0.0) - (actual or 0.0)) > 1e-6
+    return stored != actual
+
+def check(conn, user_ids=None):
+    """[(user_id, {column: (stored, actual)})] for every user (or every one of user_ids) whose aggregates are wrong"""
+    from models import User
+    users = User.__table__
+    actual = _aggregates_from_attempts()
+    statement = select(users.c.id, *[users.c[name] for name in AGGREGATE_COLUMNS],
+                       *[actual[name].label(f'actual_{name}') for name in AGGREGATE_COLUMNS])
+    if user_ids is not None:
+        statement = statement.where(users.c.id.in_(list(user_ids)))
+    drifted = []
+    for row in conn.execute(statement).mappings():
+        diffs = {}
+        for name in AGGREGATE_COLUMNS:
+            stored, expected = row[name], row[f'actual_{name}']
+            if name in ('attempt_count', 'time_spent_sum', 'score_sum') and expected is None:
+                expected = 0
+            if _differs(stored, expected):
+                diffs[name] = (stored, expected)
+        if diffs:
+            drifted.append((row['id'], diffs))
+    return drifted
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Verify (and repair) the per-user quiz aggregates')
+    parser.add_argument('--repair', action='store_true', help='rebuild the counters of drifted users')
+    parser.add_argument('--show', type=int, default=20, help='drifted users to print (default 20)')
+    args = parser.parse_args()
+
+    from app import app, db
+    from sqlite_tuning import writer_connection
+    with app.app_context():
+        with writer_connection(db) as conn:
+            drifted = check(conn)
+            for user_id, diffs in drifted[:args.show]:
+                details = ', '.join(f'{name} {stored!r} != {actual!r}' for name, (stored, actual) in diffs.items())
+                print(f'user {user_id}: {details}')
+            if not drifted:
+                print('✅ All user aggregates match quiz_attempt')
+            elif args.repair:
+                user_ids = [user_id for user_id, _ in drifted]
+                repaired = sum(rebuild(conn, user_ids=user_ids[start:start + 500])
+                               for start in range(0, len(user_ids), 500))
+                print(f'✅ Repaired aggregates for {repaired} users')
+            else:
+                print(f'❌ {len(drifted)} users have drifted aggregates (run with --repair)')
+                sys.exit(1)
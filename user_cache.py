@@ -0,0 +1,133 @@
+"""
+Short-TTL cache of authenticated users for Flask-Login's user_loader.
+
+Only column values are cached. load_user() turns them back into a User that
+is attached to the request's session without a SELECT (merge with
+load=False), so current_user attributes cost no queries and relationships
+still lazy-load normally. The quiz aggregates (user_aggregates.py) are left
+out: they change with every submission, in whichever worker handles it, and
+the dashboard panels are keyed on the latest attempt. They stay expired on
+the cached User and load with one SELECT the first time they are read.
+
+Any flush or ORM UPDATE/DELETE touching a user (profile or password change)
+evicts that user; bulk statements without a user id clear
+the cache. Each worker process has its own cache, so a change made in
+another worker shows up after at most USER_CACHE_TTL seconds (default 30,
+0 disables the cache).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.sql import operators
+from sqlalchemy.orm import make_transient_to_detached
+from metrics import metrics
+
+class UserCache:
+    def __init__(self, ttl=30.0, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # user_id -> (expires_at, column values)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id, values):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+user_cache = UserCache(ttl=float(os.environ.get('USER_CACHE_TTL', 30)))
+
+def _column_values(user):
+    from user_aggregates import AGGREGATE_COLUMNS
+    return {attr.key: getattr(user, attr.key) for attr in user.__mapper__.column_attrs
+            if attr.key not in AGGREGATE_COLUMNS}
+
+def load_user(session, user_id):
+    """The User with this id attached to `session`, from the cache when possible"""
+    from models import User
+    values = user_cache.get(user_id)
+    if values is not None:
+        user = User(**values)
+        make_transient_to_detached(user)
+        return session.merge(user, load=False)
+    user = session.get(User, user_id)
+    if user is not None:
+        user_cache.put(user_id, _column_values(user))
+    return user
+
+def _invalidate_flushed_users(session, flush_context):
+    from models import User
+    user_ids = {obj.id for obj in list(session.dirty) + list(session.deleted)
+                if isinstance(obj, User) and obj.id is not None}
+    for user_id in user_ids:
+        user_cache.invalidate(user_id)
+    # Evict again on commit: a request may have refilled the cache from the pre-commit row
+    session.info.setdefault('user_cache_evict', set()).update(user_ids)
+
+def _invalidate_on_commit(session):
+    for user_id in session.info.pop('user_cache_evict', ()):
+        user_cache.invalidate(user_id)
+
+def _single_user_id(statement, table):
+    """The id of `WHERE user.id = <value>` statements, else None"""
+    where = statement.whereclause
+    if getattr(where, 'operator', None) is not operators.eq:
+        return None
+    column, value = where.left, where.right
+    if getattr(column, 'table', None) is not table or getattr(column, 'key', None) != 'id':
+        return None
+    return getattr(value, 'value', None)
+
+def _invalidate_bulk_statements(orm_execute_state):
+    from models import User
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    # update(User) targets an annotated copy of the table, so compare by name
+    if getattr(orm_execute_state.statement.table, 'name', None) != User.__tablename__:
+        return
+    user_id = _single_user_id(orm_execute_state.statement, User.__table__)
+    if user_id is None:
+        user_cache.clear()
+        return
+    user_cache.invalidate(user_id)
+    orm_execute_state.session.info.setdefault('user_cache_evict', set()).add(user_id)
+
+def init_app(db):
+    """Evict cached users whenever the session writes to them"""
+    session_class = db.session.session_factory.class_
+    event.listen(session_class, 'after_flush', _invalidate_flushed_users)
+    event.listen(session_class, 'after_commit', _invalidate_on_commit)
+    event.listen(session_class, 'do_orm_execute', _invalidate_bulk_statements)
+
+def _user_cache_metrics():
+    yield 'cache_requests_total', {'cache': 'user_loader', 'result': 'hit'}, user_cache.hits
+    yield 'cache_requests_total', {'cache': 'user_loader', 'result': 'miss'}, user_cache.misses
+
+metrics.register_collector(_user_cache_metrics)
@@ -0,0 +1,85 @@
+from datetime import datetime
+from sqlalchemy import insert, select, text
+from models import AppSetting, QuizAttempt, VersionStamp
+from app import db
+from sqlite_tuning import writer_connection
+
+CONTENT_CATALOG = 'content_catalog'
+
+
+def get_version(name):
+    """Return the current version number for a stamp (0 if never bumped)"""
+    version = db.session.execute(
+        select(VersionStamp.version).where(VersionStamp.name == name)
+    ).scalar()
+    return version or 0
+
+
+def get_stamp(name):
+    """Return (version, updated_at) for a stamp"""
+    row = db.session.execute(
+        select(VersionStamp.version, VersionStamp.updated_at).where(VersionStamp.name == name)
+    ).first()
+    return (row.version, row.updated_at) if row else (0, None)
+
+
+def get_last_attempt_stamp(user_id):
+    """Return (attempt id, created_at) of the user's latest quiz attempt"""
+    row = db.session.execute(
+        select(QuizAttempt.id, QuizAttempt.created_at)
+        .where(QuizAttempt.user_id == user_id)
+        .order_by(QuizAttempt.id.desc())
+        .limit(1)
+    ).first()
+    return (row.id, row.created_at) if row else (0, None)
+
+
+def bump_version(name, connection=None, by=1):
+    """Increment a stamp inside the caller's transaction"""
+    conn = connection if connection is not None else db.session.connection()
+    now = datetime.utcnow()
+    result = conn.execute(
+        text("UPDATE version_stamp SET version = version + :by, updated_at = :now WHERE name = :name"),
+        {'name': name, 'now': now, 'by': by}
+    )
+    if result.rowcount == 0:
+        conn.execute(
+            text("INSERT INTO version_stamp (name, version, updated_at) VALUES (:name, :by, :now)"),
+            {'name': name, 'now': now, 'by': by}
+        )
+
+
+def reserve_sequence(name, count):
+    """Atomically reserve `count` consecutive numbers; returns the first one (1-based).
+
+    Runs in its own short transaction, unless the caller's session has
+    already written in its open transaction: then the reservation joins that
+    transaction (see sqlite_tuning.writer_connection) and commits with it.
+    """
+    with writer_connection(db) as conn:
+        bump_version(name, conn, by=count)
+        last = conn.execute(
+            select(VersionStamp.version).where(VersionStamp.name == name)
+        ).scalar()
+    return last - count + 1
+
+
+def get_or_create_setting(name, make_value):
+    """The stored value of a setting; the first caller stores make_value() and every process then shares it"""
+    value = db.session.execute(select(AppSetting.value).where(AppSetting.name == name)).scalar()
+    if value is not None:
+        return value
+    try:
+        with writer_connection(db) as conn:
+            value = conn.execute(select(AppSetting.value).where(AppSetting.name == name)).scalar()
+            if value is None:
+                value = make_value()
+                conn.execute(insert(AppSetting.__table__).values(name=name, value=value,
+                                                                 created_at=datetime.utcnow()))
+    except Exception:
+        # Another process stored it first; use theirs
+        db.session.rollback()
+        value = db.session.execute(select(AppSetting.value).where(AppSetting.name == name)).scalar()
+        if value is None:
+            raise
+    return value